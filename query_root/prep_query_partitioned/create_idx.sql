@@ -0,0 +1,49 @@
+-- REFERENCE: https://github.com/tvondra/pg_tpch
+-- Keys of partitioned tables must include the partition key, and there is no foreign key
+-- from LINEITEM to ORDERS, as O_ORDERKEY alone cannot be unique; refresh function 2 deletes from both.
+-- Keys and indexes defined here are created on every partition.
+
+
+-- Primary Keys
+
+ALTER TABLE PART ADD PRIMARY KEY (P_PARTKEY);
+ALTER TABLE SUPPLIER ADD PRIMARY KEY (S_SUPPKEY);
+ALTER TABLE PARTSUPP ADD PRIMARY KEY (PS_PARTKEY, PS_SUPPKEY);
+ALTER TABLE CUSTOMER ADD PRIMARY KEY (C_CUSTKEY);
+ALTER TABLE ORDERS ADD PRIMARY KEY (O_ORDERKEY, O_ORDERDATE);
+ALTER TABLE LINEITEM ADD PRIMARY KEY (L_ORDERKEY, L_LINENUMBER, L_SHIPDATE);
+ALTER TABLE NATION ADD PRIMARY KEY (N_NATIONKEY);
+ALTER TABLE REGION ADD PRIMARY KEY (R_REGIONKEY);
+
+
+-- Foreign Keys
+
+ALTER TABLE SUPPLIER ADD FOREIGN KEY (S_NATIONKEY) REFERENCES NATION(N_NATIONKEY);
+
+ALTER TABLE PARTSUPP ADD FOREIGN KEY (PS_PARTKEY) REFERENCES PART(P_PARTKEY);
+ALTER TABLE PARTSUPP ADD FOREIGN KEY (PS_SUPPKEY) REFERENCES SUPPLIER(S_SUPPKEY);
+
+ALTER TABLE CUSTOMER ADD FOREIGN KEY (C_NATIONKEY) REFERENCES NATION(N_NATIONKEY);
+
+ALTER TABLE ORDERS ADD FOREIGN KEY (O_CUSTKEY) REFERENCES CUSTOMER(C_CUSTKEY);
+
+ALTER TABLE LINEITEM ADD FOREIGN KEY (L_PARTKEY,L_SUPPKEY) REFERENCES PARTSUPP(PS_PARTKEY,PS_SUPPKEY);
+
+ALTER TABLE NATION ADD FOREIGN KEY (N_REGIONKEY) REFERENCES REGION(R_REGIONKEY);
+
+
+-- Indexes on Foreign Keys
+
+CREATE INDEX IDX_SUPPLIER_NATION_KEY ON SUPPLIER (S_NATIONKEY);
+
+CREATE INDEX IDX_PARTSUPP_PARTKEY ON PARTSUPP (PS_PARTKEY);
+CREATE INDEX IDX_PARTSUPP_SUPPKEY ON PARTSUPP (PS_SUPPKEY);
+
+CREATE INDEX IDX_CUSTOMER_NATIONKEY ON CUSTOMER (C_NATIONKEY);
+
+CREATE INDEX IDX_ORDERS_CUSTKEY ON ORDERS (O_CUSTKEY);
+
+CREATE INDEX IDX_LINEITEM_ORDERKEY ON LINEITEM (L_ORDERKEY);
+CREATE INDEX IDX_LINEITEM_PART_SUPP ON LINEITEM (L_PARTKEY,L_SUPPKEY);
+
+CREATE INDEX IDX_NATION_REGIONKEY ON NATION (N_REGIONKEY);
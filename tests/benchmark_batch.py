@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the round trips saved by batched statement execution, see postgresqldb.PGDB.executeBatch()
+
+Inserts the same rows into a temporary table one statement per row, in batches of statements and as
+multi-row VALUES, first over a direct connection, then through a local proxy delaying all traffic
+to simulate a high-latency link. Needs a running PostgreSQL instance, e.g.
+
+    cd tests && PYTHONPATH=.. python benchmark_batch.py --dbname tpchdb --username tpch --password hello123
+"""
+
+import argparse
+import heapq
+import socket
+import threading
+import time
+
+from tpch4pgsql import postgresqldb as pgdb
+
+
+class LatencyProxy:
+    """TCP proxy on localhost forwarding to a server, delaying every chunk of data by a fixed time
+    in each direction while keeping the order of the chunks
+
+    """
+    def __init__(self, host, port, delay):
+        self.__target__ = (host, port)
+        self.__delay__ = delay
+        self.__server__ = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.__server__.bind(("127.0.0.1", 0))
+        self.__server__.listen(8)
+        self.port = self.__server__.getsockname()[1]
+        threading.Thread(target=self.__accept__, daemon=True).start()
+
+    def __accept__(self):
+        while True:
+            client, address = self.__server__.accept()
+            upstream = socket.create_connection(self.__target__)
+            for src, dst in ((client, upstream), (upstream, client)):
+                self.__start_forwarding__(src, dst)
+
+    def __start_forwarding__(self, src, dst):
+        pending = []  # heap of (due time, sequence number, data)
+        condition = threading.Condition()
+
+        def receive():
+            seq = 0
+            while True:
+                try:
+                    data = src.recv(65536)
+                except OSError:
+                    data = b""
+                with condition:
+                    heapq.heappush(pending, (time.monotonic() + self.__delay__, seq, data))
+                    condition.notify()
+                seq += 1
+                if not data:
+                    return
+
+        def send():
+            while True:
+                with condition:
+                    while not pending or pending[0][0] > time.monotonic():
+                        condition.wait(pending[0][0] - time.monotonic() if pending else None)
+                    due, seq, data = heapq.heappop(pending)
+                try:
+                    if not data:
+                        dst.shutdown(socket.SHUT_WR)
+                        return
+                    dst.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=receive, daemon=True).start()
+        threading.Thread(target=send, daemon=True).start()
+
+    def close(self):
+        self.__server__.close()
+
+
+def run_variant(conn, name, rows, batch_size):
+    conn.executeQuery("TRUNCATE batch_benchmark")
+    conn.commit()
+    round_trips = conn.roundTrips()
+    start = time.perf_counter()
+    if name == "row by row":
+        for row in rows:
+            conn.executeQuery("INSERT INTO batch_benchmark VALUES (%s, %s)", row)
+    elif name == "batch":
+        conn.executeBatch("INSERT INTO batch_benchmark VALUES (%s, %s)", rows, page_size=batch_size)
+    else:
+        conn.executeBatch("INSERT INTO batch_benchmark VALUES %s", rows, page_size=batch_size, values=True)
+    conn.commit()
+    return time.perf_counter() - start, conn.roundTrips() - round_trips
+
+
+def run_benchmark(host, port, database, user, password, label, num_rows, batch_size):
+    conn = pgdb.PGDB(host, port, database, user, password)
+    try:
+        conn.executeQuery("CREATE TEMPORARY TABLE batch_benchmark (id INTEGER, name TEXT)")
+        rows = [(i, "row %s" % i) for i in range(num_rows)]
+        for name in ("row by row", "batch", "multi-row values"):
+            seconds, round_trips = run_variant(conn, name, rows, batch_size)
+            print("%-20s %-18s %8s round trips %9.3f s %10.0f rows/s" %
+                  (label, name, round_trips, seconds, num_rows / seconds if seconds else 0))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of batched statement execution")
+    parser.add_argument("-H", "--host", default="localhost")
+    parser.add_argument("-p", "--port", type=int, default=5432)
+    parser.add_argument("-U", "--username", default="postgres")
+    parser.add_argument("-W", "--password", default="test123")
+    parser.add_argument("-d", "--dbname", default="tpch")
+    parser.add_argument("--rows", type=int, default=2000, help="Number of rows inserted by every variant")
+    parser.add_argument("--batch-size", type=int, default=pgdb.DEFAULT_BATCH_SIZE,
+                        help="Number of rows per round trip of the batched variants")
+    parser.add_argument("--latency", type=float, default=2.0,
+                        help="Delay in ms added in each direction by the proxy of the high-latency run")
+    args = parser.parse_args()
+
+    run_benchmark(args.host, args.port, args.dbname, args.username, args.password, "direct",
+                  args.rows, args.batch_size)
+    proxy = LatencyProxy(args.host, args.port, args.latency / 1000)
+    try:
+        run_benchmark("127.0.0.1", proxy.port, args.dbname, args.username, args.password,
+                      "+%s ms per direction" % args.latency, args.rows, args.batch_size)
+    finally:
+        proxy.close()
@@ -8,7 +8,7 @@ import os
 class TestPrepareAfter(unittest.TestCase, TestCommon):
 
     def test_folders_do_exist_now(self):
-        folders = ["data", os.path.join("query_root", "perf_query_gen")]
+        folders = ["data", "query_root"]
         for folder in folders:
             folder_path = os.path.join(self.ROOT_DIR, folder)
             self.check_dir(folder_path)
@@ -40,9 +40,13 @@ class TestPrepareAfter(unittest.TestCase, TestCommon):
                 subfolder = "perf_query_gen"
                 subfolder_path = os.path.join(folder_path, subfolder)
                 self.check_dir(subfolder_path)
-                for i in self.QUERY_NR_RANGE:
-                    filename = os.path.join(subfolder_path, "%s.sql" % i)
-                    self.check_file(filename)
+                # one query set per stream, stream 0 being the power test
+                for stream in range(self.NUM_STREAMS + 1):
+                    stream_path = os.path.join(subfolder_path, "stream_%s" % stream)
+                    self.check_dir(stream_path)
+                    for i in range(1, 23):
+                        filename = os.path.join(stream_path, "%s.sql" % i)
+                        self.check_file(filename, check_if_not_empty=True)
 
 
 if __name__ == '__main__':
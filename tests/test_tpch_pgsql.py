@@ -3,10 +3,37 @@
 import unittest
 
 import os
+import json
+import math
+import datetime
 import mock
+import asyncio
+import functools
+import struct
+import tempfile
+import time
+import argparse
+
+from psycopg2 import sql
 
 import tpch_pgsql as bm
-from tpch4pgsql import query
+from tpch4pgsql import asyncdb, load, query, prepare, transform, pgcopy, schema, postgresqldb, executor, plan, result, \
+    stats, sweep, openloop, soak, warehouse
+
+
+def run_test_stream(failing, stream, barrier):
+    # stream function for test_executors, module level to be usable by a separate process
+    if stream == failing:
+        raise RuntimeError("stream failed")
+    barrier.wait(10)
+    return stream * 10
+
+
+async def run_test_stream_async(failing, stream, gate):
+    if stream == failing:
+        raise RuntimeError("stream failed")
+    await gate.wait(10)
+    return stream * 10
 
 
 class TestBenchmark(unittest.TestCase):
@@ -88,6 +115,7 @@ class TestBenchmark(unittest.TestCase):
                                     ['power2.json', 'power2.txt'], ['throughput2.json'],
                                     ['power3a.txt'], ['throughput.txt'],
                                     [], []]
+        self.addCleanup(mock.patch.stopall)
         mock_isdir = mock.patch('os.path.isdir').start()
         mock_isdir.side_effect = self.mock_path_isdir_side_effect
         mock_exists = mock.patch('os.path.exists').start()
@@ -102,6 +130,622 @@ class TestBenchmark(unittest.TestCase):
         self.assertEqual(expected, files,
                          "Some json files were not found, others were included, but are not json files!")
 
+    def test_positive_int(self):
+        self.assertEqual(bm.positive_int("100"), 100)
+        self.assertRaises(argparse.ArgumentTypeError, bm.positive_int, "0")
+        self.assertRaises(ValueError, bm.positive_int, "x")
+
+    def test_merge_chunks(self):
+        with tempfile.TemporaryDirectory() as dbgen_dir, tempfile.TemporaryDirectory() as data_dir:
+            tables = [t for ts in list(prepare.DBGEN_CHUNKED_TABLES.values()) +
+                      list(prepare.DBGEN_SINGLE_TABLES.values()) for t in ts]
+            for table in tables:
+                if table in ('nation', 'region'):
+                    with open(os.path.join(dbgen_dir, "%s.tbl" % table), 'w') as f:
+                        f.write("0|%s|\n" % table)
+                else:
+                    for step in (1, 2):
+                        with open(os.path.join(dbgen_dir, "%s.tbl.%s" % (table, step)), 'w') as f:
+                            f.write("%s|%s|\n" % (step, table))
+            self.assertEqual(prepare.merge_chunks(data_dir, dbgen_dir, 2, ".csv"), 0)
+            self.assertEqual(os.listdir(dbgen_dir), [], "Chunks were not removed after merging!")
+            with open(os.path.join(data_dir, "lineitem.tbl.csv")) as f:
+                self.assertEqual(f.read(), "1|lineitem\n2|lineitem\n")
+            with open(os.path.join(data_dir, "region.tbl.csv")) as f:
+                self.assertEqual(f.read(), "0|region\n")
+        with tempfile.TemporaryDirectory() as dbgen_dir, tempfile.TemporaryDirectory() as data_dir:
+            for table in tables:
+                with open(os.path.join(dbgen_dir, "%s.tbl" % table), 'w') as f:
+                    f.write("0|%s|\n" % table)
+            self.assertEqual(prepare.merge_chunks(data_dir, dbgen_dir, 1, ".csv"), 0)
+            with open(os.path.join(data_dir, "lineitem.tbl.csv")) as f:
+                self.assertEqual(f.read(), "0|lineitem\n")
+
+    def test_strip_blocks(self):
+        data = b"1|a|\n2||\n3|c|"
+        expected = b"1|a\n2|\n3|c"
+        for block_size in range(1, len(data) + 1):
+            blocks = [data[i:i + block_size] for i in range(0, len(data), block_size)]
+            self.assertEqual(b"".join(transform.strip_blocks(blocks)), expected,
+                             "Wrong result for block size %s" % block_size)
+
+    def test_transform_file(self):
+        data = b"".join(b"%d|name %d|%d.00|\n" % (i, i, i) for i in range(1000))
+        expected = data.replace(b"|\n", b"\n")
+        for in_place in (True, False):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                in_fname = os.path.join(tmp_dir, "part.tbl")
+                out_fname = os.path.join(tmp_dir, "part.tbl.csv")
+                with open(in_fname, 'wb') as f:
+                    f.write(data)
+                size = transform.transform_file([in_fname], out_fname, in_place, block_size=100)
+                self.assertEqual(size, len(data))
+                self.assertFalse(os.path.exists(in_fname))
+                with open(out_fname, 'rb') as f:
+                    self.assertEqual(f.read(), expected)
+
+    def test_compressed_data_file(self):
+        data = b"".join(b"%d|name %d|%d.00|\n" % (i, i, i) for i in range(10000))
+        expected = data.replace(b"|\n", b"\n")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            in_fname = os.path.join(tmp_dir, "orders.tbl.u1")
+            out_fname = os.path.join(tmp_dir, "orders.tbl.u1.csv")
+            with open(in_fname, 'wb') as f:
+                f.write(data)
+            transform.transform_file([in_fname], out_fname, compression="gzip")
+            self.assertEqual(transform.find_data_file(out_fname), (out_fname + ".gz", "gzip"))
+            with transform.DecompressingReader(out_fname + ".gz", "gzip", block_size=1000) as reader:
+                self.assertEqual(reader.read(), expected)
+                self.assertEqual(reader.size, len(expected))
+            with transform.open_data_file(out_fname) as f:
+                self.assertEqual(f.readline(), "0|name 0|0.00\n")
+
+    def test_split_file(self):
+        data = b"".join(b"%d|%s\n" % (i, b"x" * (i % 7)) for i in range(500))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fname = os.path.join(tmp_dir, "lineitem.tbl.csv")
+            with open(fname, 'wb') as f:
+                f.write(data)
+            for num_chunks in (1, 2, 3, 8, 1000):
+                ranges = transform.split_file(fname, num_chunks)
+                self.assertLessEqual(len(ranges), num_chunks)
+                chunks = []
+                for start, end in ranges:
+                    with transform.RangeReader(fname, start, end) as reader:
+                        chunks.append(reader.read())
+                self.assertEqual(b"".join(chunks), data)
+                for chunk in chunks:
+                    self.assertTrue(chunk.endswith(b"\n"), "Chunk does not end at a line boundary!")
+
+    def test_encode_numeric(self):
+        testdata = [
+            {"input": b"0.04", "expected": (1, -1, 0x0000, 2, [400])},
+            {"input": b"-1234.56", "expected": (2, 0, 0x4000, 2, [1234, 5600])},
+            {"input": b"100000.50", "expected": (3, 1, 0x0000, 2, [10, 0, 5000])},
+            {"input": b"0.00", "expected": (0, 0, 0x0000, 2, [])},
+            {"input": b"901", "expected": (1, 0, 0x0000, 0, [901])},
+        ]
+        for td in testdata:
+            encoded = pgcopy.encode_numeric(td["input"])
+            ndigits, weight, sign, dscale, digits = td["expected"]
+            self.assertEqual(struct.unpack("!i", encoded[:4])[0], len(encoded) - 4)
+            self.assertEqual(struct.unpack("!hhhh", encoded[4:12]), (ndigits, weight, sign, dscale))
+            self.assertEqual(list(struct.unpack("!%dh" % ndigits, encoded[12:])), digits)
+
+    def test_binary_copy_reader(self):
+        data = b"1|0.04|1998-12-01|AIR\n2|-1.50|1992-01-01|\n"
+        with transform.BlockReader([data[:10], data[10:]]) as in_file:
+            stream = pgcopy.BinaryCopyReader(in_file, ["int4", "numeric", "date", "text"]).read()
+        self.assertTrue(stream.startswith(pgcopy.HEADER))
+        self.assertTrue(stream.endswith(pgcopy.TRAILER))
+        rows = stream[len(pgcopy.HEADER):-len(pgcopy.TRAILER)]
+        self.assertEqual(rows[:10], struct.pack("!hii", 4, 4, 1))
+        self.assertEqual(rows.count(struct.pack("!i", 3) + b"AIR"), 1)
+        self.assertTrue(rows.endswith(pgcopy.encode_date(b"1992-01-01") + struct.pack("!i", 0)),
+                        "Empty text should be encoded with length 0")
+
+    def test_index_graph(self):
+        sql = """-- Primary Keys
+            ALTER TABLE ORDERS ADD PRIMARY KEY (O_ORDERKEY);
+            ALTER TABLE LINEITEM ADD PRIMARY KEY (L_ORDERKEY, L_LINENUMBER);
+            ALTER TABLE LINEITEM ADD FOREIGN KEY (L_ORDERKEY) REFERENCES ORDERS(O_ORDERKEY) ON DELETE CASCADE;
+            CREATE INDEX IDX_LINEITEM_ORDERKEY ON LINEITEM (L_ORDERKEY);
+            ANALYZE;
+            CREATE INDEX IDX_ORDERS_CUSTKEY ON ORDERS (O_CUSTKEY);"""
+        nodes = schema.index_graph(schema.split_statements(sql))
+        depends = dict((n["name"], sorted(n["depends"])) for n in nodes)
+        self.assertEqual(depends, {
+            "pk_orders": [],
+            "pk_lineitem": [],
+            "fk_lineitem_orders": ["pk_lineitem", "pk_orders"],
+            "idx_lineitem_orderkey": ["pk_lineitem"],
+            "statement_5": ["fk_lineitem_orders", "idx_lineitem_orderkey", "pk_lineitem", "pk_orders"],
+            "idx_orders_custkey": ["pk_orders", "statement_5"]})
+
+    def test_create_table_statements(self):
+        sql = """CREATE TABLE PART (P_PARTKEY SERIAL);
+            create table nation (N_NATIONKEY INTEGER);"""
+        statements = schema.split_statements(schema.unlogged(sql))
+        self.assertEqual(schema.create_table_statements(statements), {
+            "PART": ["CREATE UNLOGGED TABLE PART (P_PARTKEY SERIAL)"],
+            "NATION": ["CREATE UNLOGGED TABLE nation (N_NATIONKEY INTEGER)"]})
+
+    def test_partition_statements(self):
+        query_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "query_root")
+        with open(os.path.join(query_root, "prep_query_partitioned", "create_tbl.sql")) as sql_file:
+            sql = sql_file.read()
+        self.assertEqual(schema.partitioned_tables(sql), [("ORDERS", "O_ORDERDATE"), ("LINEITEM", "L_SHIPDATE")])
+        statements = schema.partition_statements(sql, 7)
+        self.assertEqual(len(statements), 16)
+        self.assertEqual(statements[0], "CREATE TABLE ORDERS_P1 PARTITION OF ORDERS "
+                                        "FOR VALUES FROM ('1992-01-01') TO ('1993-01-01')")
+        self.assertEqual(statements[15], "CREATE TABLE LINEITEM_DEFAULT PARTITION OF LINEITEM DEFAULT")
+        self.assertEqual([d.isoformat() for d in schema.month_bounds(5)[1:3]], ["1993-05-01", "1994-10-01"])
+        # the partition clause does not change the columns
+        self.assertEqual(pgcopy.read_column_types(os.path.join(query_root, "prep_query_partitioned", "create_tbl.sql")),
+                         pgcopy.read_column_types(os.path.join(query_root, "prep_query", "create_tbl.sql")))
+
+    @mock.patch('tpch4pgsql.load.pgdb.PGDB')
+    def test_copy_database(self, mock_pgdb):
+        self.assertEqual(load.copy_database("h", 5432, "u", "p", "tpch", "tpch"), 1)
+        self.assertFalse(mock_pgdb.called, "Database was touched before copying it onto itself!")
+        mock_pgdb.return_value.serverVersion.return_value = 160000
+        self.assertEqual(load.copy_database("h", 5432, "u", "p", "tpch", "tpch-template"), 0)
+        calls = [c[0] for c in mock_pgdb.return_value.executeQuery.call_args_list]
+        self.assertEqual(calls[0][1], ("tpch", "tpch-template"))
+        self.assertIn(sql.Identifier("tpch-template"), calls[1][0].seq)
+        self.assertEqual(calls[2][0].seq[1:4], [sql.Identifier("tpch-template"), sql.SQL(" TEMPLATE "),
+                                                 sql.Identifier("tpch")])
+
+    @mock.patch('tpch4pgsql.postgresqldb.psycopg2.connect')
+    def test_connection_pool(self, mock_connect):
+        mock_connect.side_effect = lambda **kwargs: mock.MagicMock(
+            closed=0, get_transaction_status=mock.MagicMock(return_value=0))
+        pool = postgresqldb.PGPool("localhost", 5432, "tpch", "postgres", "test123", {"work_mem": "64MB"})
+        conn = pool.getConnection()
+        self.assertEqual(mock_connect.call_args[1]["options"], "-c work_mem=64MB")
+        conn.setSession({"enable_seqscan": "off"})
+        conn.close()
+        conn = pool.getConnection()
+        other = pool.getConnection()
+        conn.close()
+        other.close()
+        metrics = pool.getMetrics()
+        self.assertEqual(mock_connect.call_count, 2, "Idle connection was not reused!")
+        self.assertEqual((metrics["checkouts"], metrics["max_in_use"], metrics["in_use"]), (3, 2, 0))
+        # a connection dropped by the server while idle is replaced on checkout
+        conn = pool.getConnection()
+        dropped = conn.__connection__
+        conn.close()
+        dropped.cursor.return_value.__enter__.return_value.execute.side_effect = Exception("server closed")
+        conn = pool.getConnection()
+        self.assertIsNot(conn.__connection__, dropped)
+        self.assertEqual(pool.getMetrics()["discarded"], 1)
+        conn.close()
+
+    def test_power_test_closes_connection(self):
+        conn = mock.MagicMock()
+        with mock.patch.object(postgresqldb, "connect", return_value=conn), \
+                mock.patch.object(query, "QuerySet"), \
+                mock.patch.object(query, "run_refresh_func1", return_value=1):
+            self.assertEqual(query.run_power_test("q", "d", "u", "del", "g", "r", "h", 5432, "db", "u", "p", "run_1",
+                                                  2, False, False), 1)
+        self.assertTrue(conn.close.called, "Connection was not handed back after a failed refresh function!")
+
+    def test_refresh_func1_bulk(self):
+        with tempfile.TemporaryDirectory() as data_dir:
+            os.makedirs(os.path.join(data_dir, "update"))
+            with open(os.path.join(data_dir, "update", "orders.tbl.u1.csv"), 'w') as f:
+                f.write("1|2|O|3.00|1995-01-01|1-URGENT|Clerk#1|0|comment\n")
+            with open(os.path.join(data_dir, "update", "lineitem.tbl.u1.csv"), 'w') as f:
+                f.write("1|1|1|1|1.00|1.00|0.01|0.02|N|O|1995-02-01|1995-02-01|1995-02-01|NONE|AIR|a\n" * 2)
+            conn = mock.MagicMock()
+            result = mock.MagicMock()
+            self.assertEqual(query.refresh_func1_bulk(conn, data_dir, "update", 0, 2, False, result), 0)
+            queries = [c[0][0] for c in conn.executeQuery.call_args_list]
+            self.assertEqual(queries[-2:], ["INSERT INTO orders SELECT * FROM orders_stage",
+                                            "INSERT INTO lineitem SELECT * FROM lineitem_stage"])
+            self.assertEqual([c[1]["table"] for c in conn.copyFromStream.call_args_list],
+                             ["orders_stage", "lineitem_stage"])
+            conn.commit.assert_called_once_with()
+            self.assertEqual([c[0][0] for c in result.setMetric.call_args_list],
+                             ["refresh_stream_0_func_1_parse", "refresh_stream_0_func_1_transfer",
+                              "refresh_stream_0_func_1_apply"])
+
+    @mock.patch('tpch4pgsql.query.time.perf_counter')
+    def test_delete_in_list(self, mock_perf_counter):
+        # every statement pair takes 1 second, so the time per key goes down with larger batches
+        mock_perf_counter.side_effect = [float(t) for t in range(100)]
+        conn = mock.MagicMock()
+        keys = [str(k) for k in range(1000)]
+        self.assertEqual(query.delete_in_list(conn, keys, batch_size=100, max_batch_size=400), 4)
+        calls = [c[0] for c in conn.executeQuery.call_args_list]
+        sizes = [len(params[0]) for query, params in calls if query.startswith("DELETE FROM orders")]
+        self.assertEqual(sizes, [100, 200, 400, 300])
+        self.assertEqual(calls[0][0], "DELETE FROM lineitem WHERE L_ORDERKEY = ANY(%s)")
+        self.assertEqual(calls[0][1][0][:3], [0, 1, 2])
+        # the foreign key of the default schema profile deletes the line items
+        mock_perf_counter.side_effect = [float(t) for t in range(100)]
+        conn = mock.MagicMock()
+        self.assertEqual(query.delete_in_list(conn, keys, batch_size=100, max_batch_size=400, cascade=True), 4)
+        calls = [c[0][0] for c in conn.executeQuery.call_args_list]
+        self.assertEqual(calls, ["DELETE FROM orders WHERE O_ORDERKEY = ANY(%s)"] * 4)
+
+    def test_compare_refresh_func2(self):
+        with mock.patch.object(query, "refresh_func2", return_value=0) as in_list, \
+                mock.patch.object(query, "refresh_func2_staged", return_value=0) as staged:
+            self.assertEqual(query.compare_refresh_func2(None, "data", "delete", 1, 2, False, "in-list"), 0)
+            self.assertEqual(staged.call_count, 0)
+            res = mock.MagicMock()
+            self.assertEqual(query.compare_refresh_func2(None, "data", "delete", 1, 2, False, "compare", res), 0)
+            # both variants warm up untimed and are rolled back, then the staged one is timed
+            self.assertEqual(in_list.call_args_list, [mock.call(None, "data", "delete", 1, 2, False, commit=False)])
+            self.assertEqual(staged.call_args_list, [mock.call(None, "data", "delete", 1, 2, False, commit=False),
+                                                     mock.call(None, "data", "delete", 1, 2, False, res,
+                                                               commit=False)])
+
+    def test_batch(self):
+        conn = mock.MagicMock()
+        orders = postgresqldb.PGBatch(conn, "INSERT INTO ORDERS VALUES %s", batch_size=3, values=True)
+        with postgresqldb.PGBatch(conn, "INSERT INTO LINEITEM VALUES %s", batch_size=2, values=True,
+                                  before=[orders]) as lineitems:
+            for key in range(1, 4):
+                orders.add((key,))
+                lineitems.add((key, 1))
+        batches = [(c[0][0].split()[2], c[0][1]) for c in conn.executeBatch.call_args_list]
+        self.assertEqual(batches, [("ORDERS", [(1,), (2,)]), ("LINEITEM", [(1, 1), (2, 1)]),
+                                   ("ORDERS", [(3,)]), ("LINEITEM", [(3, 1)])])
+
+    def test_executors(self):
+        modes = [(mode, run_test_stream) for mode in executor.EXECUTORS] + [("asyncio", run_test_stream_async)]
+        for mode, func in modes:
+            streams = executor.create_executor(mode, 3)
+            streams.start(functools.partial(func, None), range(1, 4))
+            self.assertTrue(streams.wait_ready(10))
+            self.assertEqual(streams.join(), [])
+            self.assertEqual(sorted(streams.collector.getResults()), [10, 20, 30])
+            # a stream failing before the start aborts all others, which fail as well
+            streams = executor.create_executor(mode, 3)
+            streams.start(functools.partial(func, 2), range(1, 4))
+            self.assertFalse(streams.wait_ready(10))
+            self.assertEqual(sorted(streams.join()), [1, 2, 3])
+            self.assertEqual(streams.collector.getResults(), [])
+        self.assertRaises(TypeError, executor.StreamExecutor, 3)
+
+    def test_run_query_stream_async(self):
+        class Connection:
+            def __init__(self):
+                self.statements = []
+
+            async def runStatements(self, statements, itersize=None, timings=None):
+                self.statements.extend(statements)
+                if timings is not None:
+                    timings.extend([0.5] * len(statements))
+                return None
+
+        conn = Connection()
+        result = mock.MagicMock()
+        query_set = mock.MagicMock()
+        query_set.getQueries.return_value = [(q, ["select %s" % q]) for q in query.QUERY_ORDER[1][:-1]] + \
+                                            [(15, ["create view", "select 15", "drop view"])]
+        self.assertEqual(asyncio.run(query.run_query_stream_async(conn, "root", "gen", 1, 2, result, False,
+                                                                  query_set=query_set, statement_timing=True)), 0)
+        self.assertEqual(conn.statements[0], "select %s" % query.QUERY_ORDER[1][0])
+        metrics = [c[0][0] for c in result.setMetric.call_args_list]
+        self.assertEqual(metrics, [query.QUERY_METRIC % (1, q) for q in query.QUERY_ORDER[1][:-1]] +
+                         [query.QUERY_METRIC % (1, 15)] +
+                         [query.QUERY_STATEMENT_METRIC % (1, 15, n) for n in (1, 2, 3)])
+
+    def test_run_statements(self):
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchmany.side_effect = [[(1, "ab")] * 2, [(2, None)]]
+        conn = postgresqldb.PGDB(None, None, None, None, None, connection=connection)
+        with tempfile.TemporaryDirectory() as query_root:
+            for stream in (0, 1):
+                os.makedirs(os.path.join(query_root, "gen", "stream_%s" % stream))
+                for q in range(1, 23):
+                    with open(os.path.join(query_root, "gen", "stream_%s" % stream, "%s.sql" % q), "w") as query_file:
+                        query_file.write("-- using seed\ncreate view v as select 1;\n\nselect * from v;\n"
+                                         "drop view v;\n")
+            query_set = query.QuerySet(query_root, "gen", 1)
+        q, statements = query_set.getQueries()[0]
+        self.assertEqual(q, query.QUERY_ORDER[1][0])
+        self.assertEqual(statements, ["create view v as select 1", "select * from v", "drop view v"])
+        timings = []
+        # the view is created on the plain cursor, its time is no part of the time to the first row
+        connection.cursor.return_value.execute.side_effect = lambda statement: time.sleep(0.2)
+        metrics = conn.runStatements(statements, itersize=2, timings=timings)
+        self.assertEqual(cursor.execute.call_args[0][0], "select * from v")
+        self.assertEqual(connection.cursor.call_args[1], {"name": postgresqldb.FETCH_CURSOR})
+        self.assertEqual(cursor.fetchmany.call_count, 2)
+        self.assertEqual((metrics["rows"], metrics["bytes"]), (3, 7))
+        self.assertLessEqual(metrics["first_row"], metrics["fetch"])
+        self.assertLess(metrics["fetch"], datetime.timedelta(seconds=0.2))
+        self.assertEqual(len(timings), 3)
+        connection.cursor.return_value.execute.side_effect = None
+        # without fetching or timing, the statements are sent in one round trip
+        conn.__cursor__.reset_mock()
+        self.assertIsNone(conn.runStatements(statements))
+        conn.__cursor__.execute.assert_called_once_with("create view v as select 1;\nselect * from v;\ndrop view v")
+        connection = mock.MagicMock()
+        connection.execute = mock.AsyncMock()
+        self.assertIsNone(asyncio.run(asyncdb.AsyncPGDB(connection).runStatements(statements)))
+        connection.execute.assert_called_once_with("create view v as select 1;\nselect * from v;\ndrop view v")
+        self.assertFalse(connection.transaction.called)
+
+    @mock.patch("subprocess.Popen")
+    def test_generate_queries(self, mock_popen):
+        mock_popen.return_value.returncode = 0
+        with tempfile.TemporaryDirectory() as query_root:
+            self.assertEqual(prepare.generate_queries("dbgen", query_root, "template", "gen", 2, seed=100), 0)
+            seeds = sorted(set(c[0][0][2] for c in mock_popen.call_args_list))
+            self.assertEqual(seeds, ["100", "101", "102"])
+            # the stream number names the view of Q15
+            self.assertEqual(sorted(set((c[0][0][2], c[0][0][4]) for c in mock_popen.call_args_list)),
+                             [("100", "0"), ("101", "1"), ("102", "2")])
+            self.assertEqual(mock_popen.call_count, 3 * 22)
+            queries = query.stream_queries(query_root, "gen", 2)
+            self.assertEqual(queries[0], (query.QUERY_ORDER[2][0], os.path.join(
+                query_root, "gen", "stream_2", "%s.sql" % query.QUERY_ORDER[2][0])))
+            self.assertTrue(os.path.exists(queries[0][1]))
+            # streams beyond the prepared ones reuse the query sets of streams 1 and 2, not a stale flat folder
+            self.assertEqual(query.stream_queries(query_root, "gen", 3)[0][1], os.path.join(
+                query_root, "gen", "stream_1", "%s.sql" % query.QUERY_ORDER[3][0]))
+            self.assertEqual(query.stream_queries(query_root, "gen", 4)[0][1], os.path.join(
+                query_root, "gen", "stream_2", "%s.sql" % query.QUERY_ORDER[4][0]))
+            self.assertEqual(query.check_query_sets(query_root, "gen", 4), 0)
+            self.assertEqual(query.check_query_sets(query_root, "missing", 2), 1)
+            self.assertRaises(IOError, query.stream_queries, query_root, "missing", 1)
+
+    def test_plan_fingerprint(self):
+        def explained(node_type, cost):
+            return [{"Plan": {"Node Type": "Sort", "Total Cost": cost, "Sort Key": ["x > %s" % cost],
+                              "Plans": [{"Node Type": node_type, "Relation Name": "orders", "Actual Rows": cost}]},
+                     "Execution Time": cost}]
+        self.assertEqual(plan.plan_fingerprint([explained("Seq Scan", 1)]),
+                         plan.plan_fingerprint([explained("Seq Scan", 2)]))
+        self.assertNotEqual(plan.plan_fingerprint([explained("Seq Scan", 1)]),
+                            plan.plan_fingerprint([explained("Index Scan", 1)]))
+
+    @mock.patch("tpch4pgsql.postgresqldb.connect")
+    def test_run_explain(self, mock_connect):
+        node_types = ["Seq Scan"]
+        mock_connect.return_value.explainStatements.side_effect = \
+            lambda statements, options: [[{"Plan": {"Node Type": node_types[0]}}]]
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "gen", "stream_0"))
+            for q in range(1, 23):
+                with open(os.path.join(root, "gen", "stream_0", "%s.sql" % q), "w") as query_file:
+                    query_file.write("select %s;" % q)
+            self.assertEqual(plan.run_explain(root, "gen", root, None, None, None, None, None,
+                                              "run_1", [0], False), 0)
+            node_types[0] = "Index Scan"
+            self.assertEqual(plan.run_explain(root, "gen", root, None, None, None, None, None,
+                                              "run_2", [0], False), 0)
+            self.assertTrue(os.path.exists(os.path.join(root, "run_2", "plans", "stream_0_query_14.json")))
+            with open(os.path.join(root, "run_2", "plans", "PlanChanges.json")) as json_file:
+                changes = json.load(json_file)
+        self.assertEqual(changes["previous_run"], "run_1")
+        self.assertEqual(len(changes), 23)
+
+    def test_warehouse(self):
+        with tempfile.TemporaryDirectory() as results_dir:
+            # a run saved as JSON only, before the store existed
+            os.makedirs(os.path.join(results_dir, "run_1", "power"))
+            with open(os.path.join(results_dir, "run_1", "power", "Power.json"), "w") as json_file:
+                json.dump({query.QUERY_METRIC % (0, 1): "0:00:09.000000"}, json_file)
+            power = result.Result("Power")
+            for i in range(1, 23):
+                power.setMetric(query.QUERY_METRIC % (0, i), datetime.timedelta(seconds=2))
+            for j in (1, 2):
+                power.setMetric(query.REFRESH_METRIC % (0, j), datetime.timedelta(seconds=2))
+            power.setMetric("plan", "abc")
+            power.saveMetrics(results_dir, "run_2", "power")
+            # the store stays open for the results saved later
+            with mock.patch.object(warehouse, "connect") as connect:
+                power.saveMetrics(results_dir, "run_2", "power")
+            self.assertFalse(connect.called)
+            results = query.load_run_results(results_dir, "run_2")
+            self.assertEqual(results[query.QUERY_METRIC % (0, 1)], [2.0])
+            self.assertNotIn("plan", results)
+            self.assertAlmostEqual(query.get_power_size(results, 1), 1800)
+            # refresh functions skipped by --read-only count as 1/1000 of the longest time
+            for j in (1, 2):
+                results[query.REFRESH_METRIC % (0, j)] = [0.0]
+            self.assertAlmostEqual(query.get_power_size(results, 1), 1800 / (0.002 / 2) ** (2 / 24))
+            self.assertEqual(query.load_run_results(results_dir, "run_1"), {query.QUERY_METRIC % (0, 1): [9.0]})
+            self.assertEqual(warehouse.import_json(results_dir), 2)
+            self.assertEqual(warehouse.to_value("1 day, 0:00:01.5"), (86401.5, None))
+            warehouse.close_stores()
+            self.assertEqual(warehouse.STORES, {})
+
+    def test_stats(self):
+        self.assertAlmostEqual(stats.geometric_mean([1e-300] * 24 + [1e300] * 24), 1.0)
+        self.assertAlmostEqual(stats.geometric_mean([2, 8]), 4.0)
+        self.assertEqual(stats.median([3, 1, 2, 10]), 2.5)
+        self.assertAlmostEqual(stats.percentile(range(101), 95), 95.0)
+        self.assertAlmostEqual(stats.stdev([1, 2, 3, 4]), 1.2909944487)
+        self.assertEqual(stats.stdev([1]), 0.0)
+        low, high = stats.bootstrap_ci([10, 11, 12, 13, 50])
+        self.assertTrue(10 <= low <= 12 <= high <= 50)
+        self.assertEqual(stats.bootstrap_ci([10, 11, 12, 13, 50]), (low, high))  # fixed seed
+        with tempfile.TemporaryDirectory() as results_dir:
+            for run, seconds in (("run_1_1", 1), ("run_1_2", 2), ("run_1_3", 4)):
+                power = result.Result("Power")
+                power.setMetric(query.QUERY_METRIC % (0, 1), datetime.timedelta(seconds=seconds))
+                power.setMetric(query.QUERY_STATEMENT_METRIC % (0, 1, 1), datetime.timedelta(seconds=seconds))
+                power.saveMetrics(results_dir, run, query.POWER)
+                metrics = result.Result("Metric")
+                metrics.setMetric("power_size", 3600 / seconds)
+                metrics.saveMetrics(results_dir, run, "metrics")
+            summary = query.summarize_runs(results_dir, "run_1", ["run_1_1", "run_1_2", "run_1_3"])
+            self.assertEqual(sorted(summary), ["power_size", query.QUERY_METRIC % (0, 1)])
+            self.assertEqual(summary[query.QUERY_METRIC % (0, 1)]["median"], 2.0)
+            self.assertEqual(summary["power_size"]["n"], 3)
+            saved = warehouse.load_metrics(results_dir, "run_1", ["summary"])
+            self.assertEqual(saved["power_size_median"], [1800.0])
+
+    def test_sweep(self):
+        self.assertEqual(sweep.parse_stream_counts("4,1-3, 3"), [1, 2, 3, 4])
+        self.assertRaises(ValueError, sweep.parse_stream_counts, "3-1")
+        self.assertEqual(sweep.find_knee([(1, 10), (2, 20), (4, 40), (8, 80)]), None)
+        self.assertEqual(sweep.find_knee([(1, 10), (2, 20), (4, 40), (8, 42), (16, 41)]), 4)
+        self.assertEqual(sweep.cpu_utilization((10, 100), (60, 200)), 50.0)
+        self.assertEqual(sweep.cpu_utilization(None, (60, 200)), None)
+
+        def throughput_test(query_root, data_dir, update_dir, delete_dir, generated_query_dir, results_dir,
+                            host, port, database, user, password, run, num_streams, *args):
+            res = result.Result("ThroughputQueryStream")
+            for s in range(1, num_streams + 1):
+                for q in range(1, 23):
+                    res.setMetric(query.QUERY_METRIC % (s, q), datetime.timedelta(seconds=max(1, num_streams / 2)))
+            res.saveMetrics(results_dir, run, query.THROUGHPUT)
+            total = result.Result("ThroughputTotal")
+            total.setMetric(query.THROUGHPUT_TOTAL_METRIC, datetime.timedelta(seconds=22 * max(1, num_streams / 2)))
+            total.saveMetrics(results_dir, run, query.THROUGHPUT)
+            return 0
+
+        with tempfile.TemporaryDirectory() as results_dir, \
+                mock.patch.object(query, "run_throughput_test", side_effect=throughput_test), \
+                mock.patch.object(sweep, "read_cpu_times", side_effect=[(0, 100), (50, 200)] * 4):
+            for stream in range(8):
+                os.makedirs(os.path.join(results_dir, "g", "stream_%s" % stream))
+            # a query set of its own is needed for each of the 8 streams
+            self.assertEqual(sweep.run_sweep(results_dir, "d", "u", "x", "g", results_dir, "h", 5432, "db", "u", "p",
+                                             "run_1", [1, 2, 4, 8], 1, False, True), 1)
+            self.assertFalse(query.run_throughput_test.called)
+            os.makedirs(os.path.join(results_dir, "g", "stream_8"))
+            # without --read-only the refresh data of 8 streams is needed as well
+            self.assertEqual(sweep.check_sweep(results_dir, "d", "u", "x", "g", 8, False), 1)
+            self.assertEqual(sweep.run_sweep(results_dir, "d", "u", "x", "g", results_dir, "h", 5432, "db", "u", "p",
+                                             "run_1", [1, 2, 4, 8], 1, False, True), 0)
+            with open(os.path.join(results_dir, "run_1", sweep.SWEEP, sweep.CURVE_FILE)) as csv_file:
+                lines = csv_file.read().splitlines()
+            self.assertEqual(len(lines), 5)
+            self.assertTrue(lines[4].startswith("8,7200.0,4.0,50.0,"))
+            metrics = warehouse.load_metrics(results_dir, "run_1", [sweep.SWEEP])
+            self.assertEqual(metrics["peak_streams"], [2.0])
+            self.assertEqual(metrics["streams_4_latency_inflation"], [2.0])
+
+    def test_latency_histogram(self):
+        histogram = stats.LatencyHistogram()
+        for ms in range(1, 1001):
+            histogram.record(ms / 1000)
+        self.assertEqual(histogram.getCount(), 1000)
+        self.assertAlmostEqual(histogram.getPercentile(50), 0.5, delta=0.5 * 0.016)
+        self.assertAlmostEqual(histogram.getPercentile(99), 0.99, delta=0.99 * 0.016)
+        self.assertEqual(histogram.getPercentile(100), 1.0)
+        self.assertAlmostEqual(histogram.getMean(), 0.5005)
+        total = stats.LatencyHistogram()
+        total.add(histogram)
+        total.record(5)
+        self.assertEqual((total.getCount(), total.getMax()), (1001, 5.0))
+
+    def test_open_loop(self):
+        arrivals = list(openloop.arrival_times(10, 2, "fixed"))
+        self.assertEqual(len(arrivals), 19)
+        poisson = list(openloop.arrival_times(100, 10, "poisson", seed=1))
+        self.assertAlmostEqual(len(poisson), 1000, delta=150)
+        self.assertEqual(poisson, list(openloop.arrival_times(100, 10, "poisson", seed=1)))
+
+        query_set = mock.Mock()
+        query_set.getQueries.return_value = [(14, ["select 14"]), (2, ["select 2"])]
+        conns = []
+
+        def connect(*args):
+            conn = mock.Mock()
+            conn.runStatements.side_effect = lambda statements, itersize: time.sleep(0.01)
+            conns.append(conn)
+            return conn
+
+        with tempfile.TemporaryDirectory() as results_dir, \
+                mock.patch.object(query, "QuerySet", return_value=query_set), \
+                mock.patch.object(postgresqldb, "connect", side_effect=connect):
+            # streams 1 and 2 need query sets of their own
+            with mock.patch.object(query, "count_query_sets", return_value=2):
+                self.assertEqual(openloop.run_open_loop("q", "g", results_dir, "h", 5432, "db", "u", "p", "run_1",
+                                                        2, False, 200, 0.5, "fixed", 1), 1)
+            self.assertEqual(conns, [])
+            started = time.perf_counter()
+            with mock.patch.object(query, "count_query_sets", return_value=3):
+                self.assertEqual(openloop.run_open_loop("q", "g", results_dir, "h", 5432, "db", "u", "p", "run_1",
+                                                        2, False, 200, 0.5, "fixed", 1), 0)
+            # one connection serves 100 queries per second at most, so dispatching stops at the end of the test
+            self.assertLess(time.perf_counter() - started, 0.9)
+            self.assertEqual(len(conns), 1)
+            self.assertTrue(conns[0].close.called)
+            metrics = warehouse.load_metrics(results_dir, "run_1", [openloop.OPEN_LOOP])
+            self.assertEqual(metrics["openloop_arrivals"], [99.0])
+            completed = metrics["openloop_completed"][0]
+            self.assertGreater(metrics["openloop_dropped"][0], 30)
+            self.assertEqual(completed + metrics["openloop_dropped"][0], 99)
+            self.assertEqual(metrics[openloop.OPEN_LOOP_METRIC % (14, "service", "count")], [math.ceil(completed / 2)])
+            # dropped arrivals count as response times, but not as service times
+            self.assertEqual(metrics[openloop.OPEN_LOOP_METRIC % ("all", "response", "count")], [99.0])
+            self.assertEqual(metrics[openloop.OPEN_LOOP_METRIC % ("all", "service", "count")], [completed])
+            # arrivals at 200 per second queue up
+            self.assertGreater(metrics[openloop.OPEN_LOOP_METRIC % ("all", "response", "p99")][0],
+                               5 * metrics[openloop.OPEN_LOOP_METRIC % ("all", "service", "p99")][0])
+            with open(os.path.join(results_dir, "run_1", openloop.OPEN_LOOP, openloop.HISTOGRAMS)) as json_file:
+                self.assertEqual(len(json.load(json_file)), 6)
+
+    def test_steady_state(self):
+        self.assertEqual(stats.steady_state([1, 5, 9, 10, 10, 11, 10, 10, 10]), 2)
+        self.assertEqual(stats.steady_state([1, 2, 4, 8, 16, 32]), None)
+        self.assertEqual(stats.drift([10, 10, 10]), 0.0)
+        self.assertAlmostEqual(stats.drift([9, 10, 11]), 0.2)
+
+    def test_soak(self):
+        recorder = soak.WindowedRecorder(1)
+        start, deadline = recorder.begin(3)
+        self.assertEqual(recorder.getDeadline(), deadline)
+        recorder.record("query", 0.5, start + 0.5)
+        recorder.record("query", 1.5, start + 1.5)
+        recorder.record("rf1", 0.2, start + 1.6)
+        recorder.record("rf2", 0.1, start + 1.7)
+        recorder.record("query", 1, start + 3.5)  # after the end
+        recorder.recordError(start + 2.5)
+        recorder.recordSample(0, {"dead_tuples": 10, "autovacuums": 1, "checkpoints": 5})
+        recorder.recordSample(1, {"dead_tuples": 20, "autovacuums": 3, "checkpoints": 5})
+        windows = recorder.getWindows(3, {"dead_tuples": 0, "autovacuums": 0, "checkpoints": 5})
+        self.assertEqual([w["queries"] for w in windows], [1, 1, 0])
+        self.assertEqual(windows[1]["refresh_pairs"], 1)
+        self.assertEqual(windows[1]["autovacuums"], 2)
+        self.assertEqual(windows[2]["errors"], 1)
+        self.assertEqual(windows[2]["dead_tuples"], None)
+
+        res = result.Result("Soak")
+        windows = [{"start": i * 60, "queries_per_second": qps, "latency_p95": 1.0, "dead_tuples": 100 * i}
+                   for i, qps in enumerate([1, 3, 5, 5, 5, 5, 5, 5])]
+        steady, drifting = soak.analyze_windows(windows, res)
+        self.assertEqual(steady, 2)
+        self.assertEqual(sorted(drifting), ["dead_tuples"])
+
+        query_set = mock.Mock()
+        query_set.getQueries.return_value = [(14, ["select 14"]), (2, ["select 2"])]
+        conn = mock.Mock()
+        conn.runStatements.side_effect = lambda statements, itersize: time.sleep(0.01)
+        conn.fetchValue.return_value = 7
+        with tempfile.TemporaryDirectory() as results_dir, \
+                mock.patch.object(query, "QuerySet", return_value=query_set), \
+                mock.patch.object(postgresqldb, "connect", return_value=conn):
+            self.assertEqual(soak.run_soak("q", "d", "u", "g", results_dir, "h", 5432, "db", "u", "p", "run_1", 2,
+                                           False, True, 1, 0.25), 1)  # no query sets
+            self.assertFalse(conn.runStatements.called)
+        with tempfile.TemporaryDirectory() as results_dir, \
+                mock.patch.object(query, "QuerySet", return_value=query_set), \
+                mock.patch.object(query, "count_query_sets", return_value=3), \
+                mock.patch.object(postgresqldb, "connect", return_value=conn):
+            self.assertEqual(soak.run_soak("q", "d", "u", "g", results_dir, "h", 5432, "db", "u", "p", "run_1", 2,
+                                           False, True, 1, 0.25), 0)
+            with open(os.path.join(results_dir, "run_1", soak.SOAK, soak.WINDOWS_FILE)) as csv_file:
+                lines = csv_file.read().splitlines()
+            self.assertEqual(len(lines), 5)
+            metrics = warehouse.load_metrics(results_dir, "run_1", [soak.SOAK])
+            self.assertGreater(metrics["soak_queries"][0], 100)
+            self.assertEqual(metrics["soak_refresh_pairs"], [0.0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,94 @@
+import time
+
+from tpch4pgsql import postgresqldb as pgdb
+
+
+def import_driver():
+    """Import the asyncio PostgreSQL driver, which is only needed by the asyncio engine
+
+    :return: asyncpg module
+    """
+    try:
+        import asyncpg
+    except ImportError:
+        raise IOError("the asyncio engine requires the asyncpg package (pip3 install asyncpg)")
+    return asyncpg
+
+
+class AsyncPGDB:
+    """Class for asyncio connections to PostgreSQL database, see connect()
+
+    The statements of a query, e.g. a view created and dropped around it, are sent as one simple query like
+    the query file, unless they are timed one by one or their rows are fetched. Only the server-side cursors
+    of the latter need an explicit transaction.
+    """
+    def __init__(self, connection):
+        self.__connection__ = connection
+
+    async def runStatements(self, statements, itersize=None, timings=None):
+        """Execute the statements of a query, optionally fetching the rows of every query through a
+        server-side cursor, see postgresqldb.PGDB.runStatements()
+
+        :return: dictionary of metrics if itersize is given, see postgresqldb.FetchStatistics.getMetrics()
+        """
+        if self.__connection__ is not None:
+            if not itersize and timings is None:
+                await self.__connection__.execute(";\n".join(statements))
+                return None
+            statistics = pgdb.FetchStatistics() if itersize else None
+            if itersize:
+                # the cursors of asyncpg require a transaction
+                async with self.__connection__.transaction():
+                    await self.__run__(statements, itersize, timings, statistics)
+            else:
+                await self.__run__(statements, itersize, timings, statistics)
+            return statistics.getMetrics() if statistics else None
+        else:
+            print("database has been closed")
+            return None
+
+    async def __run__(self, statements, itersize, timings, statistics):
+        for statement in statements:
+            start = time.perf_counter()
+            if itersize and pgdb.is_query(statement):
+                statistics.begin()
+                cursor = await self.__connection__.cursor(statement)
+                rows = await cursor.fetch(itersize)
+                statistics.add(rows)
+                while len(rows) == itersize:
+                    rows = await cursor.fetch(itersize)
+                    statistics.add(rows)
+            else:
+                await self.__connection__.execute(statement)
+            if timings is not None:
+                timings.append(time.perf_counter() - start)
+
+    async def executeQuery(self, query):
+        if self.__connection__ is not None:
+            await self.__connection__.execute(query)
+            return 0
+        else:
+            print("database has been closed")
+            return 1
+
+    async def close(self):
+        if self.__connection__ is not None:
+            await self.__connection__.close()
+            self.__connection__ = None
+
+
+async def connect(host, port, db_name, user, password, timeout=60):
+    """Open an asyncio connection with the session settings of postgresqldb.configure()
+
+    Connections are not pooled: every stream keeps its connection for the whole test anyway.
+
+    :param timeout: seconds to wait for the connection, e.g. while hundreds of streams connect at once
+    :return: AsyncPGDB object
+    """
+    asyncpg = import_driver()
+    settings = pgdb.CONFIG["settings"]
+    connection = await asyncpg.connect(host=host, port=port, database=db_name, user=user, password=password,
+                                       timeout=timeout,
+                                       server_settings={name: str(value) for name, value in settings.items()}
+                                       if settings else None)
+    return AsyncPGDB(connection)
@@ -0,0 +1,254 @@
+import abc
+import asyncio
+import threading
+import multiprocessing
+import queue as queues
+from concurrent.futures import ThreadPoolExecutor
+
+# Executors running the query streams of the throughput test concurrently, see create_executor()
+
+EXECUTORS = ["process", "thread", "asyncio"]
+DEFAULT_EXECUTOR = "process"
+READY_TIMEOUT = 600  # seconds to wait for all streams to be ready, e.g. connected
+
+
+class ResultCollector:
+    """Thread safe in-memory collector of the Result objects of all streams
+
+    """
+    def __init__(self):
+        self.__results__ = []
+        self.__lock__ = threading.Lock()
+
+    def put(self, result):
+        with self.__lock__:
+            self.__results__.append(result)
+
+    def getResults(self):
+        with self.__lock__:
+            return list(self.__results__)
+
+
+class StreamExecutor(abc.ABC):
+    """Base class running one function call per stream concurrently
+
+    The function is called as func(stream, barrier) and returns a Result object, or raises an
+    exception if the stream fails. It is expected to prepare itself, e.g. connect, then wait on
+    the barrier, which is passed by all streams and the caller of wait_ready() at the same time.
+    A failing stream aborts the barrier, so no stream waits forever.
+
+    """
+    def __init__(self, num_streams):
+        self.__num_streams__ = num_streams
+        self.collector = ResultCollector()
+        self.failed = []  # numbers of the streams that failed
+
+    @abc.abstractmethod
+    def start(self, func, streams):
+        """Start the streams, each calling func(stream, barrier)
+
+        :param streams: list of stream numbers
+        """
+
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        """Wait until all streams are ready, to start timing them
+
+        :return: True if all streams are ready, False if one of them failed before
+        """
+        try:
+            self.barrier.wait(timeout)
+            return True
+        except threading.BrokenBarrierError:
+            return False
+
+    @abc.abstractmethod
+    def join(self):
+        """Wait for all streams to finish
+
+        :return: list of the numbers of failed streams
+        """
+
+
+def run_stream(func, stream, barrier):
+    """Run the function of one stream, aborting the barrier if it fails
+
+    :return: Result object of the stream
+    """
+    try:
+        return func(stream, barrier)
+    except BaseException:
+        barrier.abort()
+        raise
+
+
+def process_main(func, stream, barrier, queue):
+    """Entry point of a stream run by ProcessExecutor, passing the result to the parent through a queue
+
+    :return: no return value, exit code 1 if the stream failed
+    """
+    try:
+        result = run_stream(func, stream, barrier)
+    except BaseException as e:
+        print("query stream #%s failed: %s" % (stream, e))
+        exit(1)
+    queue.put(result)
+
+
+class ProcessExecutor(StreamExecutor):
+    """One process per stream, the results are pickled back through a queue
+
+    """
+    def __init__(self, num_streams):
+        super().__init__(num_streams)
+        self.barrier = multiprocessing.Barrier(num_streams + 1)
+        self.__queue__ = multiprocessing.Queue()
+        self.__processes__ = []
+
+    def start(self, func, streams):
+        for stream in streams:
+            p = multiprocessing.Process(target=process_main, args=(func, stream, self.barrier, self.__queue__))
+            self.__processes__.append((stream, p))
+            p.start()
+
+    def __drain__(self, timeout):
+        try:
+            self.collector.put(self.__queue__.get(timeout=timeout))
+        except queues.Empty:
+            pass
+
+    def join(self):
+        # results have to be read while the processes are running, a process does not exit before its queue is read
+        while any(p.is_alive() for stream, p in self.__processes__):
+            self.__drain__(0.1)
+        for stream, p in self.__processes__:
+            p.join()
+            if p.exitcode != 0:
+                self.failed.append(stream)
+        for i in range(len(self.__processes__) - len(self.failed) - len(self.collector.getResults())):
+            self.__drain__(1)
+        return self.failed
+
+
+class ThreadExecutor(StreamExecutor):
+    """One thread per stream, psycopg2 releases the GIL while waiting for the server
+
+    """
+    def __init__(self, num_streams):
+        super().__init__(num_streams)
+        self.barrier = threading.Barrier(num_streams + 1)
+        self.__threads__ = []
+        self.__lock__ = threading.Lock()
+
+    def __run__(self, func, stream):
+        try:
+            self.collector.put(run_stream(func, stream, self.barrier))
+        except BaseException as e:
+            print("query stream #%s failed: %s" % (stream, e))
+            with self.__lock__:
+                self.failed.append(stream)
+
+    def start(self, func, streams):
+        for stream in streams:
+            t = threading.Thread(target=self.__run__, args=(func, stream), daemon=True)
+            self.__threads__.append(t)
+            t.start()
+
+    def join(self):
+        for t in self.__threads__:
+            t.join()
+        return self.failed
+
+
+class AsyncGate:
+    """Barrier for the tasks of one event loop: the last task to arrive passes the thread barrier of
+    the executor on behalf of all, so hundreds of waiting tasks do not need a thread each
+
+    """
+    def __init__(self, num_tasks, barrier):
+        self.__waiting__ = num_tasks
+        self.__barrier__ = barrier
+        self.__event__ = asyncio.Event()
+        self.__broken__ = False
+
+    async def wait(self, timeout=None):
+        self.__waiting__ -= 1
+        if self.__waiting__ == 0:
+            try:
+                await asyncio.get_event_loop().run_in_executor(None, self.__barrier__.wait, timeout)
+            except threading.BrokenBarrierError:
+                self.__broken__ = True
+            self.__event__.set()
+        else:
+            try:
+                await asyncio.wait_for(self.__event__.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.abort()
+        if self.__broken__:
+            raise threading.BrokenBarrierError
+
+    def abort(self):
+        self.__broken__ = True
+        self.__barrier__.abort()
+        self.__event__.set()
+
+
+class AsyncioExecutor(StreamExecutor):
+    """One asyncio task per stream, all in one event loop running in a background thread
+
+    Coroutine functions run as tasks directly and get an AsyncGate instead of the barrier, so hundreds
+    of streams need neither a process nor a thread each, see query.run_throughput_inner_async().
+    Plain functions run in a thread pool of the loop.
+
+    """
+    def __init__(self, num_streams):
+        super().__init__(num_streams)
+        self.barrier = None
+        self.__thread__ = None
+
+    async def __run__(self, func, stream, gate, pool):
+        try:
+            if gate is not None:
+                try:
+                    result = await func(stream, gate)
+                except BaseException:
+                    gate.abort()
+                    raise
+            else:
+                result = await asyncio.get_event_loop().run_in_executor(pool, run_stream, func, stream, self.barrier)
+            self.collector.put(result)
+        except Exception as e:
+            print("query stream #%s failed: %s" % (stream, e))
+            self.failed.append(stream)
+
+    async def __main__(self, func, streams):
+        if asyncio.iscoroutinefunction(func):
+            gate = AsyncGate(len(streams), self.barrier)
+            await asyncio.gather(*[self.__run__(func, stream, gate, None) for stream in streams])
+        else:
+            with ThreadPoolExecutor(max_workers=len(streams)) as pool:
+                await asyncio.gather(*[self.__run__(func, stream, None, pool) for stream in streams])
+
+    def start(self, func, streams):
+        streams = list(streams)
+        # the tasks pass the barrier as one party, see AsyncGate
+        self.barrier = threading.Barrier(2 if asyncio.iscoroutinefunction(func) else len(streams) + 1)
+        self.__thread__ = threading.Thread(target=lambda: asyncio.run(self.__main__(func, streams)), daemon=True)
+        self.__thread__.start()
+
+    def join(self):
+        self.__thread__.join()
+        return self.failed
+
+
+def create_executor(mode, num_streams):
+    """Create the executor for the query streams
+
+    :param mode: "process", "thread" or "asyncio"
+    :param num_streams: number of streams
+    :return: StreamExecutor object
+    """
+    if mode == "thread":
+        return ThreadExecutor(num_streams)
+    if mode == "asyncio":
+        return AsyncioExecutor(num_streams)
+    return ProcessExecutor(num_streams)
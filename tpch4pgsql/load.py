@@ -1,5 +1,26 @@
 import os
-from tpch4pgsql import postgresqldb as pgdb
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import datetime as dt
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import Pool
+
+from psycopg2 import sql
+
+from tpch4pgsql import postgresqldb as pgdb, prepare as prep, transform as tr, pgcopy as pc, schema
+
+# large tables, whose data files are split into byte ranges loaded by several connections at once
+SPLIT_TABLES = ['LINEITEM', 'ORDERS']
+LOAD_TABLE_METRIC = "load_table_%s"
+LOAD_CHUNK_METRIC = "load_table_%s_chunk_%s"
+INDEX_METRIC = "index_tables_%s"
+VACUUM_METRIC = "vacuum_analyze_%s"
+DEFAULT_NUM_PARTITIONS = 7  # one per year of dbgen dates, for the partitioned schema profile
+MAINTENANCE_DB = "postgres"  # database to connect to while the benchmark database is dropped or copied
+FILE_COPY_VERSION = 150000  # first server version with CREATE DATABASE ... STRATEGY
 
 
 def clean_database(query_root, host, port, db_name, user, password, tables):
@@ -19,10 +40,10 @@ def clean_database(query_root, host, port, db_name, user, password, tables):
         non zero otherwise
     """
     try:
-        conn = pgdb.PGDB(host, port, db_name, user, password)
+        conn = pgdb.connect(host, port, db_name, user, password)
         try:
-            for table in tables:
-                conn.executeQuery("DROP TABLE IF EXISTS %s " % table)
+            # one statement, i.e. one round trip for all tables
+            conn.executeQuery("DROP TABLE IF EXISTS %s" % ", ".join(tables))
         except Exception as e:
             print("unable to remove existing tables. %s" % e)
             return 1
@@ -35,7 +56,8 @@ def clean_database(query_root, host, port, db_name, user, password, tables):
         return 1
 
 
-def create_schema(query_root, host, port, db_name, user, password, prep_query_dir):
+def create_schema(query_root, host, port, db_name, user, password, prep_query_dir, unlogged=False,
+                  num_partitions=DEFAULT_NUM_PARTITIONS):
     """Creates the schema for the tests. Drops the tables if they exist
 
     Args:
@@ -46,15 +68,21 @@ def create_schema(query_root, host, port, db_name, user, password, prep_query_di
         user (str): user for the PG instance
         password (str): password for the PG instance
         prep_query_dir (str): directory with queries for schema creation
+        unlogged (bool): True to create the tables as UNLOGGED, see set_logged()
+        num_partitions (int): number of date ranges of tables partitioned by range in create_tbl.sql
 
     Return:
         0 if successful
         non zero otherwise
     """
     try:
-        conn = pgdb.PGDB(host, port, db_name, user, password)
+        conn = pgdb.connect(host, port, db_name, user, password)
         try:
-            conn.executeQueryFromFile(os.path.join(query_root, prep_query_dir, "create_tbl.sql"))
+            filepath = os.path.join(query_root, prep_query_dir, "create_tbl.sql")
+            conn.executeQueryFromFile(filepath, schema.unlogged if unlogged else None)
+            with open(filepath) as sql_file:
+                for sql in schema.partition_statements(sql_file.read(), num_partitions):
+                    conn.executeQuery(sql)
         except Exception as e:
             print("unable to run create tables. %s" % e)
             return 1
@@ -65,8 +93,10 @@ def create_schema(query_root, host, port, db_name, user, password, prep_query_di
         return 1
 
 
-def load_tables(data_dir, host, port, db_name, user, password, tables, load_dir):
+def load_tables(data_dir, host, port, db_name, user, password, tables, load_dir, result=None, num_jobs=1,
+                column_types=None):
     """Loads data into tables. Expects that tables are already empty.
+    Compressed data files are decompressed on the fly, in a background thread per file.
 
     Args:
         data_dir (str): Directory in which load data exists
@@ -77,18 +107,38 @@ def load_tables(data_dir, host, port, db_name, user, password, tables, load_dir)
         password (str): password for the PG instance
         tables (str): list of tables
         load_dir (str): directory with data files to be loaded
+        result (Result): optional result object for the load throughput metrics
+        num_jobs (int): number of connections loading at the same time, see load_tables_parallel()
+        column_types (dict): column types per table as read by pgcopy.read_column_types() to load in binary
+                             format, None to load in text format
 
     Return:
         0 if successful
         non zero otherwise
     """
+    if num_jobs > 1:
+        return load_tables_parallel(data_dir, host, port, db_name, user, password, tables, load_dir,
+                                    result, num_jobs, column_types)
     try:
-        conn = pgdb.PGDB(host, port, db_name, user, password)
+        conn = pgdb.connect(host, port, db_name, user, password)
         try:
+            start = time.perf_counter()
+            file_bytes = 0
+            data_bytes = 0
             for table in tables:
-                filepath = os.path.join(data_dir, load_dir, table.lower() + ".tbl.csv")
-                conn.copyFrom(filepath, separator="|", table=table)
+                filepath, compression = tr.find_data_file(os.path.join(data_dir, load_dir,
+                                                                       table.lower() + ".tbl.csv"))
+                if compression is None and column_types is None:
+                    conn.copyFrom(filepath, separator="|", table=table)
+                    data_bytes += os.path.getsize(filepath)
+                else:
+                    with tr.DecompressingReader(filepath, compression) as in_file:
+                        copy_stream(conn, in_file, table, column_types)
+                        data_bytes += in_file.size
+                file_bytes += os.path.getsize(filepath)
             conn.commit()
+            if result is not None:
+                set_throughput_metrics(result, file_bytes, data_bytes, time.perf_counter() - start)
         except Exception as e:
             print("unable to run load tables. %s" %e)
             return 1
@@ -99,32 +149,555 @@ def load_tables(data_dir, host, port, db_name, user, password, tables, load_dir)
         return 1
 
 
-def index_tables(query_root, host, port, db_name, user, password, prep_query_dir):
-    """Creates indexes and foreign keys for loaded tables.
+def load_tables_parallel(data_dir, host, port, db_name, user, password, tables, load_dir, result, num_jobs,
+                         column_types=None):
+    """Loads data into tables through a pool of connections, one COPY per table at a time.
+    The uncompressed data files of SPLIT_TABLES are split into num_jobs byte ranges, which are loaded
+    by several connections at once. Every connection commits only after all COPYs succeeded.
+    Expects that tables are already empty.
 
     Args:
-        query_root (str): Directory in which preparation queries directory exists
+        data_dir (str): Directory in which load data exists
         host (str): IP/hostname of the PG instance
         port (int): port for the PG instance
         db_name (str): name of the tpch database
         user (str): user for the PG instance
         password (str): password for the PG instance
-        prep_query_dir (str): directory with create index script
+        tables (str): list of tables
+        load_dir (str): directory with data files to be loaded
+        result (Result): optional result object for per table and per chunk timings
+        num_jobs (int): number of connections loading at the same time
+        column_types (dict): column types per table to load in binary format, encoded by a pool of
+                             num_jobs processes, or None to load in text format
 
     Return:
         0 if successful
         non zero otherwise
     """
+    local = threading.local()
+    pool = Pool(num_jobs) if column_types is not None else None
+    connections = []
+    lock = threading.Lock()
+
+    def copy_task(task):
+        table, chunk, filepath, compression, start, end = task
+        if getattr(local, "conn", None) is None:
+            local.conn = pgdb.connect(host, port, db_name, user, password)
+            with lock:
+                connections.append(local.conn)
+        started = dt.datetime.now()
+        if compression is not None:
+            in_file = tr.DecompressingReader(filepath, compression)
+        else:
+            in_file = tr.RangeReader(filepath, start, end)
+        with in_file:
+            copy_stream(local.conn, in_file, table, column_types, pool)
+            return table, chunk, started, dt.datetime.now(), in_file.size
+
     try:
-        conn = pgdb.PGDB(host, port, db_name, user, password)
+        tasks = []
+        file_bytes = 0
+        for table in tables:
+            filepath, compression = tr.find_data_file(os.path.join(data_dir, load_dir, table.lower() + ".tbl.csv"))
+            file_bytes += os.path.getsize(filepath)
+            if compression is None and table in SPLIT_TABLES:
+                ranges = tr.split_file(filepath, num_jobs)
+            else:
+                ranges = [(0, os.path.getsize(filepath))]
+            for chunk, (start, end) in enumerate(ranges, 1):
+                tasks.append((table, chunk, filepath, compression, start, end))
+        # largest chunks first, so the small tables fill the gaps at the end
+        tasks.sort(key=lambda task: task[5] - task[4], reverse=True)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            timings = list(executor.map(copy_task, tasks))
+        for conn in connections:
+            conn.commit()
+        print("loaded %s tables in %s chunks with %s connections" % (len(tables), len(tasks), len(connections)))
+        if result is not None:
+            set_throughput_metrics(result, file_bytes, sum(t[4] for t in timings), time.perf_counter() - start)
+            for table in tables:
+                table_timings = [t for t in timings if t[0] == table]
+                result.setMetric(LOAD_TABLE_METRIC % table.lower(),
+                                 max(t[3] for t in table_timings) - min(t[2] for t in table_timings))
+                if len(table_timings) > 1:
+                    for t in table_timings:
+                        result.setMetric(LOAD_CHUNK_METRIC % (table.lower(), t[1]), t[3] - t[2])
+        return 0
+    except Exception as e:
+        print("unable to run load tables. %s" % e)
+        return 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for conn in connections:
+            conn.close()
+
+
+def copy_stream(conn, in_file, table, column_types=None, pool=None, freeze=False):
+    """Loads the data read from a file object into a table, in text or binary format.
+
+    Args:
+        conn (PGDB): open connection
+        in_file (file): binary file object with the data, without trailing delimiters
+        table (str): name of the table
+        column_types (dict): column types per table to load in binary format, None to load in text format
+        pool (Pool): optional process pool for encoding in binary format
+        freeze (bool): True for COPY FREEZE, the table must have been created in the same transaction
+    """
+    if column_types is None:
+        conn.copyFromStream(in_file, separator="|", table=table, size=tr.PIPE_BLOCK_SIZE, freeze=freeze)
+    else:
+        conn.copyBinaryFromStream(pc.BinaryCopyReader(in_file, column_types[table], pool), table=table,
+                                  size=tr.PIPE_BLOCK_SIZE, freeze=freeze)
+
+
+def load_tables_freeze(query_root, data_dir, host, port, db_name, user, password, tables, load_dir,
+                       prep_query_dir, result=None, num_jobs=1, column_types=None):
+    """Creates every table and loads it with COPY FREEZE in the same transaction, so the rows are
+    written frozen and need no hint bit updates later. Up to num_jobs tables are loaded at once,
+    each by its own connection. Expects that tables do not exist.
+
+    Args:
+        query_root (str): Directory in which preparation queries directory exists
+        data_dir (str): Directory in which load data exists
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        tables (str): list of tables
+        load_dir (str): directory with data files to be loaded
+        prep_query_dir (str): directory with queries for schema creation
+        result (Result): optional result object for per table timings
+        num_jobs (int): number of tables loaded at the same time
+        column_types (dict): column types per table to load in binary format, None to load in text format
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    pool = Pool(num_jobs) if column_types is not None and num_jobs > 1 else None
+
+    def load_table(table):
+        conn = pgdb.connect(host, port, db_name, user, password)
         try:
-            conn.executeQueryFromFile(os.path.join(query_root, prep_query_dir, "create_idx.sql"))
+            started = dt.datetime.now()
+            for sql in create_statements[table]:
+                conn.executeQuery(sql)
+            filepath, compression = tr.find_data_file(os.path.join(data_dir, load_dir, table.lower() + ".tbl.csv"))
+            with tr.DecompressingReader(filepath, compression) as in_file:
+                copy_stream(conn, in_file, table, column_types, pool, freeze=True)
+                data_bytes = in_file.size
             conn.commit()
-        except Exception as e:
-            print("unable to run index tables. %s" % e)
+            return table, dt.datetime.now() - started, os.path.getsize(filepath), data_bytes
+        finally:
+            conn.close()
+
+    try:
+        create_statements = schema.create_table_statements(
+            schema.read_statements(os.path.join(query_root, prep_query_dir, "create_tbl.sql")))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            timings = list(executor.map(load_table, tables))
+        if result is not None:
+            set_throughput_metrics(result, sum(t[2] for t in timings), sum(t[3] for t in timings),
+                                   time.perf_counter() - start)
+            for table, duration, file_bytes, data_bytes in timings:
+                result.setMetric(LOAD_TABLE_METRIC % table.lower(), duration)
+        print("created and loaded %s tables with COPY FREEZE" % len(tables))
+        return 0
+    except Exception as e:
+        print("unable to run load tables. %s" % e)
+        return 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def run_per_table(host, port, db_name, user, password, tables, statement, num_jobs=1, result=None, metric=None):
+    """Runs a statement for every table, on up to num_jobs autocommit connections at once.
+
+    Args:
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        tables (str): list of tables
+        statement (str): statement with a placeholder %s for the table name
+        num_jobs (int): number of statements running at the same time
+        result (Result): optional result object for per table timings
+        metric (str): metric name with a placeholder %s for the table name
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    def run(table):
+        conn = pgdb.connect(host, port, db_name, user, password)
+        try:
+            conn.setAutocommit(True)
+            started = dt.datetime.now()
+            conn.executeQuery(statement % table)
+            return table, dt.datetime.now() - started
+        finally:
+            conn.close()
+
+    try:
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            timings = list(executor.map(run, tables))
+        if result is not None and metric is not None:
+            for table, duration in timings:
+                result.setMetric(metric % table.lower(), duration)
+        return 0
+    except Exception as e:
+        print("unable to run %s. %s" % (statement % "<table>", e))
+        return 1
+
+
+def set_logged(host, port, db_name, user, password, tables, num_jobs=1):
+    """Switches tables created as UNLOGGED to LOGGED, after they were loaded without writing WAL.
+
+    Args:
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        tables (str): list of tables
+        num_jobs (int): number of tables switched at the same time
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    return run_per_table(host, port, db_name, user, password, tables, "ALTER TABLE %s SET LOGGED", num_jobs)
+
+
+def vacuum_analyze(host, port, db_name, user, password, tables, num_jobs=1, result=None):
+    """Vacuums, freezes and analyzes the freshly loaded tables, so that the first queries
+    do not pay for setting hint bits and the visibility map, and have statistics.
+
+    Args:
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        tables (str): list of tables
+        num_jobs (int): number of tables vacuumed at the same time
+        result (Result): optional result object for per table timings
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    return run_per_table(host, port, db_name, user, password, tables, "VACUUM (FREEZE, ANALYZE) %s", num_jobs,
+                         result, VACUUM_METRIC)
+
+
+def set_throughput_metrics(result, file_bytes, data_bytes, seconds):
+    """Records how fast the data files were read (compressed size) and loaded (uncompressed size).
+
+    Args:
+        result (Result): result object for the metrics
+        file_bytes (int): size of the data files on disk
+        data_bytes (int): size of the uncompressed data
+        seconds (float): time needed for loading
+    """
+    mb = 1024 * 1024
+    result.setMetric("load_data_file_mb", file_bytes / mb)
+    result.setMetric("load_data_uncompressed_mb", data_bytes / mb)
+    result.setMetric("load_data_file_mb_per_s", file_bytes / mb / seconds if seconds else 0)
+    result.setMetric("load_data_uncompressed_mb_per_s", data_bytes / mb / seconds if seconds else 0)
+
+
+def copy_from_pipe(fifo_path, conn, table, opened, errors, kill, column_types=None, pool=None):
+    """Loads one table from a named pipe, stripping the trailing delimiters on the fly.
+    Runs in its own thread, the transaction is committed by the caller.
+
+    Args:
+        fifo_path (str): named pipe dbgen writes into
+        conn (PGDB): open connection used only by this thread
+        table (str): name of the table
+        opened (threading.Event): set as soon as the pipe is open for reading
+        errors (list): collects error messages of failed threads
+        kill (function): stops all dbgen processes, called on errors so no writer blocks forever
+        column_types (dict): column types per table to load in binary format, None to load in text format
+        pool (Pool): optional process pool for encoding in binary format
+    """
+    try:
+        with open(fifo_path, "rb") as pipe:
+            opened.set()
+            copy_stream(conn, tr.StrippedReader(pipe), table, column_types, pool)
+    except Exception as e:
+        errors.append("unable to load table %s from %s. %s" % (table, fifo_path, e))
+        opened.set()
+        kill()
+
+
+def load_tables_direct(dbgen_dir, host, port, db_name, user, password, tables, scale, num_jobs=1,
+                       column_types=None):
+    """Generates the data with dbgen and streams it directly into the tables through named pipes,
+    without writing any data files. Runs one dbgen process and one COPY per pipe, all at once.
+    Expects that tables are already empty.
+
+    Args:
+        dbgen_dir (str): Directory in which the dbgen binary is placed.
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        tables (str): list of tables
+        scale (float): Amount of data to be generated. 1 = 1GB.
+        num_jobs (int): number of chunks each of the large tables is split into, each with its own pipe
+        column_types (dict): column types per table to load in binary format, encoded by a pool of
+                             num_jobs processes, or None to load in text format
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    fifo_dir = tempfile.mkdtemp(prefix="tpch_fifo_")
+    pool = Pool(num_jobs) if column_types is not None else None
+    processes = []
+    threads = []
+    connections = []
+    errors = []
+
+    def kill():
+        for p in processes:
+            if p.poll() is None:
+                p.kill()
+
+    try:
+        pipelines = prep.dbgen_pipelines(tables, num_jobs)
+        # create all pipes first, dbgen would write ordinary files otherwise
+        for args, files in pipelines:
+            for table, fname in files:
+                os.mkfifo(os.path.join(fifo_dir, fname))
+        for args, files in pipelines:
+            for table, fname in files:
+                conn = pgdb.connect(host, port, db_name, user, password)
+                connections.append(conn)
+                opened = threading.Event()
+                t = threading.Thread(target=copy_from_pipe,
+                                     args=(os.path.join(fifo_dir, fname), conn, table.upper(), opened, errors, kill,
+                                           column_types, pool))
+                threads.append((t, opened, os.path.join(fifo_dir, fname)))
+                t.start()
+        env = os.environ.copy()
+        env["DSS_PATH"] = fifo_dir
+        for args, files in pipelines:
+            processes.append(subprocess.Popen([os.path.join(".", "dbgen"), "-f", "-s", str(scale)] + args,
+                                              cwd=dbgen_dir, env=env))
+        for p in processes:
+            p.wait()
+        # a reader whose pipe was never opened by dbgen would block forever, release it with an empty write
+        for t, opened, fifo_path in threads:
+            while t.is_alive() and not opened.is_set():
+                try:
+                    os.close(os.open(fifo_path, os.O_WRONLY | os.O_NONBLOCK))
+                except OSError:
+                    pass  # the reader is not waiting on the pipe yet
+                t.join(0.1)
+        for t, opened, fifo_path in threads:
+            t.join()
+        failed = [p.returncode for p in processes if p.returncode]
+        if failed:
+            errors.append("%s of %s dbgen processes failed" % (len(failed), len(processes)))
+        if errors:
+            for error in errors:
+                print(error)
             return 1
-        conn.close()
+        for conn in connections:
+            conn.commit()
+        print("loaded %s tables through %s pipes" % (len(tables), len(threads)))
         return 0
     except Exception as e:
-        print("unable to connect to the database. %s" % e)
+        kill()
+        print("unable to run direct load tables. %s" % e)
         return 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+        for conn in connections:
+            conn.close()
+        shutil.rmtree(fifo_dir, ignore_errors=True)
+
+
+def index_tables(query_root, host, port, db_name, user, password, prep_query_dir, result=None, num_jobs=1,
+                 settings=None):
+    """Creates indexes and foreign keys for loaded tables, with any number of connections through
+    index_tables_parallel(), so that the time of every statement is recorded with a single one too.
+
+    Args:
+        query_root (str): Directory in which preparation queries directory exists
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        prep_query_dir (str): directory with create index script
+        result (Result): optional result object for per statement timings, see index_tables_parallel()
+        num_jobs (int): number of connections creating indexes at the same time, see index_tables_parallel()
+        settings (dict): session settings, e.g. maintenance_work_mem, applied before creating the indexes
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    return index_tables_parallel(query_root, host, port, db_name, user, password, prep_query_dir,
+                                 result, num_jobs, settings)
+
+
+def index_tables_parallel(query_root, host, port, db_name, user, password, prep_query_dir, result, num_jobs,
+                          settings=None):
+    """Creates indexes and foreign keys for loaded tables through a pool of connections.
+    The statements of the create index script are run as soon as the statements they depend on
+    are finished (see schema.index_graph()), each in its own transaction.
+
+    Args:
+        query_root (str): Directory in which preparation queries directory exists
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        prep_query_dir (str): directory with create index script
+        result (Result): optional result object for per statement timings
+        num_jobs (int): number of connections creating indexes at the same time
+        settings (dict): session settings, e.g. maintenance_work_mem, applied to every connection
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def run_statement(node):
+        if getattr(local, "conn", None) is None:
+            local.conn = pgdb.connect(host, port, db_name, user, password)
+            with lock:
+                connections.append(local.conn)
+            if settings:
+                local.conn.setSession(settings)
+        started = dt.datetime.now()
+        local.conn.executeQuery(node["sql"])
+        local.conn.commit()
+        return dt.datetime.now() - started
+
+    try:
+        nodes = schema.index_graph(schema.read_statements(os.path.join(query_root, prep_query_dir,
+                                                                       "create_idx.sql")))
+        waiting = list(nodes)
+        finished = set()
+        running = dict()
+        with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+            while waiting or running:
+                for node in [n for n in waiting if finished.issuperset(n["depends"])]:
+                    waiting.remove(node)
+                    running[executor.submit(run_statement, node)] = node
+                if not running:
+                    raise ValueError("circular dependencies between %s" % [n["name"] for n in waiting])
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    duration = future.result()
+                    finished.add(node["name"])
+                    if result is not None:
+                        result.setMetric(INDEX_METRIC % node["name"], duration)
+        print("created %s indexes and constraints with %s connections" % (len(nodes), len(connections)))
+        return 0
+    except Exception as e:
+        print("unable to run index tables. %s" % e)
+        return 1
+    finally:
+        for conn in connections:
+            conn.close()
+
+
+def copy_database(host, port, user, password, source, target):
+    """Recreates a database as a copy of another one with CREATE DATABASE ... TEMPLATE,
+    which copies the data files instead of loading and indexing the data again.
+    Connections to both databases are terminated first, as the copy requires that nobody uses them.
+    Source and target have to differ, as the target is dropped before the copy.
+
+    Args:
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        user (str): user for the PG instance, needs the CREATEDB privilege
+        password (str): password for the PG instance
+        source (str): name of the database to be copied
+        target (str): name of the database to be (re)created
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    if source == target:
+        # the target is dropped first, so the copy would destroy the only database there is
+        print("unable to copy database %s onto itself, the template needs a name of its own" % source)
+        return 1
+    try:
+        # pooled connections to both databases would be terminated anyway
+        pgdb.close_pools(source)
+        pgdb.close_pools(target)
+        conn = pgdb.PGDB(host, port, MAINTENANCE_DB, user, password)
+        try:
+            conn.setAutocommit(True)
+            conn.executeQuery("SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                              "WHERE datname IN (%s, %s) AND pid <> pg_backend_pid()", (source, target))
+            conn.executeQuery(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(target)))
+            # since PostgreSQL 15 the default strategy writes every block into the WAL, copying the files is faster
+            strategy = " STRATEGY FILE_COPY" if conn.serverVersion() >= FILE_COPY_VERSION else ""
+            conn.executeQuery(sql.SQL("CREATE DATABASE {} TEMPLATE {}" + strategy).format(sql.Identifier(target),
+                                                                                       sql.Identifier(source)))
+        finally:
+            conn.close()
+        print("copied database %s to %s" % (source, target))
+        return 0
+    except Exception as e:
+        print("unable to copy database %s to %s. %s" % (source, target, e))
+        return 1
+
+
+def save_template(host, port, db_name, user, password, template):
+    """Saves the loaded and indexed database as a template, see reset_database()
+
+    Args:
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        template (str): name of the template database
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    return copy_database(host, port, user, password, db_name, template)
+
+
+def reset_database(host, port, db_name, user, password, template):
+    """Recreates the tpch database from the template saved by the load phase,
+    undoing the changes of the refresh functions of an earlier query phase
+
+    Args:
+        host (str): IP/hostname of the PG instance
+        port (int): port for the PG instance
+        db_name (str): name of the tpch database
+        user (str): user for the PG instance
+        password (str): password for the PG instance
+        template (str): name of the template database
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    return copy_database(host, port, user, password, template, db_name)
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import queue
+import random
+import threading
+
+from tpch4pgsql import postgresqldb as pgdb, query, result as r, stats
+
+OPEN_LOOP = "openloop"  # folder of a run with the results of the open-loop test
+HISTOGRAMS = "Histograms.json"
+ARRIVALS = ["poisson", "fixed"]
+DEFAULT_ARRIVAL = "poisson"
+DEFAULT_DURATION = 600  # seconds
+DEFAULT_MAX_IN_FLIGHT = 16
+PERCENTILES = [("p50", 50), ("p90", 90), ("p99", 99), ("p999", 99.9)]
+OPEN_LOOP_METRIC = "openloop_query_%s_%s_%s"  # query number or all, service or response, statistic
+
+
+def arrival_times(rate, duration, arrival=DEFAULT_ARRIVAL, seed=None):
+    """Generate the intended start times of the queries
+
+    :param rate: arrivals per second
+    :param duration: seconds during which queries arrive
+    :param arrival: poisson for exponentially distributed gaps, fixed for equal gaps
+    :param seed: seed of the Poisson process, None for a random one
+    :return: iterator of seconds since the start of the test
+    """
+    rng = random.Random(seed)
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        if t >= duration:
+            return
+        yield t
+
+
+def query_mix(query_sets):
+    """Cycle through the queries of the streams, each in the order of QUERY_ORDER with its own substitution
+    parameters, so that every query type arrives equally often
+
+    :param query_sets: list of query.QuerySet
+    :return: endless iterator of tuples (query number, list of statements)
+    """
+    while True:
+        for query_set in query_sets:
+            for q, statements in query_set.getQueries():
+                yield q, statements
+
+
+class OpenLoopRecorder:
+    """Latency histograms of the open-loop test per query type, thread safe
+
+    The service time runs from sending a query to its end, as a closed-loop client would measure it. The
+    response time runs from the intended start, the arrival, to the end, so it includes the time the query
+    waited for a free slot. It is corrected for coordinated omission: when the server slows down, a
+    closed-loop client sends less and never measures the queueing delay the arrivals would have seen.
+    Arrivals dropped at the end of the test are recorded in the response histograms as well, with the time
+    they waited until the end as a lower bound, so that the worst served arrivals are not left out.
+
+    """
+    def __init__(self):
+        self.__lock__ = threading.Lock()
+        self.__histograms__ = dict()  # (query number, kind) -> stats.LatencyHistogram
+        self.__errors__ = 0
+        self.__dropped__ = 0
+
+    def record(self, q, service, response):
+        with self.__lock__:
+            for key, seconds in (((q, "service"), service), ((q, "response"), response),
+                                 (("all", "service"), service), (("all", "response"), response)):
+                if key not in self.__histograms__:
+                    self.__histograms__[key] = stats.LatencyHistogram()
+                self.__histograms__[key].record(seconds)
+
+    def recordDropped(self, q, waited):
+        """
+        :param waited: seconds from the arrival to the end of the test, a lower bound of the response time
+        """
+        with self.__lock__:
+            for key in ((q, "response"), ("all", "response")):
+                if key not in self.__histograms__:
+                    self.__histograms__[key] = stats.LatencyHistogram()
+                self.__histograms__[key].record(waited)
+            self.__dropped__ += 1
+
+    def getDropped(self):
+        with self.__lock__:
+            return self.__dropped__
+
+    def recordError(self):
+        with self.__lock__:
+            self.__errors__ += 1
+
+    def getErrors(self):
+        with self.__lock__:
+            return self.__errors__
+
+    def getHistograms(self):
+        """
+        :return: dictionary with tuple (query number or "all", "service" or "response") as key
+        and stats.LatencyHistogram as value
+        """
+        with self.__lock__:
+            return dict(self.__histograms__)
+
+
+def run_worker(conn, work, slots, recorder, itersize, verbose):
+    """Run the queries handed to a worker until it gets None, on its own connection
+
+    :param conn: open connection to the database, closed at the end
+    :param work: queue.Queue of tuples (query number, list of statements, intended start as perf_counter)
+    :param slots: semaphore bounding the queries in flight, released when a query ends
+    :param recorder: OpenLoopRecorder
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip
+    :param verbose: True if more verbose output is required
+    """
+    try:
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            q, statements, intended = item
+            start = time.perf_counter()
+            try:
+                conn.runStatements(statements, itersize)
+                conn.commit()
+                end = time.perf_counter()
+                recorder.record(q, end - start, end - intended)
+            except Exception as e:
+                if verbose:
+                    print("unable to execute query %s: %s" % (q, e))
+                conn.rollback()
+                recorder.recordError()
+            finally:
+                slots.release()
+    finally:
+        conn.close()
+
+
+def run_open_loop(query_root, generated_query_dir, results_dir, host, port, database, user, password,
+                  run_timestamp, num_streams, verbose, rate, duration=DEFAULT_DURATION, arrival=DEFAULT_ARRIVAL,
+                  max_in_flight=DEFAULT_MAX_IN_FLIGHT, itersize=None, seed=None):
+    """Run the generated queries as an open-loop test: queries arrive at a target rate, independent of how
+    fast earlier queries finish, and at most max_in_flight run at once; further arrivals wait for a slot.
+    Unlike the closed-loop throughput test, this shows the queueing latency under overload.
+
+    The queries of the streams 1..num_streams are mixed, see query_mix(); no refresh functions are run.
+    Every stream needs a query set of its own from the prepare phase, or nothing is run.
+    The percentiles of the service and response times, see OpenLoopRecorder, of every query type and of all
+    queries are saved as openloop/OpenLoop.json, the histograms as openloop/Histograms.json in the folder
+    of the run.
+
+    :param query_root: directory where generated SQL statements are stored
+    :param generated_query_dir: subdirectory with generated queries
+    :param results_dir: path to the results folder
+    :param host: hostname where the Postgres database is running
+    :param port: port number where the Postgres database is listening
+    :param database: database name, where the benchmark will be run
+    :param user: username of the Postgres user with full access to the benchmark DB
+    :param password: password for the Postgres user
+    :param run_timestamp: name of the run folder, format run_YYYYMMDD_HHMMSS
+    :param num_streams: number of query streams whose queries are mixed
+    :param verbose: True if more verbose output is required
+    :param rate: target arrivals per second
+    :param duration: seconds during which queries arrive; arrivals that find no free slot before the end
+    are dropped and enter the response times with the time until the end, queries in flight at the end are
+    waited for
+    :param arrival: poisson or fixed, see arrival_times()
+    :param max_in_flight: maximum number of queries running at once, i.e. number of connections
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip
+    :param seed: seed of the arrival process, None for a random one
+    :return: 0 if successful, 1 otherwise
+    """
+    num_sets = query.count_query_sets(query_root, generated_query_dir)
+    if num_sets <= num_streams:
+        print("the open-loop test needs query sets for streams 1 to %s, but there are %s; run the prepare phase "
+              "with --num-streams %s" % (num_streams, max(0, num_sets - 1), num_streams))
+        return 1
+    try:
+        print("Open-loop test started with %s queries per second ..." % rate)
+        query_sets = [query.QuerySet(query_root, generated_query_dir, stream) for stream in range(1, num_streams + 1)]
+        recorder = OpenLoopRecorder()
+        work = queue.Queue()
+        slots = threading.Semaphore(max_in_flight)
+        workers = []
+        try:
+            for i in range(max_in_flight):
+                conn = pgdb.connect(host, port, database, user, password)
+                worker = threading.Thread(target=run_worker, args=(conn, work, slots, recorder, itersize, verbose))
+                worker.start()
+                workers.append(worker)
+            mix = query_mix(query_sets)
+            sent = 0
+            late = stats.LatencyHistogram()  # how late the queries were sent, because all slots were busy
+            start = time.perf_counter()
+            deadline = start + duration
+            offsets = arrival_times(rate, duration, arrival, seed)
+            for offset in offsets:
+                intended = start + offset
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                q, statements = next(mix)
+                # no slot before the end of the test: this and all later arrivals are dropped
+                if not slots.acquire(timeout=max(0, deadline - time.perf_counter())):
+                    recorder.recordDropped(q, deadline - intended)
+                    for offset in offsets:
+                        recorder.recordDropped(next(mix)[0], duration - offset)
+                    break
+                work.put((q, statements, intended))
+                late.record(time.perf_counter() - intended)
+                sent += 1
+        finally:
+            for worker in workers:
+                work.put(None)
+            for worker in workers:
+                worker.join()
+        elapsed = time.perf_counter() - start
+        #
+        res = r.Result("OpenLoop")
+        histograms = recorder.getHistograms()
+        completed = histograms[("all", "service")].getCount() if ("all", "service") in histograms else 0
+        dropped = recorder.getDropped()
+        res.setMetric("openloop_arrivals", sent + dropped)
+        res.setMetric("openloop_dropped", dropped)
+        res.setMetric("openloop_dropped_share", dropped / (sent + dropped) if sent + dropped else 0.0)
+        res.setMetric("openloop_completed", completed)
+        res.setMetric("openloop_errors", recorder.getErrors())
+        res.setMetric("openloop_target_rate", rate)
+        res.setMetric("openloop_achieved_rate", completed / elapsed)
+        res.setMetric("openloop_send_delay_p99", late.getPercentile(99))
+        res.setMetric("openloop_send_delay_max", late.getMax())
+        for (q, kind), histogram in histograms.items():
+            res.setMetric(OPEN_LOOP_METRIC % (q, kind, "count"), histogram.getCount())
+            res.setMetric(OPEN_LOOP_METRIC % (q, kind, "mean"), histogram.getMean())
+            for name, p in PERCENTILES:
+                res.setMetric(OPEN_LOOP_METRIC % (q, kind, name), histogram.getPercentile(p))
+            res.setMetric(OPEN_LOOP_METRIC % (q, kind, "max"), histogram.getMax())
+        if verbose:
+            res.printMetrics()
+        res.saveMetrics(results_dir, run_timestamp, OPEN_LOOP)
+        save_histograms(results_dir, run_timestamp, histograms)
+        for kind in ["service", "response"]:
+            if ("all", kind) in histograms:
+                histogram = histograms[("all", kind)]
+                censored = " (%.1f%% dropped, censored at the end of the test)" % (100.0 * dropped / (sent + dropped)) \
+                    if kind == "response" and dropped else ""
+                print("%s time: %s%s" % (kind, ", ".join("%s = %.3fs" % (name, histogram.getPercentile(p))
+                                                          for name, p in PERCENTILES), censored))
+        print("Open-loop test finished: %s of %s queries completed, %.2f per second, %s dropped, %s errors." %
+              (completed, sent + dropped, completed / elapsed, dropped, recorder.getErrors()))
+    except Exception as e:
+        print("unable to run the open-loop test: %s" % e)
+        return 1
+    return 0
+
+
+def save_histograms(results_dir, run_timestamp, histograms):
+    """Save the histograms as a list of their non-empty buckets, with the highest value of a bucket in
+    microseconds, so that they can be merged or plotted later
+
+    :param histograms: dictionary of histograms, see OpenLoopRecorder.getHistograms()
+    """
+    path = os.path.join(results_dir, run_timestamp, OPEN_LOOP)
+    os.makedirs(path, exist_ok=True)
+    saved = [{"query": q, "kind": kind,
+              "buckets": [[stats.LatencyHistogram.highestValueOf(bucket), count]
+                          for bucket, count in histogram.getBuckets()]}
+             for (q, kind), histogram in sorted(histograms.items(), key=lambda item: str(item[0]))]
+    with open(os.path.join(path, HISTOGRAMS), "w") as json_file:
+        json.dump(saved, json_file)
@@ -0,0 +1,157 @@
+import re
+import struct
+import datetime as dt
+from collections import deque
+from functools import lru_cache
+
+from tpch4pgsql import transform as tr
+
+# Encoder for the binary format of COPY, see https://www.postgresql.org/docs/current/sql-copy.html
+
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)  # signature, flags, header extension length
+TRAILER = struct.pack("!h", -1)
+PG_EPOCH = dt.date(2000, 1, 1)
+NUMERIC_NEG = 0x4000
+NUMERIC_POS = 0x0000
+CACHE_SIZE = 65536  # per column type and process; dates and most decimals of dbgen repeat a lot
+IN_FLIGHT_BLOCKS = 4  # blocks encoded ahead of each reader, bounds the memory used
+
+# column types of create_tbl.sql mapped onto the encoders below
+TYPES = {"SERIAL": "int4", "INTEGER": "int4", "INT": "int4",
+         "DECIMAL": "numeric", "NUMERIC": "numeric",
+         "DATE": "date",
+         "CHAR": "text", "VARCHAR": "text", "TEXT": "text"}
+COLUMN_RE = re.compile(r"^\s*(\w+)\s+(\w+)")
+TABLE_RE = re.compile(r"CREATE\s+TABLE\s+(\w+)\s*\((.*?)\)\s*(?:PARTITION\s+BY[^;]*)?;", re.IGNORECASE | re.DOTALL)
+INT4 = struct.Struct("!ii").pack  # field length and value
+LENGTH = struct.Struct("!i").pack
+
+
+def read_column_types(filepath):
+    """Read the column types of all tables from the schema script
+
+    :param filepath: path to create_tbl.sql
+    :return: dictionary with upper case table name as key and list of encoder types as value
+    """
+    with open(filepath) as sql_file:
+        sql = re.sub(r"--[^\n]*", "", sql_file.read())
+    column_types = dict()
+    for table, body in TABLE_RE.findall(sql):
+        types = []
+        for column in body.split(","):
+            match = COLUMN_RE.match(column)
+            if match:
+                types.append(TYPES[match.group(2).upper()])
+        column_types[table.upper()] = types
+    return column_types
+
+
+def encode_int4(value):
+    return INT4(4, int(value))
+
+
+def encode_text(value):
+    return LENGTH(len(value)) + value
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def encode_date(value):
+    days = (dt.date(int(value[0:4]), int(value[5:7]), int(value[8:10])) - PG_EPOCH).days
+    return INT4(4, days)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def encode_numeric(value):
+    """Encode a decimal number given as text into the binary numeric format,
+    which stores base 10000 digits with a weight of the first digit
+
+    :param value: decimal number as bytes, e.g. b"-1234.56"
+    :return: binary field incl. its length
+    """
+    sign = NUMERIC_NEG if value.startswith(b"-") else NUMERIC_POS
+    integer, _, fraction = value.lstrip(b"-+").partition(b".")
+    integer = integer.lstrip(b"0")
+    dscale = len(fraction)
+    # pad both parts to whole base 10000 digits, aligned at the decimal point
+    integer = integer.rjust(-(-len(integer) // 4) * 4, b"0")
+    fraction = fraction.ljust(-(-len(fraction) // 4) * 4, b"0")
+    padded = integer + fraction
+    digits = [int(padded[i:i + 4]) for i in range(0, len(padded), 4)]
+    weight = len(integer) // 4 - 1
+    while digits and digits[0] == 0:
+        digits.pop(0)
+        weight -= 1
+    while digits and digits[-1] == 0:
+        digits.pop()
+    if not digits:
+        weight, sign = 0, NUMERIC_POS
+    data = struct.pack("!hhhh%dh" % len(digits), len(digits), weight, sign, dscale, *digits)
+    return LENGTH(len(data)) + data
+
+
+ENCODERS = {"int4": encode_int4, "numeric": encode_numeric, "date": encode_date, "text": encode_text}
+
+
+def encode_block(block, types):
+    """Encode a block of complete lines of a data file into binary COPY tuples
+
+    :param block: bytes with lines of "|" separated values, without trailing delimiter
+    :param types: list of encoder types of the columns
+    :return: bytes with one binary tuple per line, without header and trailer
+    """
+    encoders = [ENCODERS[t] for t in types]
+    tuple_header = struct.pack("!h", len(types))
+    out = []
+    append = out.append
+    extend = out.extend
+    for line in block.split(b"\n"):
+        if line:
+            append(tuple_header)
+            extend([encode(value) for encode, value in zip(encoders, line.split(b"|"))])
+    return b"".join(out)
+
+
+def line_blocks(in_file, block_size=tr.PIPE_BLOCK_SIZE):
+    """Read a data file in blocks of complete lines
+
+    :param in_file: binary file object with the text data
+    :param block_size: number of bytes read at once
+    :return: generator of blocks, each ending with a newline, except maybe the last one
+    """
+    rest = b""
+    for block in iter(lambda: in_file.read(block_size), b""):
+        block = rest + block
+        end = block.rfind(b"\n") + 1
+        rest = block[end:]
+        if end:
+            yield block[:end]
+    if rest:
+        yield rest
+
+
+class BinaryCopyReader(tr.BlockReader):
+    """Binary file-like object converting a text data file into a binary COPY stream
+
+    Lines are converted block by block. With a process pool the blocks are encoded by the
+    workers, several blocks ahead of the reader, so that encoding keeps up with COPY; readers
+    loading several tables at once may share one pool.
+
+    """
+    def __init__(self, in_file, types, pool=None):
+        super().__init__(self.__encoded__(in_file, types, pool))
+
+    @staticmethod
+    def __encoded__(in_file, types, pool):
+        yield HEADER
+        if pool is None:
+            for block in line_blocks(in_file):
+                yield encode_block(block, types)
+        else:
+            pending = deque()
+            for block in line_blocks(in_file):
+                pending.append(pool.apply_async(encode_block, (block, types)))
+                if len(pending) >= IN_FLIGHT_BLOCKS:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+        yield TRAILER
@@ -0,0 +1,137 @@
+import os
+import json
+import hashlib
+
+from tpch4pgsql import postgresqldb as pgdb, query, result as r
+
+PLANS = "plans"  # folder of a run with the captured plans, next to power and throughput
+PLAN_FILE = "stream_%s_query_%s.json"
+FINGERPRINTS = "Fingerprints"
+EXPLAIN_OPTIONS = "ANALYZE, BUFFERS, FORMAT JSON"
+# properties of a plan node that make up its shape; costs, row counts, timings, buffers and conditions
+# with their literal values differ from run to run and stream to stream without the plan changing
+NODE_KEYS = ["Node Type", "Strategy", "Partial Mode", "Parent Relationship", "Join Type", "Scan Direction",
+             "Relation Name", "Index Name", "Subplan Name", "CTE Name"]
+
+
+def normalize_plan(node):
+    """Reduce a plan node of EXPLAIN (FORMAT JSON) and its children to their shape
+
+    :param node: plan node, i.e. a dictionary with "Node Type"
+    :return: dictionary with the properties in NODE_KEYS and the normalized children as "Plans"
+    """
+    normalized = dict((key, node[key]) for key in NODE_KEYS if key in node)
+    if "Plans" in node:
+        normalized["Plans"] = [normalize_plan(child) for child in node["Plans"]]
+    return normalized
+
+
+def plan_fingerprint(plans):
+    """Fingerprint of the plans of a query, equal for plans of the same shape, see normalize_plan()
+
+    :param plans: list of plans as returned by EXPLAIN (FORMAT JSON), one per statement
+    :return: fingerprint as hex string
+    """
+    shapes = [[normalize_plan(explained["Plan"]) for explained in plan] for plan in plans]
+    return hashlib.sha1(json.dumps(shapes, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def capture_plans(conn, query_set, stream, verbose):
+    """Run the queries of a stream with EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+
+    :param conn: open connection to the database
+    :param query_set: queries of the stream, see query.QuerySet
+    :param stream: stream number
+    :param verbose: True if more verbose output is required
+    :return: dictionary with query number as key and list of plans as value
+    """
+    captured = dict()
+    for q, statements in query_set.getQueries():
+        if verbose:
+            print("Explaining query #%s in stream #%s ..." % (q, stream))
+        captured[q] = conn.explainStatements(statements, EXPLAIN_OPTIONS)
+    return captured
+
+
+def load_fingerprints(results_dir, run_timestamp):
+    """Load the plan fingerprints of a run
+
+    :return: dictionary with metric name as key and fingerprint as value, empty if no plans were captured
+    """
+    path = os.path.join(results_dir, run_timestamp, PLANS, FINGERPRINTS + ".json")
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as json_file:
+        return json.load(json_file)
+
+
+def previous_fingerprints(results_dir, run_timestamp):
+    """Find the plan fingerprints of the latest run before this one that captured plans
+
+    :return: tuple (name of the run folder, dictionary of fingerprints), (None, {}) if there is none
+    """
+    runs = sorted((run for run in os.listdir(results_dir) if run.startswith("run_") and run < run_timestamp),
+                  reverse=True)
+    for run in runs:
+        fingerprints = load_fingerprints(results_dir, run)
+        if fingerprints:
+            return run, fingerprints
+    return None, dict()
+
+
+def run_explain(query_root, generated_query_dir, results_dir, host, port, database, user, password,
+                run_timestamp, streams, verbose):
+    """Capture the plans of the queries in a separate pass after the performance tests, so that their
+    timings are not disturbed, and compare their fingerprints with the latest run that captured plans.
+
+    The plans are saved as plans/stream_S_query_Q.json, the fingerprints as plans/Fingerprints.json and
+    the queries whose plan changed as plans/PlanChanges.json in the folder of the run.
+
+    :param query_root: directory where generated SQL statements are stored
+    :param generated_query_dir: subdirectory with generated queries
+    :param results_dir: path to the results folder
+    :param host: hostname where the Postgres database is running
+    :param port: port number where the Postgres database is listening
+    :param database: database name, where the benchmark will be run
+    :param user: username of the Postgres user with full access to the benchmark DB
+    :param password: password for the Postgres user
+    :param run_timestamp: name of the run folder, format run_YYYYMMDD_HHMMSS
+    :param streams: numbers of the streams whose queries are explained, 0 for the power test
+    :param verbose: True if more verbose output is required
+    :return: 0 if successful, 1 otherwise
+    """
+    try:
+        print("Capturing query plans ...")
+        path = os.path.join(results_dir, run_timestamp, PLANS)
+        os.makedirs(path, exist_ok=True)
+        fingerprints = r.Result(FINGERPRINTS)
+        current = dict()
+        conn = pgdb.connect(host, port, database, user, password)
+        try:
+            for stream in streams:
+                query_set = query.QuerySet(query_root, generated_query_dir, stream)
+                for q, plans in capture_plans(conn, query_set, stream, verbose).items():
+                    with open(os.path.join(path, PLAN_FILE % (stream, q)), "w") as plan_file:
+                        json.dump(plans, plan_file, indent=2)
+                    name = query.QUERY_METRIC % (stream, q)
+                    current[name] = plan_fingerprint(plans)
+                    fingerprints.setMetric(name, current[name])
+        finally:
+            conn.close()
+        fingerprints.saveMetrics(results_dir, run_timestamp, PLANS)
+        #
+        previous_run, previous = previous_fingerprints(results_dir, run_timestamp)
+        if previous_run is not None:
+            changes = r.Result("PlanChanges")
+            changes.setMetric("previous_run", previous_run)
+            changed = sorted(name for name in current if name in previous and previous[name] != current[name])
+            for name in changed:
+                print("plan of %s changed since %s" % (name, previous_run))
+                changes.setMetric(name, "%s -> %s" % (previous[name], current[name]))
+            changes.saveMetrics(results_dir, run_timestamp, PLANS)
+            print("%s of %s plans changed since %s" % (len(changed), len(current), previous_run))
+        print("Query plans captured.")
+    except Exception as e:
+        print("unable to capture query plans: %s" % e)
+        return 1
+    return 0
@@ -1,4 +1,95 @@
+import os
+import json
+import time
+import threading
+import datetime as dt
+
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import psycopg2.extras
+
+CHECKOUT_TIMEOUT = 300  # seconds to wait for a connection of a full pool before giving up
+DEFAULT_BATCH_SIZE = 100  # parameter tuples sent in one round trip, see PGBatch
+DEFAULT_ITERSIZE = 2000  # rows fetched in one round trip by a server-side cursor, see PGDB.runStatements()
+FETCH_CURSOR = "tpch_fetch"
+# connection settings of this process, see configure()
+CONFIG = {"pooling": False, "settings": None, "max_size": None, "batch_size": DEFAULT_BATCH_SIZE}
+POOLS = dict()  # pools of this process by connection parameters, see connect()
+POOLS_LOCK = threading.Lock()
+
+
+def session_options(settings):
+    """Build the libpq options string applying session settings while connecting, without a round trip
+
+    :param settings: dictionary with setting name as key, e.g. {"work_mem": "64MB"}
+    :return: options string, e.g. "-c work_mem=64MB"
+    """
+    return " ".join("-c %s=%s" % (name, str(value).replace("\\", "\\\\").replace(" ", "\\ "))
+                    for name, value in settings.items())
+
+
+def open_connection(host, port, db_name, user, password, settings=None):
+    """Open a new psycopg2 connection, passing the parameters as keywords instead of a quoted DSN
+
+    :param settings: optional session settings applied while connecting
+    :return: psycopg2 connection
+    """
+    kwargs = {"options": session_options(settings)} if settings else {}
+    return psycopg2.connect(host=host, port=port, dbname=db_name, user=user, password=password, **kwargs)
+
+
+def is_query(statement):
+    """Check if a statement returns rows, so that it can be run by a server-side cursor
+
+    :param statement: single statement without comments
+    :return: True for SELECT, WITH and VALUES statements
+    """
+    return statement.split(None, 1)[0].lower() in ("select", "with", "values")
+
+
+def text_size(row):
+    """Approximate the bytes transferred for a row, as the size of its values in text format,
+    since the drivers do not expose the bytes received
+
+    :param row: tuple or record of values
+    :return: size in bytes
+    """
+    return sum(len(str(value)) for value in row if value is not None)
+
+
+class FetchStatistics:
+    """Rows, bytes and timings of the results fetched by PGDB.runStatements(), timed from the start of the
+    first statement returning rows, so that other statements before it, e.g. creating a view, are not included
+
+    """
+    def __init__(self):
+        self.__start__ = None
+        self.__rows__ = 0
+        self.__bytes__ = 0
+        self.__first_row__ = None
+        self.__fetch__ = 0
+
+    def begin(self):
+        """Start the timer, to be called right before a statement returning rows is executed"""
+        if self.__start__ is None:
+            self.__start__ = time.perf_counter()
+
+    def add(self, rows):
+        elapsed = time.perf_counter() - self.__start__
+        if rows and self.__first_row__ is None:
+            self.__first_row__ = elapsed
+        self.__rows__ += len(rows)
+        self.__bytes__ += sum(text_size(row) for row in rows)
+        self.__fetch__ = elapsed
+
+    def getMetrics(self):
+        """
+        :return: dictionary with rows, bytes, first_row and fetch, the time until the first and the last row
+        """
+        first_row = self.__first_row__ if self.__first_row__ is not None else self.__fetch__
+        return {"rows": self.__rows__, "bytes": self.__bytes__,
+                "first_row": dt.timedelta(seconds=first_row), "fetch": dt.timedelta(seconds=self.__fetch__)}
 
 
 class PGDB:
@@ -7,20 +98,53 @@ class PGDB:
     __connection__ = None
     __cursor__ = None
 
-    def __init__(self, host, port, db_name, user, password):
+    def __init__(self, host, port, db_name, user, password, settings=None, connection=None, pool=None):
         # Exception handling is done by the method using this.
-        self.__connection__ = psycopg2.connect("host='%s' port='%s' dbname='%s' user='%s' password='%s'" %
-                                               (host, port, db_name, user, password))
+        if connection is None:
+            connection = open_connection(host, port, db_name, user, password, settings)
+        self.__connection__ = connection
         self.__cursor__ = self.__connection__.cursor()
+        self.__pool__ = pool  # connection is handed back to this pool when closed
+        self.__dirty__ = False  # session state was changed and has to be reset before reuse
+        self.__round_trips__ = 0  # statements sent by executeQuery() and executeBatch()
+
+    def setAutocommit(self, autocommit):
+        if self.__connection__ is not None:
+            self.__connection__.autocommit = autocommit
+            self.__dirty__ = True
+            return 0
+        else:
+            print("database has been closed")
+            return 1
+
+    def serverVersion(self):
+        if self.__connection__ is not None:
+            return self.__connection__.server_version
+        else:
+            print("database has been closed")
+            return 0
 
     def close(self):
         if self.__cursor__ is not None:
             self.__cursor__.close()
             self.__cursor__ = None
         if self.__connection__ is not None:
-            self.__connection__.close()
+            if self.__pool__ is not None:
+                self.__pool__.putConnection(self.__connection__, self.__dirty__)
+            else:
+                self.__connection__.close()
             self.__connection__ = None
 
+    def setSession(self, settings):
+        if self.__cursor__ is not None:
+            for name, value in settings.items():
+                self.__cursor__.execute("SET %s TO %%s" % name, (str(value),))
+            self.__dirty__ = True
+            return 0
+        else:
+            print("database has been closed")
+            return 1
+
     def executeQueryFromFile(self, filepath, function=None):
         if function is None:
             function = lambda x: x
@@ -29,14 +153,118 @@ class PGDB:
             query = function(query)
             return self.executeQuery(query)
 
-    def executeQuery(self, query):
+    def runStatements(self, statements, itersize=None, timings=None):
+        """Execute the statements of a query, e.g. of a query.QuerySet, optionally fetching the rows of every
+        query through a named server-side cursor, itersize rows per round trip, so memory stays bounded for
+        any result size. Unless the rows are fetched or the statements are timed, they are sent as one
+        script in a single round trip, like the query file.
+
+        :param statements: list of single statements
+        :param itersize: None to only execute the statements, otherwise number of rows fetched per round trip
+        :param timings: optional list, the seconds of every statement are appended to it
+        :return: dictionary of metrics if itersize is given, see FetchStatistics.getMetrics(), None otherwise
+        """
+        if self.__cursor__ is not None:
+            if not itersize and timings is None:
+                self.__cursor__.execute(";\n".join(statements))
+                self.__round_trips__ += 1
+                return None
+            statistics = FetchStatistics() if itersize else None
+            for statement in statements:
+                start = time.perf_counter()
+                if itersize and is_query(statement):
+                    self.__fetch__(statement, itersize, statistics)
+                else:
+                    self.__cursor__.execute(statement)
+                    self.__round_trips__ += 1
+                if timings is not None:
+                    timings.append(time.perf_counter() - start)
+            return statistics.getMetrics() if statistics else None
+        else:
+            print("database has been closed")
+            return None
+
+    def explainStatements(self, statements, options="FORMAT JSON"):
+        """Run EXPLAIN for the queries among the statements of a query, executing the other statements, e.g.
+        creating a view, and roll back afterwards, so that nothing is changed
+
+        :param statements: list of single statements
+        :param options: options of EXPLAIN, have to include FORMAT JSON
+        :return: list of plans, one per query, as returned by EXPLAIN
+        """
+        if self.__cursor__ is not None:
+            plans = []
+            try:
+                for statement in statements:
+                    if is_query(statement):
+                        self.__cursor__.execute("EXPLAIN (%s) %s" % (options, statement))
+                        plan = self.__cursor__.fetchone()[0]
+                        plans.append(json.loads(plan) if isinstance(plan, str) else plan)
+                    else:
+                        self.__cursor__.execute(statement)
+            finally:
+                self.__connection__.rollback()
+            return plans
+        else:
+            print("database has been closed")
+            return None
+
+    def __fetch__(self, statement, itersize, statistics):
+        with self.__connection__.cursor(name=FETCH_CURSOR) as cursor:
+            cursor.itersize = itersize
+            statistics.begin()
+            cursor.execute(statement)
+            rows = cursor.fetchmany(itersize)
+            self.__round_trips__ += 2
+            statistics.add(rows)
+            while len(rows) == itersize:
+                rows = cursor.fetchmany(itersize)
+                self.__round_trips__ += 1
+                statistics.add(rows)
+
+    def executeQuery(self, query, params=None):
+        if self.__cursor__ is not None:
+            self.__cursor__.execute(query, params)
+            self.__round_trips__ += 1
+            return 0
+        else:
+            print("database has been closed")
+            return 1
+
+    def fetchValue(self, query, params=None):
+        """
+        :return: first column of the first row returned by the query, None if there is no row
+        """
+        if self.__cursor__ is not None:
+            self.__cursor__.execute(query, params)
+            self.__round_trips__ += 1
+            row = self.__cursor__.fetchone()
+            return row[0] if row is not None else None
+        else:
+            print("database has been closed")
+            return None
+
+    def executeBatch(self, query, params_list, page_size=DEFAULT_BATCH_SIZE, values=False):
+        """Execute a parameterized statement for many parameter tuples, page_size tuples per round trip
+
+        psycopg2 does not support the pipeline mode of libpq, so the statements of a page are sent as one
+        string instead: with values=True the query has a single "VALUES %s" placeholder, which is expanded
+        into a multi-row VALUES list, otherwise the statements are joined with semicolons.
+        """
         if self.__cursor__ is not None:
-            self.__cursor__.execute(query)
+            if values:
+                psycopg2.extras.execute_values(self.__cursor__, query, params_list, page_size=page_size)
+            else:
+                psycopg2.extras.execute_batch(self.__cursor__, query, params_list, page_size=page_size)
+            self.__round_trips__ += -(-len(params_list) // page_size)
             return 0
         else:
             print("database has been closed")
             return 1
 
+    def roundTrips(self):
+        return self.__round_trips__
+
     def copyFrom(self, filepath, separator, table):
         if self.__cursor__ is not None:
             with open(filepath, 'r') as in_file:
@@ -46,6 +274,27 @@ class PGDB:
             print("database has been closed")
             return 1
 
+    def copyFromStream(self, in_file, separator, table, size=8192, freeze=False):
+        if self.__cursor__ is not None:
+            if freeze:
+                self.__cursor__.copy_expert("COPY %s FROM STDIN WITH (DELIMITER '%s', FREEZE)" % (table, separator),
+                                            in_file, size=size)
+            else:
+                self.__cursor__.copy_from(in_file, table=table, sep=separator, size=size)
+            return 0
+        else:
+            print("database has been closed")
+            return 1
+
+    def copyBinaryFromStream(self, in_file, table, size=8192, freeze=False):
+        if self.__cursor__ is not None:
+            options = "FORMAT binary, FREEZE" if freeze else "FORMAT binary"
+            self.__cursor__.copy_expert("COPY %s FROM STDIN WITH (%s)" % (table, options), in_file, size=size)
+            return 0
+        else:
+            print("database has been closed")
+            return 1
+
     def commit(self):
         if self.__connection__ is not None:
             self.__connection__.commit()
@@ -53,3 +302,215 @@ class PGDB:
         else:
             print("cursor not initialized")
             return 1
+
+    def rollback(self):
+        if self.__connection__ is not None:
+            self.__connection__.rollback()
+            return 0
+        else:
+            print("cursor not initialized")
+            return 1
+
+
+class PGPool:
+    """Pool of open connections to one database, reused across steps, phases and streams,
+    so that connection setup does not add to the timings. Session settings are applied once while
+    connecting. Idle connections are checked before every reuse, so that a connection dropped by the
+    server never reaches a timed query, and session changes made by a user are reset when the connection
+    is handed back. Thread safe.
+
+    """
+    def __init__(self, host, port, db_name, user, password, settings=None, max_size=None):
+        self.__params__ = (host, port, db_name, user, password)
+        self.__settings__ = settings
+        self.__idle__ = []  # tuples (connection, time handed back)
+        self.__lock__ = threading.Lock()
+        self.__available__ = threading.BoundedSemaphore(max_size) if max_size else None
+        self.__metrics__ = {"opened": 0, "discarded": 0, "checkouts": 0, "in_use": 0, "max_in_use": 0,
+                            "checkout_seconds": 0.0, "max_checkout_seconds": 0.0}
+
+    def getConnection(self):
+        start = time.perf_counter()
+        # waits for a connection to be handed back, fails instead of a deadlock if a step needs more than max_size
+        if self.__available__ is not None and not self.__available__.acquire(timeout=CHECKOUT_TIMEOUT):
+            raise psycopg2.pool.PoolError("no connection available in the pool after %s seconds" % CHECKOUT_TIMEOUT)
+        try:
+            connection = self.__checkout__()
+        except Exception:
+            if self.__available__ is not None:
+                self.__available__.release()
+            raise
+        seconds = time.perf_counter() - start
+        with self.__lock__:
+            metrics = self.__metrics__
+            metrics["checkouts"] += 1
+            metrics["in_use"] += 1
+            metrics["max_in_use"] = max(metrics["max_in_use"], metrics["in_use"])
+            metrics["checkout_seconds"] += seconds
+            metrics["max_checkout_seconds"] = max(metrics["max_checkout_seconds"], seconds)
+        return PGDB(*self.__params__, connection=connection, pool=self)
+
+    def __checkout__(self):
+        while True:
+            with self.__lock__:
+                if not self.__idle__:
+                    break
+                connection, returned = self.__idle__.pop()
+            if self.__healthy__(connection):
+                return connection
+            self.__discard__(connection)
+        connection = open_connection(*self.__params__, settings=self.__settings__)
+        with self.__lock__:
+            self.__metrics__["opened"] += 1
+        return connection
+
+    @staticmethod
+    def __healthy__(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    def __discard__(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self.__lock__:
+            self.__metrics__["discarded"] += 1
+
+    def putConnection(self, connection, dirty=False):
+        try:
+            if not connection.closed:
+                if connection.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                if dirty:
+                    # RESET ALL goes back to the settings applied while connecting, it must not run in a transaction
+                    connection.autocommit = True
+                    with connection.cursor() as cursor:
+                        cursor.execute("RESET ALL")
+                    connection.autocommit = False
+            healthy = not connection.closed
+        except Exception:
+            healthy = False
+        if healthy:
+            with self.__lock__:
+                self.__idle__.append((connection, time.monotonic()))
+        else:
+            self.__discard__(connection)
+        with self.__lock__:
+            self.__metrics__["in_use"] -= 1
+        if self.__available__ is not None:
+            self.__available__.release()
+
+    def closeAll(self):
+        with self.__lock__:
+            idle, self.__idle__ = self.__idle__, []
+        for connection, returned in idle:
+            connection.close()
+
+    def getMetrics(self):
+        with self.__lock__:
+            return dict(self.__metrics__)
+
+
+class PGBatch:
+    """Buffer of parameter tuples for one statement, sent with PGDB.executeBatch() instead of one round trip each
+
+    The buffer is flushed as soon as it holds batch_size tuples, or when a tuple is added more than
+    max_delay seconds after the first buffered one, and finally by flush() or at the end of a with block.
+    Batches given as before are flushed first, e.g. the orders before their line items referencing them.
+
+    """
+    def __init__(self, conn, query, batch_size=None, max_delay=None, values=False, before=None):
+        self.__conn__ = conn
+        self.__query__ = query
+        self.__batch_size__ = batch_size or CONFIG["batch_size"]
+        self.__max_delay__ = max_delay
+        self.__values__ = values
+        self.__before__ = before or []
+        self.__params__ = []
+        self.__first__ = None  # time the oldest buffered tuple was added
+
+    def add(self, params):
+        if not self.__params__:
+            self.__first__ = time.monotonic()
+        self.__params__.append(params)
+        if len(self.__params__) >= self.__batch_size__ or \
+                (self.__max_delay__ is not None and time.monotonic() - self.__first__ >= self.__max_delay__):
+            self.flush()
+
+    def flush(self):
+        for batch in self.__before__:
+            batch.flush()
+        if self.__params__:
+            params, self.__params__ = self.__params__, []
+            self.__conn__.executeBatch(self.__query__, params, page_size=len(params), values=self.__values__)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+def configure(pooling=False, settings=None, max_size=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Set up how connect() connects in this process
+
+    :param pooling: True to reuse connections through a pool per database
+    :param settings: session settings applied to every new connection, e.g. {"work_mem": "64MB"}
+    :param max_size: maximum number of connections per pool, None for no limit
+    :param batch_size: default number of parameter tuples per round trip of a PGBatch
+    """
+    CONFIG.update(pooling=pooling, settings=settings, max_size=max_size, batch_size=batch_size)
+
+
+def connect(host, port, db_name, user, password):
+    """Open a connection, or check one out of the pool of this process for these parameters if pooling
+    is enabled. Closing the returned connection hands it back to the pool. A process started by fork
+    does not reuse the connections of its parent, as the pools are kept by process id.
+
+    :return: PGDB object
+    """
+    if not CONFIG["pooling"]:
+        return PGDB(host, port, db_name, user, password, CONFIG["settings"])
+    key = (os.getpid(), host, port, db_name, user, password)
+    with POOLS_LOCK:
+        if key not in POOLS:
+            POOLS[key] = PGPool(host, port, db_name, user, password, CONFIG["settings"], CONFIG["max_size"])
+        pool = POOLS[key]
+    return pool.getConnection()
+
+
+def close_pools(db_name=None):
+    """Close the idle connections of the pools of this process, e.g. before a database is dropped
+
+    :param db_name: only close the pools of this database, None for all
+    """
+    with POOLS_LOCK:
+        pools = [pool for key, pool in POOLS.items() if key[0] == os.getpid() and db_name in (None, key[3])]
+    for pool in pools:
+        pool.closeAll()
+
+
+def pool_metrics():
+    """Summarize the metrics of all pools of this process
+
+    :return: dictionary with metric name as key, latencies as timedelta
+    """
+    with POOLS_LOCK:
+        metrics = [pool.getMetrics() for key, pool in POOLS.items() if key[0] == os.getpid()]
+    checkouts = sum(m["checkouts"] for m in metrics)
+    seconds = sum(m["checkout_seconds"] for m in metrics)
+    return {"connections_opened": sum(m["opened"] for m in metrics),
+            "connections_discarded": sum(m["discarded"] for m in metrics),
+            "connections_max_in_use": sum(m["max_in_use"] for m in metrics),
+            "connection_checkouts": checkouts,
+            "connection_checkout_avg": dt.timedelta(seconds=seconds / checkouts if checkouts else 0),
+            "connection_checkout_max": dt.timedelta(seconds=max([m["max_checkout_seconds"] for m in metrics] or [0]))}
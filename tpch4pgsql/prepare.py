@@ -1,7 +1,18 @@
 import os
 import glob
-import re
+import time
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from tpch4pgsql import transform as tr
+
+# dbgen table codes (argument of -T) and the files each of them produces
+DBGEN_CHUNKED_TABLES = {"c": ["customer"], "s": ["supplier"],
+                        "o": ["orders", "lineitem"], "p": ["part", "partsupp"]}
+# nation and region are tiny and dbgen never splits them into chunks
+DBGEN_SINGLE_TABLES = {"n": ["nation"], "r": ["region"]}
+# subdirectory of the generated queries with the query set of one stream, 0 is the power test
+QUERY_STREAM_DIR = "stream_%s"
 
 
 def build_dbgen(dbgen_dir):
@@ -22,7 +33,22 @@ def build_dbgen(dbgen_dir):
     return p.returncode
 
 
-def inner_generate_data(data_dir, dbgen_dir, file_pattern, out_ext):
+def run_dbgen(dbgen_dir, args):
+    """Runs dbgen with given arguments and waits for it to finish.
+
+    Args:
+        dbgen_dir (str): Directory in which the dbgen binary is placed.
+        args (list): command line arguments for dbgen
+
+    Return:
+        return code of dbgen, 0 if successful
+    """
+    p = subprocess.Popen([os.path.join(".", "dbgen")] + args, cwd=dbgen_dir)
+    p.communicate()
+    return p.returncode
+
+
+def inner_generate_data(data_dir, dbgen_dir, file_pattern, out_ext, num_jobs=1, compression=None):
     """Generate data for load/update/delete operations on the tables.
 
     This function is used by different stages of function generate_data(): load / update / delete
@@ -32,6 +58,8 @@ def inner_generate_data(data_dir, dbgen_dir, file_pattern, out_ext):
         dbgen_dir (str): Directory in which the source code is placed.
         file_pattern (str): file pattern
         out_ext (str): output file extension
+        num_jobs (int): number of files transformed at the same time
+        compression (str): None, "gzip" or "zstd" for compressed output files
 
     Return:
         0 if successful
@@ -39,76 +67,250 @@ def inner_generate_data(data_dir, dbgen_dir, file_pattern, out_ext):
     """
     try:
         os.makedirs(data_dir, exist_ok=True)
-        for in_fname in glob.glob(os.path.join(dbgen_dir, file_pattern)):
-            fname = os.path.basename(in_fname)
-            out_fname = os.path.join(data_dir, fname + out_ext)
-            try:
-                with open(in_fname) as in_file, open(out_fname, "w") as out_file:
-                    for inline in in_file:
-                        outline = re.sub("\|$", "", inline)
-                        out_file.write(outline)
-                os.remove(in_fname)
-            except IOError as e:
-                print("something bad happened while transforming data files. (%s)" % e)
-                return 1
     except IOError as e:
         print("unable to create data directory %s. (%s)" % (data_dir, e))
         return 1
+    jobs = []
+    for in_fname in glob.glob(os.path.join(dbgen_dir, file_pattern)):
+        fname = os.path.basename(in_fname)
+        jobs.append(([in_fname], os.path.join(data_dir, fname + out_ext), None, compression))
+    return tr.transform_files(jobs, num_jobs)
+
+
+def merge_chunks(data_dir, dbgen_dir, num_chunks, out_ext, num_jobs=1, compression=None):
+    """Merge the chunks generated by parallel dbgen runs into one file per table.
+
+    Args:
+        data_dir (str): Directory for storing the merged data files.
+        dbgen_dir (str): Directory in which the chunks were generated.
+        num_chunks (int): number of chunks each of the large tables was split into, 1 for a single file
+        out_ext (str): output file extension
+        num_jobs (int): number of tables merged at the same time
+        compression (str): None, "gzip" or "zstd" for compressed output files
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+    except IOError as e:
+        print("unable to create data directory %s. (%s)" % (data_dir, e))
+        return 1
+    jobs = []
+    for tables in DBGEN_CHUNKED_TABLES.values():
+        for table in tables:
+            if num_chunks > 1:
+                in_fnames = [os.path.join(dbgen_dir, "%s.tbl.%s" % (table, step)) for step in range(1, num_chunks + 1)]
+            else:
+                in_fnames = [os.path.join(dbgen_dir, table + ".tbl")]
+            jobs.append((in_fnames, os.path.join(data_dir, table + ".tbl" + out_ext), None, compression))
+    for tables in DBGEN_SINGLE_TABLES.values():
+        for table in tables:
+            in_fname = os.path.join(dbgen_dir, table + ".tbl")
+            jobs.append(([in_fname], os.path.join(data_dir, table + ".tbl" + out_ext), None, compression))
+    return tr.transform_files(jobs, num_jobs)
+
+
+def transform_refresh_data(dbgen_dir, data_dir, update_dir, delete_dir, num_jobs=1, compression=None):
+    """Moves the refresh sets generated by dbgen -U into the update and delete directories.
+
+    Args:
+        dbgen_dir (str): Directory in which the refresh sets were generated.
+        data_dir (str): Directory where generated data is to be placed.
+        update_dir (str): Subdirectory where scripts with data update operations is to be placed.
+        delete_dir (str): Subdirectory where scripts with data delete operations is to be placed.
+        num_jobs (int): number of files transformed at the same time
+        compression (str): None, "gzip" or "zstd" for compressed output files
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    update_path = os.path.join(data_dir, update_dir)
+    delete_path = os.path.join(data_dir, delete_dir)
+    if inner_generate_data(update_path, dbgen_dir, "*.tbl.u*", ".csv", num_jobs, compression):
+        print("unable to generate data for the update phase")
+        return 1
+    print("generated data for the update phase")
+    if inner_generate_data(delete_path, dbgen_dir, "delete.*", ".csv", num_jobs, compression):
+        print("unable to generate data for the delete phase")
+        return 1
+    print("generated data for the delete phase")
     # All files written successfully. Return success code.
     return 0
 
 
-def generate_data(dbgen_dir, data_dir, load_dir, update_dir, delete_dir, scale, num_streams):
-    """Generates data for the loading into tables.
+def generate_refresh_data(dbgen_dir, data_dir, update_dir, delete_dir, scale, num_streams, num_jobs=1,
+                          compression=None):
+    """Generates only the data for the refresh functions, i.e. the update and delete sets.
 
     Args:
         dbgen_dir (str): Directory in which the source code is to be placed.
         data_dir (str): Directory where generated data is to be placed.
-        load_dir (str): Subdirectory where data to be loaded is to be placed.
         update_dir (str): Subdirectory where scripts with data update operations is to be placed.
         delete_dir (str): Subdirectory where scripts with data delete operations is to be placed.
         scale (float): Amount of data to be generated. 1 = 1GB.
         num_streams (int): Number of streams on which the throuput tests is going to be performed.
+        num_jobs (int): number of files transformed at the same time
+        compression (str): None, "gzip" or "zstd" for compressed output files
 
     Return:
         0 if successful
         non zero otherwise
     """
-    p = subprocess.Popen([os.path.join(".", "dbgen"), "-vf", "-s", str(scale)], cwd=dbgen_dir)
-    p.communicate()
-    if not p.returncode:
-        load_path = os.path.join(data_dir, load_dir)
-        if inner_generate_data(load_path, dbgen_dir, "*.tbl", ".csv"):
-            print("unable to generate data for load phase")
-            return 1
-        print("generated data for the load phase")
-    else:
-        return p.returncode
-
-    # Update/Delete phase data
     # we generate num_streams + 1 number of updates because 1 is used by the power tests
-    p = subprocess.Popen([os.path.join(".", "dbgen"), "-vf", "-s", str(scale), "-U", str(num_streams + 1)],
-                         cwd=dbgen_dir)
-    p.communicate()
-    if not p.returncode:
-        update_path = os.path.join(data_dir, update_dir)
-        delete_path = os.path.join(data_dir, delete_dir)
-        if inner_generate_data(update_path, dbgen_dir, "*.tbl.u*", ".csv"):
-            print("unable to generate data for the update phase")
-            return 1
-        print("generated data for the update phase")
-        if inner_generate_data(delete_path, dbgen_dir, "delete.*", ".csv"):
-            print("unable to generate data for the delete phase")
-            return 1
-        print("generated data for the delete phase")
-        # All files written successfully. Return success code.
-        return 0
-    else:
-        return p.returncode
-
-
-def generate_queries(dbgen_dir, query_root, template_query_dir, generated_query_dir):
-    """Generates queries for performance tests.
+    returncode = run_dbgen(dbgen_dir, ["-vf", "-s", str(scale), "-U", str(num_streams + 1)])
+    if returncode:
+        return returncode
+    return transform_refresh_data(dbgen_dir, data_dir, update_dir, delete_dir, num_jobs, compression)
+
+
+def dbgen_pipelines(tables, num_chunks=1):
+    """Lists the dbgen processes and the files they write for loading the tables.
+
+    Args:
+        tables (list): names of the tables to be generated
+        num_chunks (int): number of chunks each of the large tables is split into
+
+    Return:
+        list of tuples (dbgen arguments without scale factor, list of (table, file name))
+    """
+    tables = [table.lower() for table in tables]
+    pipelines = []
+    for code, names in DBGEN_SINGLE_TABLES.items():
+        files = [(name, name + ".tbl") for name in names if name in tables]
+        if files:
+            pipelines.append((["-T", code], files))
+    for code, names in DBGEN_CHUNKED_TABLES.items():
+        for step in range(1, num_chunks + 1):
+            if num_chunks > 1:
+                files = [(name, "%s.tbl.%s" % (name, step)) for name in names if name in tables]
+                args = ["-T", code, "-C", str(num_chunks), "-S", str(step)]
+            else:
+                files = [(name, name + ".tbl") for name in names if name in tables]
+                args = ["-T", code]
+            if files:
+                pipelines.append((args, files))
+    return pipelines
+
+
+def generate_data_parallel(dbgen_dir, data_dir, load_dir, update_dir, delete_dir, scale, num_streams, num_jobs,
+                           compression=None):
+    """Generates data for the loading into tables with several concurrent dbgen processes.
+
+    The large tables are split into num_jobs chunks with the -C/-S flags of dbgen, the refresh sets
+    are generated at the same time, and the chunks are merged afterwards. With a single job every table
+    is generated in one piece, one after the other, and goes through the same transformation.
+
+    Args:
+        dbgen_dir (str): Directory in which the source code is to be placed.
+        data_dir (str): Directory where generated data is to be placed.
+        load_dir (str): Subdirectory where data to be loaded is to be placed.
+        update_dir (str): Subdirectory where scripts with data update operations is to be placed.
+        delete_dir (str): Subdirectory where scripts with data delete operations is to be placed.
+        scale (float): Amount of data to be generated. 1 = 1GB.
+        num_streams (int): Number of streams on which the throuput tests is going to be performed.
+        num_jobs (int): Number of dbgen processes running at the same time.
+        compression (str): None, "gzip" or "zstd" for compressed data files
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    # refresh sets go first, so they are generated alongside the chunks of the large tables
+    jobs = [["-f", "-s", str(scale), "-U", str(num_streams + 1)]]
+    for code in DBGEN_SINGLE_TABLES:
+        jobs.append(["-f", "-s", str(scale), "-T", code])
+    for code in DBGEN_CHUNKED_TABLES:
+        if num_jobs > 1:
+            for step in range(1, num_jobs + 1):
+                jobs.append(["-f", "-s", str(scale), "-T", code, "-C", str(num_jobs), "-S", str(step)])
+        else:
+            jobs.append(["-f", "-s", str(scale), "-T", code])
+    with ThreadPoolExecutor(max_workers=num_jobs) as executor:
+        return_codes = list(executor.map(lambda args: run_dbgen(dbgen_dir, args), jobs))
+    failed = [rc for rc in return_codes if rc]
+    if failed:
+        print("%s of %s dbgen processes failed" % (len(failed), len(jobs)))
+        return failed[0]
+    print("generated %s chunks of data with %s processes" % (len(jobs), num_jobs))
+    #
+    load_path = os.path.join(data_dir, load_dir)
+    if merge_chunks(load_path, dbgen_dir, num_jobs, ".csv", num_jobs, compression):
+        print("unable to generate data for load phase")
+        return 1
+    print("generated data for the load phase")
+    return transform_refresh_data(dbgen_dir, data_dir, update_dir, delete_dir, num_jobs, compression)
+
+
+def generate_data(dbgen_dir, data_dir, load_dir, update_dir, delete_dir, scale, num_streams, num_jobs=1,
+                  compression=None):
+    """Generates data for the loading into tables, with any number of jobs through
+    generate_data_parallel(), so that a single process writes the same files in the same way.
+
+    Args:
+        dbgen_dir (str): Directory in which the source code is to be placed.
+        data_dir (str): Directory where generated data is to be placed.
+        load_dir (str): Subdirectory where data to be loaded is to be placed.
+        update_dir (str): Subdirectory where scripts with data update operations is to be placed.
+        delete_dir (str): Subdirectory where scripts with data delete operations is to be placed.
+        scale (float): Amount of data to be generated. 1 = 1GB.
+        num_streams (int): Number of streams on which the throuput tests is going to be performed.
+        num_jobs (int): Number of dbgen processes running at the same time, see generate_data_parallel().
+        compression (str): None, "gzip" or "zstd" for compressed data files
+
+    Return:
+        0 if successful
+        non zero otherwise
+    """
+    return generate_data_parallel(dbgen_dir, data_dir, load_dir, update_dir, delete_dir,
+                                  scale, num_streams, num_jobs, compression)
+
+
+def default_query_seed():
+    """Seed of the query substitution parameters as suggested by the TPC-H specification,
+    a time stamp in the format mmddhhmmss
+
+    Return:
+        seed as int
+    """
+    return int(time.strftime("%m%d%H%M%S"))
+
+
+def run_qgen(dbgen_dir, query_env, out_path, query, seed, stream=0):
+    """Runs qgen for one query and writes the generated query into a file.
+
+    Args:
+        dbgen_dir (str): Directory in which the qgen binary is placed.
+        query_env (dict): Environment of qgen, with DSS_QUERY pointing to the templates.
+        out_path (str): Path of the generated query file.
+        query (int): Query number, 1 to 22.
+        seed (int): Seed of the substitution parameters (argument of -r).
+        stream (int): Query stream (argument of -p), names e.g. the view of Q15 revenue<stream>.
+
+    Return:
+        return code of qgen, 0 if successful
+    """
+    try:
+        with open(out_path, "w") as out_file:
+            p = subprocess.Popen([os.path.join(".", "qgen"), "-r", str(seed), "-p", str(stream), str(query)],
+                                 cwd=dbgen_dir, env=query_env, stdout=out_file)
+            p.communicate()
+            if p.returncode:
+                print("Process returned non zero when generating query number %s" % query)
+            return p.returncode
+    except IOError as e:
+        print("IO Error during query generation %s" % e)
+        return 1
+
+
+def generate_queries(dbgen_dir, query_root, template_query_dir, generated_query_dir, num_streams=0, seed=None):
+    """Generates queries for performance tests, one query set per stream.
+
+    Every stream gets its own substitution parameters: stream s is generated with the seed plus s, as
+    required by the TPC-H specification, into the subdirectory stream_s, where stream 0 is the power test.
+    The qgen processes run in parallel, one per CPU core.
 
     Args:
         dbgen_dir (str): Directory in which the source code is placed.
@@ -116,6 +318,8 @@ def generate_queries(dbgen_dir, query_root, template_query_dir, generated_query_
                           Also the place where the generated queries are going to be placed.
         template_query_dir (str): Subdirectory where template SQL queries are to be placed.
         generated_query_dir (str): Subdirectory where generated SQL queries are to be placed.
+        num_streams (int): Number of streams of the throughput tests.
+        seed (int): Seed of the substitution parameters of the power test, None for default_query_seed().
 
     Return:
         0 if successful
@@ -125,19 +329,19 @@ def generate_queries(dbgen_dir, query_root, template_query_dir, generated_query_
     dss_query_path = os.path.join(query_root, template_query_dir)
     query_env = os.environ.copy()
     query_env['DSS_QUERY'] = dss_query_path
-    query_gen_path = os.path.join(query_root, generated_query_dir)
-    os.makedirs(query_gen_path, exist_ok=True)
-    for i in range(1, 23):
-        try:
-            with open(os.path.join(query_gen_path, str(i) + ".sql"), "w") as out_file:
-                p = subprocess.Popen([os.path.join(".", "qgen"), str(i)],
-                                     cwd=dbgen_dir, env=query_env, stdout=out_file)
-                p.communicate()
-                if p.returncode:
-                    print("Process returned non zero when generating query number %s" % i)
-                    return p.returncode
-        except IOError as e:
-            print("IO Error during query generation %s" % e)
-            return 1
-    return p.returncode
-
+    if seed is None:
+        seed = default_query_seed()
+    jobs = []
+    for stream in range(num_streams + 1):
+        query_gen_path = os.path.join(query_root, generated_query_dir, QUERY_STREAM_DIR % stream)
+        os.makedirs(query_gen_path, exist_ok=True)
+        for i in range(1, 23):
+            jobs.append((os.path.join(query_gen_path, str(i) + ".sql"), i, seed + stream, stream))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        return_codes = list(executor.map(lambda job: run_qgen(dbgen_dir, query_env, *job), jobs))
+    failed = [rc for rc in return_codes if rc]
+    if failed:
+        print("%s of %s qgen processes failed" % (len(failed), len(jobs)))
+        return failed[0]
+    print("generated %s query sets with seed %s" % (num_streams + 1, seed))
+    return 0
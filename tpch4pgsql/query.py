@@ -1,16 +1,34 @@
+import io
 import os
+import re
+import asyncio
 import math
 import json
+import time
+import datetime as dt
+import functools
 from itertools import zip_longest
-from multiprocessing import Process, Queue
+from threading import BrokenBarrierError
 
-from tpch4pgsql import postgresqldb as pgdb, result as r
+from tpch4pgsql import asyncdb, executor as ex, postgresqldb as pgdb, prepare as prep, result as r, \
+    schema, stats, transform as tr, warehouse as wh
 
 POWER = "power"
 THROUGHPUT = "throughput"
 QUERY_METRIC = "query_stream_%s_query_%s"
+QUERY_FETCH_METRIC = "query_stream_%s_query_%s_%s"  # result fetched by a query, e.g. rows, see set_query_metrics()
+QUERY_STATEMENT_METRIC = "query_stream_%s_query_%s_statement_%s"
 REFRESH_METRIC = "refresh_stream_%s_func_%s"
+REFRESH_STAGE_METRIC = "refresh_stream_%s_func_%s_%s"  # stage or variant of a refresh function, e.g. transfer
+RF2_BATCH_SIZE = 100  # initial and smallest number of keys per DELETE ... IN statement
+RF2_MAX_BATCH_SIZE = 10000
+# whether deleting orders cascades to their line items, as with the foreign key of the default schema profile
+CASCADE_QUERY = ("SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE contype = 'f' AND confdeltype = 'c' "
+                 "AND conrelid = 'lineitem'::regclass AND confrelid = 'orders'::regclass)")
 THROUGHPUT_TOTAL_METRIC = "throughput_test_total"
+SUMMARY_METRICS = ["power_size", "throughput_size", "qphh_size"]  # of calc_metrics(), see summarize_runs()
+SUMMARY_QUERY_RE = re.compile(r"^query_stream_\d+_query_\d+$")  # QUERY_METRIC
+STREAM_CONNECT_TIMEOUT = 600  # seconds to wait for all query streams to connect
 
 QUERY_ORDER = [  # As given in appendix A of the TPCH-specification
         [14, 2, 9, 20, 6, 17, 18, 8, 21, 13, 3, 22, 16, 4, 11, 15, 1, 10, 19, 5, 7, 12],
@@ -70,21 +88,9 @@ def grouper(iterable, n, fillvalue=None):
     return zip_longest(*args, fillvalue=fillvalue)
 
 
-def insert_lineitem(cols, conn):
-    """Insert a row into table LINEITEM
-
-    :param cols: tuple with values to be inserted,
-    order of the values must be the same as order of the columns in the target table
-    :param conn: open connection to the database
-    :return: 0 if successful, 1 otherwise
-    """
-    li_insert_stmt = """INSERT INTO lineitem VALUES (%s, %s, %s, %s, %s, %s, %s, %s, '%s',
-                     '%s', '%s', '%s', '%s', '%s', '%s', '%s')""" % cols
-    conn.executeQuery(li_insert_stmt)
-
-
 def refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose):
-    """Run refresh function #1 (update)
+    """Run refresh function #1 (update) with parameterized multi-row INSERT statements,
+    sent in batches of postgresqldb.CONFIG["batch_size"] rows, see postgresqldb.PGBatch
 
     :param conn: open connection to the database
     :param data_dir: subdirectory with data to be loaded
@@ -100,27 +106,29 @@ def refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose):
         file_nr = stream + 1  # generated files are named 1,2,3,... while streams are indexed 0,1,2,...
         filepath_o = os.path.join(data_dir, update_dir, "orders.tbl.u" + str(file_nr) + ".csv")
         filepath_l = os.path.join(data_dir, update_dir, "lineitem.tbl.u" + str(file_nr) + ".csv")
-        with open(filepath_o) as orders_file, open(filepath_l) as lineitem_file:
+        with tr.open_data_file(filepath_o) as orders_file, tr.open_data_file(filepath_l) as lineitem_file:
+            orders = pgdb.PGBatch(conn, "INSERT INTO ORDERS VALUES %s", values=True)
+            # line items are only sent after the orders they reference
+            lineitems = pgdb.PGBatch(conn, "INSERT INTO LINEITEM VALUES %s", values=True, before=[orders])
             todo_licols = None
             for orders_lines in grouper(orders_file, 100, ''):
                 orders_gen = [x.strip() for x in orders_lines if x.strip()]
                 for order_line in orders_gen:
                     o_cols = tuple(order_line.split('|'))
-                    o_insert_stmt = "INSERT INTO ORDERS VALUES (%s, %s, '%s', %s, '%s', '%s', '%s',  %s, '%s')" % o_cols
-                    conn.executeQuery(o_insert_stmt)
+                    orders.add(o_cols)
                     # As per specification for every ORDERS row we add one to seven LINEITEM rows.
                     if todo_licols:
                         if todo_licols[0] != o_cols[0]:
                             print("bad data file for lineitem. Does not match orders key")
                             return 1
                         else:
-                            insert_lineitem(todo_licols, conn)
+                            lineitems.add(todo_licols)
                             todo_licols = None
                     lineitem_line = lineitem_file.readline()
                     if lineitem_line:
                         li_cols = tuple(lineitem_line.strip().split("|"))
                         while li_cols and o_cols[0] == li_cols[0]:
-                            insert_lineitem(li_cols, conn)
+                            lineitems.add(li_cols)
                             lineitem_line = lineitem_file.readline()
                             if lineitem_line:
                                 li_cols = tuple(lineitem_line.strip().split("|"))
@@ -128,7 +136,7 @@ def refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose):
                                 li_cols = None
                         if li_cols is not None:
                             todo_licols = li_cols
-
+            lineitems.flush()
         conn.commit()
         return 0
     except Exception as e:
@@ -136,8 +144,136 @@ def refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose):
         return 1
 
 
-def refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose):
-    """Run refresh function #2 (delete)
+def read_refresh_file(filepath):
+    """Read a refresh data file into memory, decompressing it if needed
+
+    :param filepath: path to the uncompressed data file
+    :return: tuple (binary file object positioned at the start, number of lines)
+    """
+    path, compression = tr.find_data_file(filepath)
+    with tr.open_compressed(path, compression, "rb") as in_file:
+        data = in_file.read()
+    return io.BytesIO(data), data.count(b"\n")
+
+
+def refresh_func1_bulk(conn, data_dir, update_dir, stream, num_streams, verbose, result=None):
+    """Run refresh function #1 (update) set based: both files are copied into temporary staging tables
+    and inserted with one INSERT ... SELECT per table, in the same transaction
+
+    :param conn: open connection to the database
+    :param data_dir: subdirectory with data to be loaded
+    :param update_dir: subdirectory with data to be updated
+    :param stream: stream number
+    :param num_streams: total number of streams
+    :param verbose: True if more verbose output is required
+    :param result: optional result object for the times of the stages parse (reading the files),
+    transfer (COPY into the staging tables) and apply (INSERT ... SELECT and commit)
+    :return: 0 if successful, 1 otherwise
+    """
+    try:
+        if verbose:
+            print("Running bulk refresh function #1 in stream #%s" % stream)
+        file_nr = stream + 1
+        stages = []
+        start = time.perf_counter()
+        files = []
+        for table in ("orders", "lineitem"):
+            filepath = os.path.join(data_dir, update_dir, "%s.tbl.u%s.csv" % (table, file_nr))
+            files.append((table,) + read_refresh_file(filepath))
+        stages.append(("parse", time.perf_counter() - start))
+        start = time.perf_counter()
+        for table, in_file, num_lines in files:
+            conn.executeQuery("CREATE TEMPORARY TABLE %s_stage (LIKE %s) ON COMMIT DROP" % (table, table))
+            conn.copyFromStream(in_file, separator="|", table="%s_stage" % table, size=tr.PIPE_BLOCK_SIZE)
+        stages.append(("transfer", time.perf_counter() - start))
+        start = time.perf_counter()
+        # orders first, like the row by row variant
+        for table, in_file, num_lines in files:
+            conn.executeQuery("INSERT INTO %s SELECT * FROM %s_stage" % (table, table))
+        conn.commit()
+        stages.append(("apply", time.perf_counter() - start))
+        if verbose:
+            print("inserted %s orders and %s line items" % (files[0][2], files[1][2]))
+        if result is not None:
+            for stage, seconds in stages:
+                result.setMetric(REFRESH_STAGE_METRIC % (stream, 1, stage), dt.timedelta(seconds=seconds))
+        return 0
+    except Exception as e:
+        print("bulk refresh function #1 failed. %s" % e)
+        return 1
+
+
+def run_refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose, mode="rows", result=None):
+    """Run refresh function #1 in the given mode
+
+    :param mode: "rows" for one INSERT per row, "bulk" for staging tables, see refresh_func1_bulk()
+    :param result: optional result object for the stage times of the bulk mode
+    :return: 0 if successful, 1 otherwise
+    """
+    if mode == "bulk":
+        return refresh_func1_bulk(conn, data_dir, update_dir, stream, num_streams, verbose, result)
+    return refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose)
+
+
+def read_keys(filepath):
+    """Read the order keys of a delete file
+
+    :param filepath: path to the uncompressed delete file
+    :return: list of keys as strings
+    """
+    with tr.open_data_file(filepath) as in_file:
+        return [line.strip() for line in in_file if line.strip()]
+
+
+def deletes_cascade(conn):
+    """
+    :param conn: open connection to the database
+    :return: True if deleting orders deletes their line items through a foreign key ON DELETE CASCADE,
+    False if they have to be deleted explicitly, e.g. in the partitioned schema profile
+    """
+    return bool(conn.fetchValue(CASCADE_QUERY))
+
+
+def delete_in_list(conn, keys, batch_size=RF2_BATCH_SIZE, max_batch_size=RF2_MAX_BATCH_SIZE, cascade=False):
+    """Delete orders and their line items with one DELETE ... = ANY(keys) statement per table and batch of keys
+
+    The batch size adapts to the server: it doubles as long as the time per key goes down,
+    and the direction is reversed whenever a batch takes longer per key than the one before.
+
+    :param conn: open connection to the database
+    :param keys: list of order keys
+    :param batch_size: number of keys of the first batch, also the smallest batch size
+    :param max_batch_size: largest batch size
+    :param cascade: True if the line items are deleted by the foreign key, see deletes_cascade()
+    :return: number of batches
+    """
+    min_batch_size = batch_size
+    pos = 0
+    batches = 0
+    growing = True
+    previous = None
+    while pos < len(keys):
+        batch = keys[pos:pos + batch_size]
+        start = time.perf_counter()
+        in_list = [int(key) for key in batch]
+        if not cascade:
+            conn.executeQuery("DELETE FROM lineitem WHERE L_ORDERKEY = ANY(%s)", (in_list,))
+        conn.executeQuery("DELETE FROM orders WHERE O_ORDERKEY = ANY(%s)", (in_list,))
+        per_key = (time.perf_counter() - start) / len(batch)
+        pos += len(batch)
+        batches += 1
+        if previous is not None and per_key > previous:
+            growing = not growing
+        previous = per_key
+        if growing:
+            batch_size = min(batch_size * 2, max_batch_size)
+        else:
+            batch_size = max(batch_size // 2, min_batch_size)
+    return batches
+
+
+def refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, result=None, commit=True):
+    """Run refresh function #2 (delete) with DELETE ... IN statements for batches of keys, see delete_in_list()
 
     :param conn: open connection to the database
     :param data_dir: subdirectory with data to be loaded
@@ -145,25 +281,122 @@ def refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose):
     :param stream: stream number
     :param num_streams: total number of streams
     :param verbose: True if more verbose output is required
+    :param result: optional result object for the time of this variant
+    :param commit: False to roll back, e.g. to warm up the caches before comparing the variants
     :return: 0 if successful, 1 otherwise
     """
     try:
         if verbose:
             print("Running refresh function #2 in stream #%s" % stream)
+        start = time.perf_counter()
         file_nr = stream + 1
         filepath = os.path.join(data_dir, delete_dir, "delete." + str(file_nr) + ".csv")
-        with open(filepath, 'r') as in_file:
-            for ids in grouper(in_file, 100, ''):
-                query = "DELETE FROM orders WHERE O_ORDERKEY IN (%s)" % ", ".join([x.strip() for x in ids if x.strip()])
-                conn.executeQuery(query)
-        conn.commit()
+        batches = delete_in_list(conn, read_keys(filepath), cascade=deletes_cascade(conn))
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+        if verbose:
+            print("deleted orders in %s batches%s" % (batches, "" if commit else ", rolled back"))
+        if result is not None:
+            result.setMetric(REFRESH_STAGE_METRIC % (stream, 2, "in_list"),
+                             dt.timedelta(seconds=time.perf_counter() - start))
         return 0
     except Exception as e:
         print("refresh function #2 failed. %s" % e)
         return 1
 
 
-def run_query_stream(conn, query_root, generated_query_dir, stream, num_streams, result, verbose):
+def refresh_func2_staged(conn, data_dir, delete_dir, stream, num_streams, verbose, result=None, commit=True):
+    """Run refresh function #2 (delete) set based: the keys are copied into a temporary table,
+    which is joined by one DELETE ... USING for ORDERS, and one for LINEITEM unless the foreign key
+    deletes the line items, see deletes_cascade()
+
+    :param conn: open connection to the database
+    :param data_dir: subdirectory with data to be loaded
+    :param delete_dir: subdirectory with data to be deleted
+    :param stream: stream number
+    :param num_streams: total number of streams
+    :param verbose: True if more verbose output is required
+    :param result: optional result object for the time of this variant
+    :param commit: False to roll back, e.g. to time this variant before running the other one
+    :return: 0 if successful, 1 otherwise
+    """
+    try:
+        if verbose:
+            print("Running staged refresh function #2 in stream #%s" % stream)
+        start = time.perf_counter()
+        file_nr = stream + 1
+        filepath = os.path.join(data_dir, delete_dir, "delete." + str(file_nr) + ".csv")
+        in_file, num_keys = read_refresh_file(filepath)
+        conn.executeQuery("CREATE TEMPORARY TABLE delete_stage (O_ORDERKEY INTEGER) ON COMMIT DROP")
+        conn.copyFromStream(in_file, separator="|", table="delete_stage", size=tr.PIPE_BLOCK_SIZE)
+        conn.executeQuery("ANALYZE delete_stage")  # temporary tables have no statistics for planning the joins
+        if not deletes_cascade(conn):
+            conn.executeQuery("DELETE FROM lineitem USING delete_stage WHERE L_ORDERKEY = delete_stage.O_ORDERKEY")
+        conn.executeQuery("DELETE FROM orders USING delete_stage WHERE orders.O_ORDERKEY = delete_stage.O_ORDERKEY")
+        if commit:
+            conn.commit()
+        else:
+            conn.rollback()
+        if verbose:
+            print("deleted %s orders%s" % (num_keys, "" if commit else ", rolled back"))
+        if result is not None:
+            result.setMetric(REFRESH_STAGE_METRIC % (stream, 2, "staged"),
+                             dt.timedelta(seconds=time.perf_counter() - start))
+        return 0
+    except Exception as e:
+        print("staged refresh function #2 failed. %s" % e)
+        return 1
+
+
+def run_refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, mode="in-list", result=None):
+    """Run refresh function #2 in the given mode
+
+    :param mode: "in-list" for DELETE ... IN statements, "staged" for DELETE ... USING a staging table,
+    "compare" for the in-list variant, after the staged one has been timed by compare_refresh_func2()
+    :param result: optional result object for the time of each variant
+    :return: 0 if successful, 1 otherwise
+    """
+    if mode == "staged":
+        return refresh_func2_staged(conn, data_dir, delete_dir, stream, num_streams, verbose, result)
+    return refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, result)
+
+
+def compare_refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, mode="in-list", result=None):
+    """In compare mode, run the staged variant of refresh function #2 and roll it back, so that both
+    variants are timed on the same rows. To be run before the timed refresh function, does nothing otherwise.
+    Both variants are run and rolled back once untimed before, so that neither finds the rows cached
+    by the other one and the order they are timed in does not matter.
+
+    :return: 0 if successful, 1 otherwise
+    """
+    if mode != "compare":
+        return 0
+    for variant in [refresh_func2, refresh_func2_staged]:
+        if variant(conn, data_dir, delete_dir, stream, num_streams, verbose, commit=False):
+            return 1
+    return refresh_func2_staged(conn, data_dir, delete_dir, stream, num_streams, verbose, result, commit=False)
+
+
+class QuerySet:
+    """Queries of one stream, read from the generated query files and split into single statements once
+    before the run, so that reading and parsing them is not part of the timed queries
+
+    """
+    def __init__(self, query_root, generated_query_dir, stream):
+        self.__queries__ = [(query, schema.read_statements(filepath))
+                            for query, filepath in stream_queries(query_root, generated_query_dir, stream)]
+
+    def getQueries(self):
+        """
+        :return: list of tuples (query number, list of statements) in the order of the stream
+        """
+        return self.__queries__
+
+
+def run_query_stream(conn, query_root, generated_query_dir, stream, num_streams, result, verbose, itersize=None,
+                     query_set=None, statement_timing=False):
     """
 
     :param conn: open connection to the database
@@ -173,27 +406,135 @@ def run_query_stream(conn, query_root, generated_query_dir, stream, num_streams,
     :param num_streams: total number of streams
     :param result: result object for string start and stop times
     :param verbose: True if more verbose output is required
+    :param itersize: None to only execute the queries, otherwise number of rows fetched per round trip
+    by a server-side cursor, so the query times include the transfer of all results, see set_query_metrics()
+    :param query_set: queries of the stream loaded before, None to load them now, see QuerySet
+    :param statement_timing: True to time every statement of a query with several statements, e.g. Q15
+    :return: 0 if successful, 1 otherwise
+    """
+    if query_set is None:
+        query_set = QuerySet(query_root, generated_query_dir, stream)
+    for query, statements in query_set.getQueries():
+        try:
+            if verbose:
+                print("Running query #%s in stream #%s ..." % (query, stream))
+            timings = [] if statement_timing and len(statements) > 1 else None
+            result.startTimer()
+            fetched = conn.runStatements(statements, itersize, timings)
+            result.setMetric(QUERY_METRIC % (stream, query), result.stopTimer())
+            set_query_metrics(result, stream, query, fetched, timings)
+        except Exception as e:
+            print("unable to execute query %s in stream %s: %s" % (query, stream, e))
+            return 1
+    return 0
+
+
+def count_query_sets(query_root, generated_query_dir):
+    """
+    :return: number of query sets generated by the prepare phase, i.e. of the folders stream_0, stream_1, ...
+    """
+    count = 0
+    while os.path.isdir(os.path.join(query_root, generated_query_dir, prep.QUERY_STREAM_DIR % count)):
+        count += 1
+    return count
+
+
+def check_query_sets(query_root, generated_query_dir, num_streams):
+    """Check the query sets of the prepare phase before a test starts, see stream_queries()
+
+    :param num_streams: number of query streams of the test
+    :return: 0 if there are query sets for the power test and all streams, possibly reused, 1 otherwise
+    """
+    num_sets = count_query_sets(query_root, generated_query_dir)
+    if num_sets == 0:
+        print("no query sets in %s, run the prepare phase first" % os.path.join(query_root, generated_query_dir))
+        return 1
+    if num_streams >= num_sets:
+        print("query streams %s to %s reuse the query sets of streams %s to %s; run the prepare phase with "
+              "--num-streams %s to generate their own" % (num_sets, num_streams, min(1, num_sets - 1),
+                                                          max(0, num_sets - 1), num_streams))
+    return 0
+
+
+def stream_queries(query_root, generated_query_dir, stream):
+    """List the queries of a stream in the order given by the TPC-H specification, from the query set
+    generated for the stream. A stream beyond those of the prepare phase reuses the query set of
+    stream 1 + (stream - 1) modulo the number of query streams prepared, see check_query_sets().
+
+    :return: list of tuples (query number, path to the query file)
+    """
+    order = QUERY_ORDER[stream % len(QUERY_ORDER)]
+    num_sets = count_query_sets(query_root, generated_query_dir)
+    if num_sets == 0:
+        raise IOError("no query sets in %s, run the prepare phase first" %
+                      os.path.join(query_root, generated_query_dir))
+    if stream >= num_sets:
+        stream = 1 + (stream - 1) % (num_sets - 1) if num_sets > 1 else 0
+    query_dir = os.path.join(query_root, generated_query_dir, prep.QUERY_STREAM_DIR % stream)
+    return [(query, os.path.join(query_dir, str(query) + ".sql")) for query in order]
+
+
+def set_query_metrics(result, stream, query, fetched=None, timings=None):
+    """Record the details of a query: the result fetched, i.e. rows, bytes (size of the values in text format),
+    first_row (time to the first row) and fetch (time to the last row), and the time of every statement
+
+    :param result: result object
+    :param stream: stream number
+    :param query: query number
+    :param fetched: optional dictionary of metrics, see postgresqldb.FetchStatistics.getMetrics()
+    :param timings: optional list with the seconds of every statement
+    """
+    if fetched:
+        for name, value in fetched.items():
+            result.setMetric(QUERY_FETCH_METRIC % (stream, query, name), value)
+    if timings:
+        for i, seconds in enumerate(timings):
+            result.setMetric(QUERY_STATEMENT_METRIC % (stream, query, i + 1), dt.timedelta(seconds=seconds))
+
+
+async def run_query_stream_async(conn, query_root, generated_query_dir, stream, num_streams, result, verbose,
+                                 itersize=None, query_set=None, statement_timing=False):
+    """Run the queries of a stream on an asyncio connection, see run_query_stream()
+
+    :param conn: open asyncio connection to the database, see asyncdb.connect()
     :return: 0 if successful, 1 otherwise
     """
-    index = stream % len(QUERY_ORDER)
-    order = QUERY_ORDER[index]
-    for i in range(0, 22):
+    if query_set is None:
+        query_set = QuerySet(query_root, generated_query_dir, stream)
+    for query, statements in query_set.getQueries():
         try:
             if verbose:
-                print("Running query #%s in stream #%s ..." % (order[i], stream))
-            filepath = os.path.join(query_root, generated_query_dir, str(order[i]) + ".sql")
+                print("Running query #%s in stream #%s ..." % (query, stream))
+            timings = [] if statement_timing and len(statements) > 1 else None
             result.startTimer()
-            conn.executeQueryFromFile(filepath)
-            result.setMetric(QUERY_METRIC % (stream, order[i]), result.stopTimer())
+            fetched = await conn.runStatements(statements, itersize, timings)
+            result.setMetric(QUERY_METRIC % (stream, query), result.stopTimer())
+            set_query_metrics(result, stream, query, fetched, timings)
         except Exception as e:
-            print("unable to execute query %s in stream %s: %s" % (order[i], stream, e))
+            print("unable to execute query %s in stream %s: %s" % (query, stream, e))
             return 1
     return 0
 
 
+async def run_power_stream_async(query_root, generated_query_dir, host, port, database, user, password,
+                                 stream, num_streams, result, verbose, itersize=None, query_set=None,
+                                 statement_timing=False):
+    """Connect and run the query stream of the power test with the asyncio engine
+
+    :return: 0 if successful, 1 otherwise
+    """
+    conn = await asyncdb.connect(host, port, database, user, password)
+    try:
+        return await run_query_stream_async(conn, query_root, generated_query_dir, stream, num_streams,
+                                            result, verbose, itersize, query_set, statement_timing)
+    finally:
+        await conn.close()
+
+
 def run_power_test(query_root, data_dir, update_dir, delete_dir, generated_query_dir, results_dir,
                    host, port, database, user, password,
-                   run_timestamp, num_streams, verbose, read_only):
+                   run_timestamp, num_streams, verbose, read_only, rf1_mode="rows", rf2_mode="in-list",
+                   executor=ex.DEFAULT_EXECUTOR, itersize=None, statement_timing=False):
     """
 
     :param query_root: directory where generated SQL statements are stored
@@ -212,26 +553,44 @@ def run_power_test(query_root, data_dir, update_dir, delete_dir, generated_query
     :param verbose: True if more verbose output is required
     :param read_only: True if no inserts/updates/deletes are to be run; can be used to run the same test multiple times
     without (re)loading the data, e.g. while developing
+    :param rf1_mode: "rows" or "bulk", see run_refresh_func1()
+    :param rf2_mode: "in-list", "staged" or "compare", see run_refresh_func2()
+    :param executor: "asyncio" to run the queries with the asyncio engine, on a connection of the async driver
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip, see run_query_stream()
+    :param statement_timing: True to time every statement of a query with several statements
     :return: 0 if successful, 1 otherwise
     """
+    conn = None
     try:
         print("Power tests started ...")
-        conn = pgdb.PGDB(host, port, database, user, password)
+        if executor == "asyncio":
+            asyncdb.import_driver()  # fail before the refresh function changes the database if the driver is missing
+        conn = pgdb.connect(host, port, database, user, password)
         result = r.Result("Power")
-        result.startTimer()
         stream = 0 # constant for power tests
+        query_set = QuerySet(query_root, generated_query_dir, stream)
+        result.startTimer()
         #
         if not read_only:
-            if refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose):
+            if run_refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose, rf1_mode, result):
                 return 1
         result.setMetric(REFRESH_METRIC % (stream, 1), result.stopTimer())
         #
-        if run_query_stream(conn, query_root, generated_query_dir, stream, num_streams, result, verbose):
+        if executor == "asyncio":
+            if asyncio.run(run_power_stream_async(query_root, generated_query_dir, host, port, database, user,
+                                                  password, stream, num_streams, result, verbose, itersize,
+                                                  query_set, statement_timing)):
+                return 1
+        elif run_query_stream(conn, query_root, generated_query_dir, stream, num_streams, result, verbose,
+                              itersize, query_set, statement_timing):
             return 1
         #
+        if not read_only:
+            if compare_refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, rf2_mode, result):
+                return 1
         result.startTimer()
         if not read_only:
-            if refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose):
+            if run_refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, rf2_mode, result):
                 return 1
         result.setMetric(REFRESH_METRIC % (stream, 2), result.stopTimer())
         #
@@ -242,13 +601,23 @@ def run_power_test(query_root, data_dir, update_dir, delete_dir, generated_query
     except Exception as e:
         print("unable to run power tests. DB connection failed: %s" % e)
         return 1
+    finally:
+        if conn is not None:
+            conn.close()
     return 0
 
 
+class StreamError(Exception):
+    """Raised by a query stream of the throughput test that could not be finished
+
+    """
+    pass
+
+
 def run_throughput_inner(query_root, data_dir, generated_query_dir,
                          host, port, database, user, password,
-                         stream, num_streams, queue, verbose):
-    """
+                         num_streams, verbose, itersize, statement_timing, config, stream, barrier):
+    """Run one query stream of the throughput tests, see executor.StreamExecutor
 
     :param query_root:
     :param data_dir: subdirectory with data to be loaded
@@ -258,27 +627,77 @@ def run_throughput_inner(query_root, data_dir, generated_query_dir,
     :param database: database name, where the benchmark will be run
     :param user: username of the Postgres user with full access to the benchmark DB
     :param password: password for the Postgres user
-    :param stream: stream number
     :param num_streams: number of streams
-    :param queue: process queue
     :param verbose: True if more verbose output is required
-    :return: none, uses exit(1) to abort on errors
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip, see run_query_stream()
+    :param statement_timing: True to time every statement of a query with several statements
+    :param config: connection settings of the parent process for a stream in a separate process,
+    see postgresqldb.configure(), None otherwise
+    :param stream: stream number
+    :param barrier: barrier, passed after connecting so that all streams start at the same time
+    :return: result object of the stream, raises StreamError if the stream could not be finished
     """
     try:
-        conn = pgdb.PGDB(host, port, database, user, password)
+        if config is not None:
+            pgdb.configure(**config)
+        conn = pgdb.connect(host, port, database, user, password)
+    except Exception as e:
+        raise StreamError("unable to connect to DB for query in stream #%s: %s" % (stream, e))
+    try:
+        query_set = QuerySet(query_root, generated_query_dir, stream)
+        try:
+            barrier.wait(STREAM_CONNECT_TIMEOUT)
+        except BrokenBarrierError:
+            raise StreamError("query stream #%s not started, another stream could not connect" % stream)
         result = r.Result("ThroughputQueryStream%s" % stream)
-        if run_query_stream(conn, query_root, generated_query_dir, stream, num_streams, result, verbose):
-            print("unable to finish query in stream #%s" % stream)
-            exit(1)
-        queue.put(result)
+        if run_query_stream(conn, query_root, generated_query_dir, stream, num_streams, result, verbose, itersize,
+                            query_set, statement_timing):
+            raise StreamError("unable to finish query in stream #%s" % stream)
+        return result
+    except StreamError:
+        raise
     except Exception as e:
-        print("unable to connect to DB for query in stream #%s: %s" % (stream, e))
-        exit(1)
+        raise StreamError("unable to run query stream #%s: %s" % (stream, e))
+    finally:
+        conn.close()
+
+
+async def run_throughput_inner_async(query_root, data_dir, generated_query_dir,
+                                     host, port, database, user, password,
+                                     num_streams, verbose, itersize, statement_timing, stream, gate):
+    """Run one query stream of the throughput tests with the asyncio engine, as a task of
+    executor.AsyncioExecutor, see run_throughput_inner()
+
+    :param gate: executor.AsyncGate, passed after connecting so that all streams start at the same time
+    :return: result object of the stream, raises StreamError if the stream could not be finished
+    """
+    try:
+        conn = await asyncdb.connect(host, port, database, user, password)
+    except Exception as e:
+        raise StreamError("unable to connect to DB for query in stream #%s: %s" % (stream, e))
+    try:
+        query_set = QuerySet(query_root, generated_query_dir, stream)
+        try:
+            await gate.wait(STREAM_CONNECT_TIMEOUT)
+        except BrokenBarrierError:
+            raise StreamError("query stream #%s not started, another stream could not connect" % stream)
+        result = r.Result("ThroughputQueryStream%s" % stream)
+        if await run_query_stream_async(conn, query_root, generated_query_dir, stream, num_streams, result, verbose,
+                                        itersize, query_set, statement_timing):
+            raise StreamError("unable to finish query in stream #%s" % stream)
+        return result
+    except StreamError:
+        raise
+    except Exception as e:
+        raise StreamError("unable to run query stream #%s: %s" % (stream, e))
+    finally:
+        await conn.close()
 
 
 def run_throughput_test(query_root, data_dir, update_dir, delete_dir, generated_query_dir, results_dir,
                         host, port, database, user, password,
-                        run_timestamp, num_streams, verbose, read_only):
+                        run_timestamp, num_streams, verbose, read_only, rf1_mode="rows", rf2_mode="in-list",
+                        executor=ex.DEFAULT_EXECUTOR, itersize=None, statement_timing=False):
     """
 
     :param query_root:
@@ -297,52 +716,60 @@ def run_throughput_test(query_root, data_dir, update_dir, delete_dir, generated_
     :param verbose: True if more verbose output is required
     :param read_only: True if no inserts/updates/deletes are to be run; can be used to run the same test multiple times
     without (re)loading the data, e.g. while developing
-    :return: 0 if successful, 1 otherwise
+    :param rf1_mode: "rows" or "bulk", see run_refresh_func1()
+    :param rf2_mode: "in-list", "staged" or "compare", see run_refresh_func2()
+    :param executor: "process", "thread" or "asyncio", how the query streams run concurrently, see executor.py;
+    with asyncio the streams are tasks of one event loop, on connections of the async driver
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip, see run_query_stream()
+    :param statement_timing: True to time every statement of a query with several statements
+    :return: 0 if successful, 1 otherwise, also if one of the query streams failed
     """
+    conn = None
     try:
         print("Throughput tests started ...")
-        conn = pgdb.PGDB(host, port, database, user, password)
+        conn = pgdb.connect(host, port, database, user, password)
         total = r.Result("ThroughputTotal")
-        total.startTimer()
-        processes = []
-        queue = Queue()
+        streams = ex.create_executor(executor, num_streams)
+        # only a separate process needs the connection settings of this one
+        config = dict(pgdb.CONFIG) if executor == "process" else None
+        if executor == "asyncio":
+            asyncdb.import_driver()  # fail before starting any stream if the driver is missing
+            func = functools.partial(run_throughput_inner_async, query_root, data_dir, generated_query_dir,
+                                     host, port, database, user, password, num_streams, verbose, itersize,
+                                     statement_timing)
+        else:
+            func = functools.partial(run_throughput_inner, query_root, data_dir, generated_query_dir,
+                                     host, port, database, user, password, num_streams, verbose, itersize,
+                                     statement_timing, config)
         for i in range(num_streams):
-            stream = i + 1
-            # queries
-            print("Throughput tests in stream #%s started ..." % stream)
-            p = Process(target=run_throughput_inner,
-                        args=(query_root, data_dir, generated_query_dir,
-                              host, port, database, user, password,
-                              stream, num_streams, queue, verbose))
-            processes.append(p)
-            p.start()
+            print("Throughput tests in stream #%s started ..." % (i + 1))
+        streams.start(func, range(1, num_streams + 1))
+        # the streams connect first, so that connection setup is not part of the measured time
+        if not streams.wait_ready(STREAM_CONNECT_TIMEOUT):
+            streams.join()
+            print("unable to connect all query streams")
+            return 1
+        total.startTimer()
         result = r.Result("ThroughputRefreshStream")
-        for i in range(num_streams):
-            stream = i + 1
-            # refresh functions
-            result.startTimer()
-            if not read_only:
-                if refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose):
-                    return 1
-            result.setMetric(REFRESH_METRIC % (stream, 1), result.stopTimer())
-            #
-            result.startTimer()
-            if not read_only:
-                if refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose):
-                    return 1
-            result.setMetric(REFRESH_METRIC % (stream, 2), result.stopTimer())
-            #
-        queue.put(result)
-        for p in processes:
-            p.join()
+        refreshed = refresh_streams(conn, data_dir, update_dir, delete_dir, num_streams, verbose, read_only,
+                                    rf1_mode, rf2_mode, result)
+        conn.close()  # handed back before the streams end, with threads they may share the pool
+        conn = None
+        failed = streams.join()
+        total.setMetric(THROUGHPUT_TOTAL_METRIC, total.stopTimer())
+        if refreshed:
+            print("unable to finish the refresh stream")
+            return 1
+        if failed:
+            print("query streams %s failed" % ", ".join(str(stream) for stream in sorted(failed)))
+            return 1
         print("Throughput tests finished.")
-        for i in range(queue.qsize()):
-            res = queue.get(False)
+        streams.collector.put(result)
+        for res in streams.collector.getResults():
             if verbose:
                 res.printMetrics()
             res.saveMetrics(results_dir, run_timestamp, THROUGHPUT)
         #
-        total.setMetric(THROUGHPUT_TOTAL_METRIC, total.stopTimer())
         if verbose:
             total.printMetrics()
         total.saveMetrics(results_dir, run_timestamp, THROUGHPUT)
@@ -350,6 +777,36 @@ def run_throughput_test(query_root, data_dir, update_dir, delete_dir, generated_
     except Exception as e:
         print("unable to execute throughput tests: %s" % e)
         return 1
+    finally:
+        if conn is not None:
+            conn.close()
+    return 0
+
+
+def refresh_streams(conn, data_dir, update_dir, delete_dir, num_streams, verbose, read_only,
+                    rf1_mode, rf2_mode, result):
+    """Run the refresh functions of all streams of the throughput tests one after the other
+
+    :return: 0 if successful, 1 otherwise
+    """
+    for i in range(num_streams):
+        stream = i + 1
+        # refresh functions
+        result.startTimer()
+        if not read_only:
+            if run_refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose, rf1_mode, result):
+                return 1
+        result.setMetric(REFRESH_METRIC % (stream, 1), result.stopTimer())
+        #
+        if not read_only:
+            if compare_refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, rf2_mode, result):
+                return 1
+        result.startTimer()
+        if not read_only:
+            if run_refresh_func2(conn, data_dir, delete_dir, stream, num_streams, verbose, rf2_mode, result):
+                return 1
+        result.setMetric(REFRESH_METRIC % (stream, 2), result.stopTimer())
+        #
     return 0
 
 
@@ -419,23 +876,32 @@ def get_timedelta_in_seconds(time_interval):
     return secs
 
 
+def load_run_results(results_dir, run_timestamp):
+    """Load the results of the power and throughput tests of one run from the results store
+
+    :param results_dir: path to results directory
+    :param run_timestamp: name of the run folder, format run_YYYYMMDD_HHMMSS
+    :return: dictionary with metric name as key and list of values in seconds as value, see warehouse.load_metrics()
+    """
+    return wh.load_metrics(results_dir, run_timestamp, [POWER, THROUGHPUT])
+
+
 def get_average(results, metric_name):
     """Calculate average value for the metric
 
-    :param results: list of results
+    :param results: dictionary of results, see load_run_results()
     :param metric_name: metric name
     :return: average value for value from results with specified metric name
     """
-    values = [js["value"] for js in results if js["key"] == metric_name]
-    seconds = [get_timedelta_in_seconds(value) for value in values]
-    avg = sum(seconds) / len(values)
+    seconds = results[metric_name]
+    avg = sum(seconds) / len(seconds)
     return avg
 
 
 def qi(results, i, s):
     """Calculate execution time for query Qi within the query stream s
 
-    :param results: list of results
+    :param results: dictionary of results, see load_run_results()
     :param i: the ordering number of the query ranging from 1 to 22
     :param s: either 0 for the power function or the position of the query stream for the throughput tests
     :return: execution time for query Qi within the query stream s
@@ -450,7 +916,7 @@ def qi(results, i, s):
 def ri(results, j, s):
     """Calculate execution time for the refresh function RFi within a refresh stream s
 
-    :param results: list of results
+    :param results: dictionary of results, see load_run_results()
     :param j: ordering function of the refresh function ranging from 1 to 2
     :param s: either 0 for the power function
     or the position of the pair of refresh functions in the stream for the throughput tests
@@ -466,7 +932,7 @@ def ri(results, j, s):
 def ts(results):
     """Calculate average total time needed to execute the throughput tests
 
-    :param results: list of results
+    :param results: dictionary of results, see load_run_results()
     :return: total time needed to execute the throughput tests
     """
     metric_name = THROUGHPUT_TOTAL_METRIC
@@ -477,17 +943,17 @@ def ts(results):
 def get_power_size(results, scale_factor):
     """Calculate the Power@Size
 
-    :param results: list of results
+    :param results: dictionary of results, see load_run_results()
     :param scale_factor: scale factor
     :return: Power@Size
     """
-    qi_product = 1
-    for i in range(1, NUM_QUERIES + 1):
-        qi_product *= qi(results, i, 0)
-    ri_product = 1
-    for j in [1, 2]:  # two refresh functions
-        ri_product *= ri(results, j, 0)
-    denominator = math.pow(qi_product * ri_product, 1/24)
+    times = [qi(results, i, 0) for i in range(1, NUM_QUERIES + 1)]
+    times += [ri(results, j, 0) for j in [1, 2]]  # two refresh functions
+    # as in clause 5.4.1.4 of the specification, times below 1/1000 of the longest one are raised to it,
+    # e.g. the refresh functions skipped by --read-only, which would make the geometric mean zero
+    shortest = max(times) / 1000
+    times = [max(t, shortest) for t in times]
+    denominator = stats.geometric_mean(times)  # 24th root of the product, in log space
     power_size = (3600 / denominator) * scale_factor
     return power_size
 
@@ -495,7 +961,7 @@ def get_power_size(results, scale_factor):
 def get_throughput_size(results, scale_factor, num_streams):
     """Calculate the Troughput@Size
 
-    :param results: list of results
+    :param results: dictionary of results, see load_run_results()
     :param scale_factor: scale factor
     :param num_streams: number of streams
     :return: Troughput@Size
@@ -524,7 +990,7 @@ def calc_metrics(results_dir, run_timestamp, scale_factor, num_streams):
     :param num_streams: number of streams
     :return: none
     """
-    results = load_results(results_dir)
+    results = load_run_results(results_dir, run_timestamp)
     res = r.Result("Metric")
     #
     power_size = get_power_size(results, scale_factor)
@@ -541,3 +1007,37 @@ def calc_metrics(results_dir, run_timestamp, scale_factor, num_streams):
     #
     res.printMetrics("Metrics")
     res.saveMetrics(results_dir, run_timestamp, "metrics")
+
+
+def summarize_runs(results_dir, run_timestamp, runs):
+    """Summarize the query times and metrics of repeated runs, see calc_metrics(), with the median, p95,
+    standard deviation and bootstrap confidence interval of the median of every metric, see stats.summarize().
+    Every metric has one value per run, e.g. the time of query 1 in stream 2; the streams are not averaged.
+
+    The summary is saved as summary/Summary.json in the folder of the run, with metric names like
+    power_size_median or query_stream_0_query_1_ci_low.
+
+    :param results_dir: path to the results folder
+    :param run_timestamp: name of the run folder, format run_YYYYMMDD_HHMMSS
+    :param runs: names of the run folders of the measured runs
+    :return: dictionary with metric name as key and dictionary of statistics as value
+    """
+    values = dict()
+    for run in runs:
+        results = wh.load_metrics(results_dir, run, [POWER, THROUGHPUT, "metrics"])
+        for name, seconds in results.items():
+            if name in SUMMARY_METRICS or SUMMARY_QUERY_RE.match(name):
+                values.setdefault(name, []).append(sum(seconds) / len(seconds))
+    summary = dict((name, stats.summarize(values[name])) for name in sorted(values))
+    res = r.Result("Summary")
+    for name, statistics in summary.items():
+        for statistic, value in statistics.items():
+            res.setMetric("%s_%s" % (name, statistic), value)
+    res.saveMetrics(results_dir, run_timestamp, "summary")
+    for name, title in zip(SUMMARY_METRICS, ["Power@Size", "Throughput@Size", "QphH@Size"]):
+        if name in summary:
+            statistics = summary[name]
+            print("%s = %s (p95 %s, stdev %s, %s%% CI %s .. %s, n = %s)" %
+                  (title, statistics["median"], statistics["p95"], statistics["stdev"],
+                   int(stats.CONFIDENCE * 100), statistics["ci_low"], statistics["ci_high"], statistics["n"]))
+    return summary
@@ -2,6 +2,8 @@ import json
 import datetime as dt
 import os
 
+from tpch4pgsql import warehouse as wh
+
 
 class Result:
     """Class for storing result for metrics, with start/stop times, used for calculation of benchmark metrics
@@ -61,3 +63,4 @@ class Result:
             metrics[key] = str(value)
         with open(os.path.join(path, self.__title__ + '.json'), 'w') as fp:
             json.dump(metrics, fp, indent=4, sort_keys=True)
+        wh.save_metrics(results_dir, run_timestamp, folder, self.__title__, self.__metrics__)
@@ -0,0 +1,158 @@
+import re
+import datetime as dt
+
+PRIMARY_KEY_RE = re.compile(r"ALTER\s+TABLE\s+(\w+)\s+ADD\s+PRIMARY\s+KEY", re.IGNORECASE)
+FOREIGN_KEY_RE = re.compile(r"ALTER\s+TABLE\s+(\w+)\s+ADD\s+FOREIGN\s+KEY\s*\(.*?\)\s*REFERENCES\s+(\w+)",
+                            re.IGNORECASE | re.DOTALL)
+INDEX_RE = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+(\w+)\s+ON\s+(\w+)", re.IGNORECASE)
+CREATE_TABLE_RE = re.compile(r"CREATE\s+(?:UNLOGGED\s+)?TABLE\s+(\w+)", re.IGNORECASE)
+PARTITIONED_TABLE_RE = re.compile(r"CREATE\s+TABLE\s+(\w+)\s*\([^;]*\)\s*PARTITION\s+BY\s+RANGE\s*\(\s*(\w+)\s*\)",
+                                  re.IGNORECASE)
+# dates generated by dbgen, incl. ship dates up to 121 days after the last order date
+FIRST_DATE = dt.date(1992, 1, 1)
+END_DATE = dt.date(1999, 1, 1)
+
+
+def strip_comments(sql):
+    """Remove comments from a SQL script
+
+    :param sql: content of the script
+    :return: script without comments
+    """
+    return re.sub(r"--[^\n]*", "", sql)
+
+
+def split_statements(sql):
+    """Split a SQL script into single statements, dropping comments
+
+    :param sql: content of the script
+    :return: list of statements without the terminating semicolon
+    """
+    sql = strip_comments(sql)
+    return [stmt.strip() for stmt in sql.split(";") if stmt.strip()]
+
+
+def read_statements(filepath):
+    """Read a SQL script and split it into single statements
+
+    :param filepath: path to the script
+    :return: list of statements
+    """
+    with open(filepath) as sql_file:
+        return split_statements(sql_file.read())
+
+
+def unlogged(sql):
+    """Turn all CREATE TABLE statements of a script into CREATE UNLOGGED TABLE
+
+    :param sql: SQL script, e.g. create_tbl.sql
+    :return: modified script
+    """
+    return re.sub(r"CREATE\s+TABLE", "CREATE UNLOGGED TABLE", sql, flags=re.IGNORECASE)
+
+
+def create_table_statements(statements):
+    """Find the CREATE TABLE statement of every table
+
+    :param statements: list of statements, e.g. of create_tbl.sql
+    :return: dictionary with upper case table name as key and list of statements creating it as value
+    """
+    tables = dict()
+    for sql in statements:
+        match = CREATE_TABLE_RE.match(sql)
+        if match:
+            tables.setdefault(match.group(1).upper(), []).append(sql)
+    return tables
+
+
+def partitioned_tables(sql):
+    """Find the tables of a script partitioned by range
+
+    :param sql: SQL script, e.g. create_tbl.sql of the partitioned schema profile
+    :return: list of tuples (table, partition key column) in the order of the script
+    """
+    return PARTITIONED_TABLE_RE.findall(strip_comments(sql))
+
+
+def month_bounds(num_partitions, first=FIRST_DATE, end=END_DATE):
+    """Split a date range into ranges of whole months of about the same length
+
+    :param num_partitions: number of ranges wanted, at most the number of months
+    :param first: first date of the range
+    :param end: date after the range, both must be the first of a month
+    :return: list of num_partitions + 1 dates, each range from one date to the next
+    """
+    months = (end.year - first.year) * 12 + end.month - first.month
+    num_partitions = max(1, min(num_partitions, months))
+    bounds = []
+    for i in range(num_partitions + 1):
+        month = first.month - 1 + months * i // num_partitions
+        bounds.append(dt.date(first.year + month // 12, month % 12 + 1, 1))
+    return bounds
+
+
+def partition_statements(sql, num_partitions):
+    """Build the statements creating the partitions of all tables partitioned by range in a script
+
+    Every table gets num_partitions partitions over the dates generated by dbgen, and a default
+    partition for anything outside of them, e.g. LINEITEM_P1 ... LINEITEM_P7 and LINEITEM_DEFAULT.
+
+    :param sql: SQL script, e.g. create_tbl.sql of the partitioned schema profile
+    :param num_partitions: number of date ranges per table
+    :return: list of statements
+    """
+    bounds = month_bounds(num_partitions)
+    statements = []
+    for table, column in partitioned_tables(sql):
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:])):
+            statements.append("CREATE TABLE %s_P%s PARTITION OF %s FOR VALUES FROM ('%s') TO ('%s')" %
+                              (table, i + 1, table, start.isoformat(), end.isoformat()))
+        statements.append("CREATE TABLE %s_DEFAULT PARTITION OF %s DEFAULT" % (table, table))
+    return statements
+
+
+def index_graph(statements):
+    """Build the dependency graph of the statements creating primary keys, foreign keys and indexes
+
+    A foreign key depends on the primary key of the referenced table, and every statement on a table
+    depends on the primary key of that table, which locks the whole table while it is built.
+    Statements not recognized are barriers, depending on all statements before them.
+
+    :param statements: list of statements, e.g. of create_idx.sql
+    :return: list of nodes in the order of the script, each a dict with
+    name (unique metric name), table, sql and depends (list of names of other nodes)
+    """
+    nodes = []
+    primary_keys = dict()
+    barrier = None
+    for sql in statements:
+        pk = PRIMARY_KEY_RE.match(sql)
+        fk = FOREIGN_KEY_RE.match(sql)
+        idx = INDEX_RE.match(sql)
+        if pk:
+            table = pk.group(1).lower()
+            node = {"name": "pk_%s" % table, "table": table, "depends": []}
+            primary_keys[table] = node["name"]
+        elif fk:
+            table, referenced = fk.group(1).lower(), fk.group(2).lower()
+            node = {"name": "fk_%s_%s" % (table, referenced), "table": table,
+                    "depends": [primary_keys[t] for t in (referenced, table) if t in primary_keys]}
+        elif idx:
+            table = idx.group(2).lower()
+            node = {"name": idx.group(1).lower(), "table": table,
+                    "depends": [primary_keys[table]] if table in primary_keys else []}
+        else:
+            node = {"name": "statement_%s" % (len(nodes) + 1), "table": None,
+                    "depends": [n["name"] for n in nodes]}
+        if barrier is not None and barrier not in node["depends"]:
+            node["depends"].append(barrier)
+        names = set(n["name"] for n in nodes)
+        name, suffix = node["name"], 1
+        while node["name"] in names:
+            suffix += 1
+            node["name"] = "%s_%s" % (name, suffix)
+        if node["table"] is None:
+            barrier = node["name"]
+        node["sql"] = sql
+        nodes.append(node)
+    return nodes
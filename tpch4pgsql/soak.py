@@ -0,0 +1,398 @@
+import os
+import csv
+import time
+import functools
+import threading
+from threading import BrokenBarrierError
+
+from tpch4pgsql import executor as ex, postgresqldb as pgdb, query, result as r, stats, transform as tr
+
+SOAK = "soak"  # folder of a run with the results of the soak test
+WINDOWS_FILE = "Windows.csv"
+DEFAULT_WINDOW = 60  # seconds
+LATENCY_PERCENTILES = [("p50", 50), ("p95", 95), ("p99", 99)]
+# server statistics sampled at the end of every window, see server_sample()
+SAMPLES = [("dead_tuples", ["SELECT sum(n_dead_tup) FROM pg_stat_user_tables"]),
+           ("autovacuums", ["SELECT sum(autovacuum_count) FROM pg_stat_user_tables"]),
+           ("checkpoints", ["SELECT num_timed + num_requested FROM pg_stat_checkpointer",  # PostgreSQL 17+
+                            "SELECT checkpoints_timed + checkpoints_req FROM pg_stat_bgwriter"])]
+COUNTERS = ["autovacuums", "checkpoints"]  # reported as the difference to the window before
+WINDOW_COLUMNS = ["window", "start", "queries", "queries_per_second"] + \
+                 ["latency_%s" % name for name, p in LATENCY_PERCENTILES] + \
+                 ["latency_max", "refresh_pairs", "rf1_mean", "rf2_mean", "errors"] + \
+                 [name for name, statements in SAMPLES]
+DRIFT_METRICS = ["queries_per_second", "latency_p95", "dead_tuples"]  # checked for drift, see analyze_windows()
+STEADY_METRICS = ["queries_per_second", "latency_p95"]  # have to be steady for the steady state
+
+
+def new_window():
+    return {"query": stats.LatencyHistogram(), "rf1": [], "rf2": [], "errors": 0, "sample": dict()}
+
+
+class WindowedRecorder:
+    """Events of the soak test grouped into windows of fixed length by their end time, thread safe
+
+    """
+    def __init__(self, window):
+        self.__window__ = window
+        self.__lock__ = threading.Lock()
+        self.__windows__ = dict()  # window index -> dictionary, see new_window()
+        self.__start__ = None  # as time.perf_counter(), see begin()
+        self.__deadline__ = None
+        self.__started__ = threading.Event()
+
+    def begin(self, duration):
+        """Start the first window, when all streams are connected
+
+        :param duration: seconds the test runs
+        :return: tuple (start, deadline) as time.perf_counter()
+        """
+        self.__start__ = time.perf_counter()
+        self.__deadline__ = self.__start__ + duration
+        self.__started__.set()
+        return self.__start__, self.__deadline__
+
+    def getDeadline(self):
+        """
+        :return: end of the test as time.perf_counter(), waits until the test has begun
+        """
+        self.__started__.wait()
+        return self.__deadline__
+
+    def __window_of__(self, end):
+        index = int((end - self.__start__) // self.__window__)
+        if index not in self.__windows__:
+            self.__windows__[index] = new_window()
+        return self.__windows__[index]
+
+    def record(self, kind, seconds, end):
+        """
+        :param kind: query, rf1 or rf2
+        :param seconds: time of the query or refresh function
+        :param end: end time as time.perf_counter()
+        """
+        with self.__lock__:
+            window = self.__window_of__(end)
+            if kind == "query":
+                window["query"].record(seconds)
+            else:
+                window[kind].append(seconds)
+
+    def recordError(self, end):
+        with self.__lock__:
+            self.__window_of__(end)["errors"] += 1
+
+    def recordSample(self, index, sample):
+        """
+        :param index: window index, the sample is taken at the end of this window
+        :param sample: dictionary of server statistics, see server_sample()
+        """
+        with self.__lock__:
+            self.__windows__.setdefault(index, new_window())["sample"] = sample
+
+    def getWindows(self, num_windows, initial_sample=None):
+        """Summarize the complete windows
+
+        :param num_windows: number of windows, later events, e.g. queries finishing after the end, are ignored
+        :param initial_sample: server statistics at the start, so that counters are reported per window
+        :return: list of dictionaries with the columns of WINDOW_COLUMNS
+        """
+        summaries = []
+        previous = initial_sample or dict()
+        with self.__lock__:
+            for index in range(num_windows):
+                window = self.__windows__.get(index, new_window())
+                histogram = window["query"]
+                summary = {"window": index, "start": index * self.__window__, "queries": histogram.getCount(),
+                           "queries_per_second": histogram.getCount() / self.__window__,
+                           "latency_max": histogram.getMax(), "refresh_pairs": len(window["rf2"]),
+                           "rf1_mean": sum(window["rf1"]) / len(window["rf1"]) if window["rf1"] else None,
+                           "rf2_mean": sum(window["rf2"]) / len(window["rf2"]) if window["rf2"] else None,
+                           "errors": window["errors"]}
+                for name, p in LATENCY_PERCENTILES:
+                    summary["latency_%s" % name] = histogram.getPercentile(p)
+                sample = window["sample"]
+                for name, statements in SAMPLES:
+                    summary[name] = sample.get(name)
+                    if name in COUNTERS:
+                        summary[name] = sample[name] - previous[name] \
+                            if sample.get(name) is not None and previous.get(name) is not None else None
+                if sample:
+                    previous = sample
+                summaries.append(summary)
+        return summaries
+
+
+def server_sample(conn):
+    """Sample the statistics of the server that show bloat and background work
+
+    :param conn: open connection to the database
+    :return: dictionary with dead_tuples, autovacuums and checkpoints (counts since the statistics were reset),
+    without the statistics the server does not provide
+    """
+    sample = dict()
+    for name, statements in SAMPLES:
+        for statement in statements:
+            try:
+                value = conn.fetchValue(statement)
+                if value is not None:
+                    sample[name] = int(value)
+                break
+            except Exception:
+                conn.rollback()
+    conn.rollback()  # no transaction is kept open for the whole test
+    return sample
+
+
+def run_sampler(conn, recorder, start, window, num_windows, stop):
+    """Sample the server statistics at the end of every window, see server_sample()
+
+    :param stop: threading.Event set to stop early, e.g. if the test failed
+    """
+    try:
+        for index in range(num_windows):
+            if stop.wait(max(0, start + (index + 1) * window - time.perf_counter())):
+                return
+            recorder.recordSample(index, server_sample(conn))
+    finally:
+        conn.close()
+
+
+def run_soak_stream(query_root, generated_query_dir, host, port, database, user, password, itersize,
+                    recorder, stream, barrier):
+    """Run the queries of one stream over and over until the deadline, see executor.StreamExecutor.
+    Every query is committed, so that no snapshot is held that keeps vacuum from removing dead rows,
+    and a failing query is counted without stopping the stream.
+
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip
+    :param recorder: WindowedRecorder, which gives the end of the test; the query running then is finished
+    :param stream: stream number
+    :param barrier: barrier, passed after connecting so that all streams start at the same time
+    :return: result object with the number of queries run, raises query.StreamError if the stream could not start
+    """
+    try:
+        conn = pgdb.connect(host, port, database, user, password)
+    except Exception as e:
+        raise query.StreamError("unable to connect to DB for query in stream #%s: %s" % (stream, e))
+    try:
+        query_set = query.QuerySet(query_root, generated_query_dir, stream)
+        try:
+            barrier.wait(query.STREAM_CONNECT_TIMEOUT)
+        except BrokenBarrierError:
+            raise query.StreamError("query stream #%s not started, another stream could not connect" % stream)
+        deadline = recorder.getDeadline()
+        count = 0
+        while time.perf_counter() < deadline:
+            for q, statements in query_set.getQueries():
+                if time.perf_counter() >= deadline:
+                    break
+                start = time.perf_counter()
+                try:
+                    conn.runStatements(statements, itersize)
+                    conn.commit()
+                    end = time.perf_counter()
+                    recorder.record("query", end - start, end)
+                    count += 1
+                except Exception as e:
+                    print("unable to execute query %s in stream %s: %s" % (q, stream, e))
+                    conn.rollback()
+                    recorder.recordError(time.perf_counter())
+        result = r.Result("SoakQueryStream%s" % stream)
+        result.setMetric("soak_stream_%s_queries" % stream, count)
+        return result
+    finally:
+        conn.close()
+
+
+def read_order_keys(data_dir, update_dir, stream):
+    """Read the keys of the orders inserted by refresh function #1 of a stream
+
+    :return: list of keys as strings
+    """
+    filepath = os.path.join(data_dir, update_dir, "orders.tbl.u" + str(stream + 1) + ".csv")
+    with tr.open_data_file(filepath) as in_file:
+        return [line.split("|", 1)[0] for line in in_file if line.strip()]
+
+
+def run_refresh_pairs(conn, data_dir, update_dir, num_streams, verbose, rf1_mode, recorder, deadline):
+    """Run refresh pairs until the deadline, cycling through the refresh data of streams 0..num_streams.
+    The second function of a pair deletes the orders the first one inserted, instead of the orders of the
+    delete file, so that the pairs can be repeated for hours while the size of the database stays the same.
+
+    :param conn: open connection to the database
+    :param recorder: WindowedRecorder
+    :param deadline: end of the test as time.perf_counter()
+    :return: 0 if successful, 1 otherwise
+    """
+    keys = dict()
+    stream = 0
+    try:
+        cascade = query.deletes_cascade(conn)
+        conn.rollback()
+    except Exception as e:
+        print("refresh function #2 failed. %s" % e)
+        return 1
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if query.run_refresh_func1(conn, data_dir, update_dir, stream, num_streams, verbose, rf1_mode):
+            return 1
+        end = time.perf_counter()
+        recorder.record("rf1", end - start, end)
+        try:
+            if stream not in keys:
+                keys[stream] = read_order_keys(data_dir, update_dir, stream)
+            query.delete_in_list(conn, keys[stream], cascade=cascade)
+            conn.commit()
+        except Exception as e:
+            print("refresh function #2 failed. %s" % e)
+            return 1
+        finished = time.perf_counter()
+        recorder.record("rf2", finished - end, finished)
+        stream = (stream + 1) % (num_streams + 1)
+    return 0
+
+
+def analyze_windows(windows, res):
+    """Find the steady state of the windows and the drift after it, see stats.steady_state() and stats.drift()
+
+    The steady state starts at the first window from which queries per second and p95 latency are both
+    steady. Drift is calculated over the windows of the steady state, or over all windows if it is never
+    reached, and flagged if it exceeds stats.DRIFT_THRESHOLD.
+
+    :param windows: list of window summaries, see WindowedRecorder.getWindows()
+    :param res: result object for the metrics
+    :return: tuple (index of the first steady window or None, dictionary with the metrics that drift as key
+    and their drift as value)
+    """
+    starts = [stats.steady_state([window[name] for window in windows]) for name in STEADY_METRICS]
+    steady = None if None in starts else max(starts)
+    if steady is not None:
+        res.setMetric("soak_steady_state_window", steady)
+        res.setMetric("soak_steady_state_seconds", windows[steady]["start"])
+    res.setMetric("soak_steady", steady is not None)
+    drifting = dict()
+    for name in DRIFT_METRICS:
+        series = [window[name] for window in windows[steady or 0:]]
+        if None in series:
+            continue
+        value = stats.drift(series)
+        res.setMetric("soak_%s_drift" % name, value)
+        if abs(value) > stats.DRIFT_THRESHOLD:
+            drifting[name] = value
+    res.setMetric("soak_drifting", ", ".join(sorted(drifting)))
+    return steady, drifting
+
+
+def save_windows(results_dir, run_timestamp, windows):
+    """Save the window summaries as CSV, one line per window
+
+    :return: path of the file
+    """
+    path = os.path.join(results_dir, run_timestamp, SOAK)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, WINDOWS_FILE), "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, WINDOW_COLUMNS)
+        writer.writeheader()
+        writer.writerows(windows)
+    return os.path.join(path, WINDOWS_FILE)
+
+
+def run_soak(query_root, data_dir, update_dir, generated_query_dir, results_dir, host, port, database, user,
+             password, run_timestamp, num_streams, verbose, read_only, duration, window=DEFAULT_WINDOW,
+             rf1_mode="rows", itersize=None):
+    """Run a soak test: the query streams run their queries over and over, and refresh pairs run one after the
+    other, for the given duration, to see how the server behaves after hours of mixed traffic.
+
+    The throughput and latency of the queries, the refresh pairs, and the dead tuples, autovacuum runs and
+    checkpoints of the server are summarized per window and saved as soak/Windows.csv in the folder of the run.
+    The steady state and drift, see analyze_windows(), are saved as soak/Soak.json.
+
+    :param query_root: directory where generated SQL statements are stored
+    :param data_dir: subdirectory with data to be loaded
+    :param update_dir: subdirectory with data to be updated
+    :param generated_query_dir: subdirectory with generated queries
+    :param results_dir: path to the results folder
+    :param host: hostname where the Postgres database is running
+    :param port: port number where the Postgres database is listening
+    :param database: database name, where the benchmark will be run
+    :param user: username of the Postgres user with full access to the benchmark DB
+    :param password: password for the Postgres user
+    :param run_timestamp: name of the run folder, format run_YYYYMMDD_HHMMSS
+    :param num_streams: number of query streams
+    :param verbose: True if more verbose output is required
+    :param read_only: True if no refresh pairs are to be run
+    :param duration: seconds the test runs
+    :param window: seconds per window, at most the duration
+    :param rf1_mode: "rows" or "bulk", see query.run_refresh_func1()
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip
+    :return: 0 if successful, 1 otherwise
+    """
+    if query.check_query_sets(query_root, generated_query_dir, num_streams):
+        return 1
+    try:
+        print("Soak test started for %s seconds ..." % duration)
+        num_windows = int(duration // window)
+        recorder = WindowedRecorder(window)
+        conn = pgdb.connect(host, port, database, user, password)
+        sampler_conn = pgdb.connect(host, port, database, user, password)
+        try:
+            initial_sample = server_sample(conn)
+            streams = ex.create_executor("thread", num_streams)  # the streams share the recorder
+            streams.start(functools.partial(run_soak_stream, query_root, generated_query_dir, host, port, database,
+                                            user, password, itersize, recorder), range(1, num_streams + 1))
+            if not streams.wait_ready(query.STREAM_CONNECT_TIMEOUT):
+                streams.join()
+                print("unable to connect all query streams")
+                return 1
+            start, deadline = recorder.begin(duration)
+            stop = threading.Event()
+            sampler = threading.Thread(target=run_sampler,
+                                       args=(sampler_conn, recorder, start, window, num_windows, stop))
+            sampler.start()
+            try:
+                if read_only:
+                    time.sleep(max(0, deadline - time.perf_counter()))
+                    refreshed = 0
+                else:
+                    refreshed = run_refresh_pairs(conn, data_dir, update_dir, num_streams, verbose, rf1_mode,
+                                                  recorder, deadline)
+                failed = streams.join()
+            finally:
+                stop.set()
+                sampler.join()
+        finally:
+            conn.close()
+            sampler_conn.close()
+        if refreshed:
+            print("unable to finish the refresh pairs")
+            return 1
+        if failed:
+            print("query streams %s failed" % ", ".join(str(stream) for stream in sorted(failed)))
+            return 1
+        #
+        windows = recorder.getWindows(num_windows, initial_sample)
+        res = r.Result("Soak")
+        res.setMetric("soak_duration", duration)
+        res.setMetric("soak_window", window)
+        res.setMetric("soak_queries", sum(w["queries"] for w in windows))
+        res.setMetric("soak_refresh_pairs", sum(w["refresh_pairs"] for w in windows))
+        res.setMetric("soak_errors", sum(w["errors"] for w in windows))
+        for w in windows:
+            print("window %s: %s queries, %.3f per second, p95 %.3fs, %s refresh pairs" %
+                  (w["window"], w["queries"], w["queries_per_second"], w["latency_p95"], w["refresh_pairs"]))
+        steady, drifting = analyze_windows(windows, res)
+        if steady is not None:
+            print("steady state reached after %s seconds" % windows[steady]["start"])
+        else:
+            print("no steady state reached")
+        for name, value in sorted(drifting.items()):
+            print("%s drifts by %.1f%%" % (name, 100 * value))
+        if verbose:
+            res.printMetrics()
+        res.saveMetrics(results_dir, run_timestamp, SOAK)
+        print("Soak windows saved as %s" % save_windows(results_dir, run_timestamp, windows))
+        print("Soak test finished.")
+    except Exception as e:
+        print("unable to run the soak test: %s" % e)
+        return 1
+    return 0
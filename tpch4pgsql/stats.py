@@ -0,0 +1,202 @@
+import math
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # optional, the statistics are calculated in pure Python otherwise
+
+BOOTSTRAP_SAMPLES = 2000
+CONFIDENCE = 0.95
+BOOTSTRAP_SEED = 42  # fixed, so that the same samples give the same intervals
+STEADY_WINDOWS = 5  # consecutive windows that have to agree for a steady state, see steady_state()
+STEADY_CV = 0.1  # largest coefficient of variation of these windows
+DRIFT_THRESHOLD = 0.1  # relative change over the steady state that is flagged as drift, see drift()
+
+
+def geometric_mean(values):
+    """Calculate the geometric mean in log space, which neither overflows nor underflows like the product
+    of many values, e.g. the 22 query times of Power@Size
+
+    :param values: list of positive numbers
+    :return: geometric mean
+    """
+    if numpy is not None:
+        return float(numpy.exp(numpy.mean(numpy.log(numpy.asarray(values, dtype=float)))))
+    return math.exp(math.fsum(math.log(value) for value in values) / len(values))
+
+
+def percentile(values, p):
+    """Calculate a percentile with linear interpolation between the closest ranks
+
+    :param values: list of numbers
+    :param p: percentile, 0 to 100
+    :return: percentile of the values
+    """
+    if numpy is not None:
+        return float(numpy.percentile(values, p))
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    lower = int(math.floor(rank))
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def median(values):
+    return percentile(values, 50)
+
+
+def stdev(values):
+    """
+    :return: sample standard deviation, 0 for less than two values
+    """
+    if len(values) < 2:
+        return 0.0
+    if numpy is not None:
+        return float(numpy.std(values, ddof=1))
+    mean = math.fsum(values) / len(values)
+    return math.sqrt(math.fsum((value - mean) ** 2 for value in values) / (len(values) - 1))
+
+
+def bootstrap_ci(values, statistic=median, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE):
+    """Calculate a percentile bootstrap confidence interval of a statistic
+
+    :param values: list of numbers
+    :param statistic: function calculating the statistic of a list of numbers
+    :param samples: number of resamples
+    :param confidence: confidence level, e.g. 0.95
+    :return: tuple (lower bound, upper bound)
+    """
+    if numpy is not None:
+        rng = numpy.random.default_rng(BOOTSTRAP_SEED)
+        resamples = rng.choice(numpy.asarray(values, dtype=float), size=(samples, len(values)))
+        estimates = [statistic(resample) for resample in resamples]
+    else:
+        rng = random.Random(BOOTSTRAP_SEED)
+        estimates = [statistic(rng.choices(values, k=len(values))) for i in range(samples)]
+    alpha = (1 - confidence) / 2 * 100
+    return percentile(estimates, alpha), percentile(estimates, 100 - alpha)
+
+
+def summarize(values):
+    """Calculate the robust statistics of repeated measurements
+
+    :param values: list of numbers, one per run
+    :return: dictionary with n, median, p95, stdev, ci_low and ci_high, the bootstrap confidence interval
+    of the median
+    """
+    ci_low, ci_high = bootstrap_ci(values)
+    return {"n": len(values), "median": median(values), "p95": percentile(values, 95), "stdev": stdev(values),
+            "ci_low": ci_low, "ci_high": ci_high}
+
+
+def steady_state(series, windows=STEADY_WINDOWS, max_cv=STEADY_CV):
+    """Find where a windowed metric, e.g. queries per minute, reaches a steady state: the first window
+    from which the given number of consecutive windows has a coefficient of variation of at most max_cv
+
+    :param series: list of numbers, one per window
+    :return: index of the first window of the steady state, None if it is never reached
+    """
+    for first in range(len(series) - windows + 1):
+        values = series[first:first + windows]
+        mean = math.fsum(values) / windows
+        if mean == 0 or stdev(values) / abs(mean) <= max_cv:
+            return first
+    return None
+
+
+def drift(series):
+    """Calculate the drift of a windowed metric, as the change of its least squares line from the first to
+    the last window relative to its mean, e.g. 0.2 if it grows by a fifth of its mean
+
+    :param series: list of numbers, one per window
+    :return: relative change, 0 for less than two windows or a mean of 0
+    """
+    n = len(series)
+    mean = math.fsum(series) / n if n else 0
+    if n < 2 or mean == 0:
+        return 0.0
+    x_mean = (n - 1) / 2
+    slope = math.fsum((x - x_mean) * (y - mean) for x, y in enumerate(series)) / \
+        math.fsum((x - x_mean) ** 2 for x in range(n))
+    return slope * (n - 1) / abs(mean)
+
+
+class LatencyHistogram:
+    """Histogram of latencies in the style of HdrHistogram: the buckets are exact below 2^SUB_BUCKET_BITS
+    microseconds and have a relative width of at most 2^-(SUB_BUCKET_BITS - 1), i.e. below 1.6 %, above,
+    so any range of latencies is recorded with fixed memory and bounded error.
+
+    """
+    SUB_BUCKET_BITS = 7
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+    HALF = SUB_BUCKETS >> 1
+
+    def __init__(self):
+        self.__counts__ = dict()  # bucket index -> count, sparse
+        self.__total__ = 0
+        self.__sum__ = 0
+        self.__max__ = 0
+
+    @classmethod
+    def bucketOf(cls, value):
+        if value < cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BUCKET_BITS
+        return shift * cls.HALF + (value >> shift)
+
+    @classmethod
+    def highestValueOf(cls, bucket):
+        """
+        :return: highest value recorded in the bucket, which is reported for it like HdrHistogram does
+        """
+        if bucket < cls.SUB_BUCKETS:
+            return bucket
+        shift = bucket // cls.HALF - 1
+        return ((bucket - shift * cls.HALF + 1) << shift) - 1
+
+    def record(self, seconds, count=1):
+        value = max(0, int(round(seconds * 1000000)))
+        bucket = self.bucketOf(value)
+        self.__counts__[bucket] = self.__counts__.get(bucket, 0) + count
+        self.__total__ += count
+        self.__sum__ += value * count
+        self.__max__ = max(self.__max__, value)
+
+    def add(self, other):
+        """Add the values recorded by another histogram, e.g. of a window to the whole run"""
+        for bucket, count in other.getBuckets():
+            self.__counts__[bucket] = self.__counts__.get(bucket, 0) + count
+        self.__total__ += other.getCount()
+        self.__sum__ += other.__sum__
+        self.__max__ = max(self.__max__, other.__max__)
+
+    def getBuckets(self):
+        """
+        :return: sorted list of tuples (bucket index, count)
+        """
+        return sorted(self.__counts__.items())
+
+    def getCount(self):
+        return self.__total__
+
+    def getMean(self):
+        return self.__sum__ / self.__total__ / 1000000 if self.__total__ else 0.0
+
+    def getMax(self):
+        return self.__max__ / 1000000
+
+    def getPercentile(self, p):
+        """
+        :param p: percentile, 0 to 100
+        :return: latency in seconds at or below which p percent of the values are
+        """
+        if not self.__total__:
+            return 0.0
+        rank = max(1, int(math.ceil(self.__total__ * p / 100)))
+        seen = 0
+        for bucket, count in self.getBuckets():
+            seen += count
+            if seen >= rank:
+                return min(self.highestValueOf(bucket), self.__max__) / 1000000
+        return self.getMax()
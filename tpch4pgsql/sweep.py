@@ -0,0 +1,228 @@
+import os
+import csv
+
+from tpch4pgsql import load, postgresqldb as pgdb, query, result as r, stats, transform as tr
+
+SWEEP = "sweep"  # folder of a run with the scaling curve
+SWEEP_RUN = "%s_streams_%s"  # folder of the throughput test of one stream count
+CURVE_FILE = "ScalingCurve.csv"
+CPU_STAT = "SELECT pg_read_file('/proc/stat')"  # requires superuser or the pg_read_server_files role
+KNEE_THRESHOLD = 0.1  # normalized distance from the straight line below which the curve has no knee
+
+
+def parse_stream_counts(text):
+    """Parse the stream counts of a sweep, e.g. "1-8,12,16"
+
+    :param text: comma separated stream counts or ranges FIRST-LAST
+    :return: sorted list of distinct stream counts
+    """
+    counts = set()
+    for part in text.split(","):
+        first, sep, last = part.strip().partition("-")
+        first = int(first)
+        last = int(last) if sep else first
+        if first < 1 or last < first:
+            raise ValueError("invalid stream count range %s" % part)
+        counts.update(range(first, last + 1))
+    return sorted(counts)
+
+
+def check_sweep(query_root, data_dir, update_dir, delete_dir, generated_query_dir, max_streams, read_only):
+    """Check before the sweep starts that the prepare phase generated a query set of its own for every stream,
+    as streams sharing the substitution parameters of a reused set, see query.stream_queries(), would find
+    each other's data cached and distort the curve, and the refresh data if refresh functions are run
+
+    :param max_streams: largest stream count of the sweep
+    :param read_only: True if no refresh functions are run
+    :return: 0 if everything is there, 1 otherwise
+    """
+    num_sets = query.count_query_sets(query_root, generated_query_dir)
+    if num_sets <= max_streams:
+        print("the sweep needs query sets for streams 0 to %s, but there are %s; run the prepare phase with "
+              "--num-streams %s" % (max_streams, num_sets, max_streams))
+        return 1
+    if not read_only:
+        file_nr = max_streams + 1  # refresh stream s uses the files of s + 1, see query.refresh_func1()
+        for filepath in [os.path.join(data_dir, update_dir, "orders.tbl.u%s.csv" % file_nr),
+                         os.path.join(data_dir, delete_dir, "delete.%s.csv" % file_nr)]:
+            if not os.path.exists(tr.find_data_file(filepath)[0]):
+                print("the sweep needs the refresh data of %s streams, %s is missing; run the prepare phase with "
+                      "--num-streams %s" % (max_streams, filepath, max_streams))
+                return 1
+    return 0
+
+
+def read_cpu_times(host, port, database, user, password):
+    """Read the CPU times of the database server from /proc/stat, through the server itself, so that
+    it works for remote servers too
+
+    :return: tuple (busy, total) in clock ticks summed over all CPUs, None if the server does not allow it,
+    e.g. without superuser or not running on Linux
+    """
+    try:
+        conn = pgdb.connect(host, port, database, user, password)
+        try:
+            stat = conn.fetchValue(CPU_STAT)
+            conn.rollback()
+        finally:
+            conn.close()
+        # cpu user nice system idle iowait irq softirq steal, guest times are included in user and nice
+        times = [int(value) for value in stat.splitlines()[0].split()[1:9]]
+        return sum(times) - times[3] - times[4], sum(times)
+    except Exception as e:
+        print("unable to read the CPU times of the server: %s" % e)
+        return None
+
+
+def cpu_utilization(before, after):
+    """
+    :param before: CPU times at the start, see read_cpu_times()
+    :param after: CPU times at the end
+    :return: average utilization of all CPUs in percent, None if unknown
+    """
+    if before is None or after is None or after[1] == before[1]:
+        return None
+    return 100.0 * (after[0] - before[0]) / (after[1] - before[1])
+
+
+def query_latencies(results, num_streams):
+    """
+    :param results: dictionary of results of a throughput test, see query.load_run_results()
+    :param num_streams: number of query streams of the test
+    :return: dictionary with query number as key and mean time over all streams in seconds as value
+    """
+    latencies = dict()
+    for q in range(1, query.NUM_QUERIES + 1):
+        seconds = [query.get_average(results, query.QUERY_METRIC % (s, q)) for s in range(1, num_streams + 1)]
+        latencies[q] = sum(seconds) / len(seconds)
+    return latencies
+
+
+def find_knee(points):
+    """Find the knee of the scaling curve, the stream count after which adding streams stops paying off,
+    as the point farthest above the straight line from the first to the last point once both axes are
+    normalized to [0, 1] (Kneedle)
+
+    :param points: list of tuples (stream count, Throughput@Size), sorted by stream count
+    :return: stream count of the knee, None if there are less than three points or the curve has no knee,
+    i.e. throughput still scales at the largest stream count
+    """
+    if len(points) < 3:
+        return None
+    x_first, x_last = points[0][0], points[-1][0]
+    y_min = min(y for x, y in points)
+    y_max = max(y for x, y in points)
+    if y_max == y_min:
+        return None
+    distances = [((y - y_min) / (y_max - y_min) - (x - x_first) / (x_last - x_first), x) for x, y in points]
+    distance, knee = max(distances)
+    return knee if distance > KNEE_THRESHOLD else None
+
+
+def save_curve(results_dir, run_timestamp, curve):
+    """Save the scaling curve as CSV, one line per stream count
+
+    :param curve: list of dictionaries with the columns of a point, see run_sweep()
+    :return: path of the file
+    """
+    path = os.path.join(results_dir, run_timestamp, SWEEP)
+    os.makedirs(path, exist_ok=True)
+    columns = ["streams", "throughput_size", "latency_inflation", "server_cpu"]
+    columns += ["query_%s_latency" % q for q in range(1, query.NUM_QUERIES + 1)]
+    columns += ["query_%s_inflation" % q for q in range(1, query.NUM_QUERIES + 1)]
+    with open(os.path.join(path, CURVE_FILE), "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, columns)
+        writer.writeheader()
+        writer.writerows(curve)
+    return os.path.join(path, CURVE_FILE)
+
+
+def run_sweep(query_root, data_dir, update_dir, delete_dir, generated_query_dir, results_dir,
+              host, port, database, user, password, run_timestamp, stream_counts, scale_factor, verbose,
+              read_only, rf1_mode="rows", rf2_mode="in-list", executor="process", itersize=None,
+              statement_timing=False, template=None):
+    """Run the throughput test for a range of stream counts to find where the server stops scaling.
+
+    For every stream count the Throughput@Size, the mean time of every query over all streams, its inflation
+    relative to the smallest stream count and the CPU utilization of the server are recorded. The curve is
+    saved as sweep/ScalingCurve.csv and sweep/Sweep.json in the folder of the run, the throughput tests
+    in the folders run_YYYYMMDD_HHMMSS_streams_N. Nothing is run unless the query sets and refresh data of the
+    largest stream count exist, see check_sweep().
+
+    :param query_root: directory where generated SQL statements are stored
+    :param data_dir: subdirectory with data to be loaded
+    :param update_dir: subdirectory with data to be updated
+    :param delete_dir: subdirectory with data to be deleted
+    :param generated_query_dir: subdirectory with generated queries
+    :param results_dir: path to the results folder
+    :param host: hostname where the Postgres database is running
+    :param port: port number where the Postgres database is listening
+    :param database: database name, where the benchmark will be run
+    :param user: username of the Postgres user with full access to the benchmark DB
+    :param password: password for the Postgres user
+    :param run_timestamp: name of the run folder, format run_YYYYMMDD_HHMMSS
+    :param stream_counts: sorted list of stream counts, see parse_stream_counts()
+    :param scale_factor: scale factor
+    :param verbose: True if more verbose output is required
+    :param read_only: True if no refresh functions are to be run
+    :param rf1_mode: "rows" or "bulk", see query.run_refresh_func1()
+    :param rf2_mode: "in-list", "staged" or "compare", see query.run_refresh_func2()
+    :param executor: "process", "thread" or "asyncio", see query.run_throughput_test()
+    :param itersize: None to only execute the queries, otherwise rows fetched per round trip
+    :param statement_timing: True to time every statement of a query with several statements
+    :param template: name of a template database to recreate the database from before every stream count
+    :return: 0 if successful, 1 otherwise
+    """
+    if check_sweep(query_root, data_dir, update_dir, delete_dir, generated_query_dir, max(stream_counts),
+                   read_only):
+        return 1
+    curve = []
+    sweep = r.Result("Sweep")
+    baseline = None
+    for num_streams in stream_counts:
+        print("Scaling sweep with %s streams ..." % num_streams)
+        if template is not None and load.reset_database(host, port, database, user, password, template):
+            print("unable to reset the database from template %s" % template)
+            return 1
+        run = SWEEP_RUN % (run_timestamp, num_streams)
+        before = read_cpu_times(host, port, database, user, password)
+        if query.run_throughput_test(query_root, data_dir, update_dir, delete_dir, generated_query_dir, results_dir,
+                                     host, port, database, user, password, run, num_streams, verbose, read_only,
+                                     rf1_mode, rf2_mode, executor, itersize, statement_timing):
+            print("unable to run the throughput test with %s streams" % num_streams)
+            return 1
+        server_cpu = cpu_utilization(before, read_cpu_times(host, port, database, user, password))
+        try:
+            results = query.load_run_results(results_dir, run)
+            latencies = query_latencies(results, num_streams)
+            if baseline is None:
+                baseline = latencies
+            inflation = dict((q, latencies[q] / baseline[q]) for q in latencies)
+            point = {"streams": num_streams,
+                     "throughput_size": query.get_throughput_size(results, scale_factor, num_streams),
+                     "latency_inflation": stats.geometric_mean(list(inflation.values())),
+                     "server_cpu": server_cpu}
+        except Exception as e:
+            print("unable to calculate the metrics of %s streams: %s" % (num_streams, e))
+            return 1
+        for q in latencies:
+            point["query_%s_latency" % q] = latencies[q]
+            point["query_%s_inflation" % q] = inflation[q]
+        curve.append(point)
+        for name in ["throughput_size", "latency_inflation", "server_cpu"]:
+            if point[name] is not None:
+                sweep.setMetric("streams_%s_%s" % (num_streams, name), point[name])
+        print("%s streams: Throughput@Size = %s, latency inflation = %s, server CPU = %s%%" %
+              (num_streams, point["throughput_size"], point["latency_inflation"], server_cpu))
+    knee = find_knee([(point["streams"], point["throughput_size"]) for point in curve])
+    if knee is not None:
+        sweep.setMetric("knee_streams", knee)
+        print("Throughput stops scaling at %s streams" % knee)
+    else:
+        print("No knee found, throughput still scales at %s streams" % stream_counts[-1])
+    peak = max(curve, key=lambda point: point["throughput_size"])
+    sweep.setMetric("peak_streams", peak["streams"])
+    sweep.setMetric("peak_throughput_size", peak["throughput_size"])
+    sweep.saveMetrics(results_dir, run_timestamp, SWEEP)
+    print("Scaling curve saved as %s" % save_curve(results_dir, run_timestamp, curve))
+    return 0
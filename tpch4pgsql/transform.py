@@ -0,0 +1,359 @@
+import os
+import io
+import gzip
+import time
+import queue
+import threading
+from multiprocessing import Pool
+
+DELIMITER = b"|"
+BLOCK_SIZE = 16 * 1024 * 1024  # 16MB per read, bounds the memory used by each worker
+PIPE_BLOCK_SIZE = 1024 * 1024  # smaller reads from pipes, so COPY does not wait for dbgen to fill a large block
+# supported compressions of data files with their file extensions and compression levels
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+COMPRESSION_LEVELS = {"gzip": 6, "zstd": 3}
+PREFETCH_BLOCKS = 8  # decompressed blocks buffered ahead of the reader
+
+
+def strip_blocks(blocks, delimiter=DELIMITER):
+    """Strip the trailing delimiter from every line in a stream of byte blocks
+
+    A delimiter at the very end of a block is held back until the next block shows
+    whether it is followed by a newline, so lines may be split anywhere between blocks.
+
+    :param blocks: iterable of byte blocks, as read from a dbgen file
+    :param delimiter: column delimiter used by dbgen
+    :return: generator of transformed byte blocks, never longer than the consumed input
+    """
+    pattern = delimiter + b"\n"
+    carry = b""
+    for block in blocks:
+        if carry:
+            block = carry + block
+        if block.endswith(delimiter):
+            carry = delimiter
+            block = block[:-len(delimiter)]
+        else:
+            carry = b""
+        yield block.replace(pattern, b"\n")
+
+
+def strip_stream(in_file, out_file, block_size=BLOCK_SIZE):
+    """Copy in_file to out_file block by block, stripping trailing delimiters
+
+    :param in_file: file object opened for binary reading
+    :param out_file: file object opened for binary writing
+    :param block_size: number of bytes read at once
+    :return: number of bytes read
+    """
+    blocks = iter(lambda: in_file.read(block_size), b"")
+    for block in strip_blocks(blocks):
+        out_file.write(block)
+    return in_file.tell()
+
+
+def strip_in_place(fname, block_size=BLOCK_SIZE):
+    """Strip trailing delimiters by rewriting the file in place, without a second copy on disk
+
+    The transformed data is never longer than the data read so far, so it can be written
+    behind the read position in the same file, which is truncated at the end.
+
+    :param fname: file to be transformed
+    :param block_size: number of bytes read at once
+    :return: number of bytes read, i.e. original file size
+    """
+    with open(fname, "r+b") as f:
+        positions = {"read": 0, "write": 0}
+
+        def read_blocks():
+            while True:
+                f.seek(positions["read"])
+                block = f.read(block_size)
+                if not block:
+                    return
+                positions["read"] += len(block)
+                yield block
+
+        for block in strip_blocks(read_blocks()):
+            f.seek(positions["write"])
+            f.write(block)
+            positions["write"] += len(block)
+        f.truncate(positions["write"])
+    return positions["read"]
+
+
+class BlockReader(io.RawIOBase):
+    """Binary file-like object handing out the blocks of an iterator, e.g. to feed COPY from a generator
+
+    """
+    def __init__(self, blocks):
+        super().__init__()
+        self.__blocks__ = iter(blocks)
+        self.__block__ = b""
+        self.__pos__ = 0
+        self.__eof__ = False
+        self.size = 0  # bytes handed out so far
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        # fills at most the rest of one block per call, COPY keeps reading until it gets nothing
+        while not self.__eof__ and self.__pos__ >= len(self.__block__):
+            try:
+                self.__block__ = next(self.__blocks__)
+                self.__pos__ = 0
+            except StopIteration:
+                self.__eof__ = True
+        data = self.__block__[self.__pos__:self.__pos__ + len(b)]
+        b[:len(data)] = data
+        self.__pos__ += len(data)
+        self.size += len(data)
+        return len(data)
+
+
+class StrippedReader(BlockReader):
+    """File-like object stripping trailing delimiters on the fly, e.g. to feed COPY straight from a dbgen pipe
+
+    """
+    def __init__(self, raw, block_size=PIPE_BLOCK_SIZE):
+        super().__init__(strip_blocks(iter(lambda: raw.read(block_size), b"")))
+
+
+def import_zstandard():
+    """Import the zstd bindings, which are only needed for zstd compressed data files
+
+    :return: zstandard module
+    """
+    try:
+        import zstandard
+    except ImportError:
+        raise IOError("zstd compression requires the zstandard package (pip3 install zstandard)")
+    return zstandard
+
+
+def open_compressed(filepath, compression, mode):
+    """Open a data file for binary reading or writing, with optional compression
+
+    :param filepath: path to the file, incl. the extension of the compression
+    :param compression: None, "gzip" or "zstd"
+    :param mode: "rb" or "wb"
+    :return: file object
+    """
+    if compression is None:
+        return open(filepath, mode)
+    if compression == "gzip":
+        if "w" in mode:
+            return gzip.open(filepath, mode, compresslevel=COMPRESSION_LEVELS[compression])
+        return gzip.open(filepath, mode)
+    if compression == "zstd":
+        zstandard = import_zstandard()
+        if "w" in mode:
+            compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVELS[compression])
+            return compressor.stream_writer(open(filepath, mode), closefd=True)
+        return zstandard.ZstdDecompressor().stream_reader(open(filepath, mode), closefd=True)
+    raise ValueError("unknown compression %s" % compression)
+
+
+def find_data_file(filepath):
+    """Find a data file, which may have been written compressed
+
+    :param filepath: path to the uncompressed data file
+    :return: tuple (path of the existing file, compression or None);
+    the uncompressed path is returned if no file exists at all
+    """
+    if os.path.exists(filepath):
+        return filepath, None
+    for compression, ext in COMPRESSIONS.items():
+        if os.path.exists(filepath + ext):
+            return filepath + ext, compression
+    return filepath, None
+
+
+class DecompressingReader(BlockReader):
+    """Binary file-like object decompressing a data file in a background thread,
+    so that decompression runs at the same time as the consumer, e.g. a COPY
+
+    """
+    def __init__(self, filepath, compression, block_size=PIPE_BLOCK_SIZE):
+        self.__queue__ = queue.Queue(PREFETCH_BLOCKS)
+        self.__error__ = None
+        self.__done__ = False
+        self.__stop__ = threading.Event()
+        super().__init__(self.__decompressed__())
+        self.__thread__ = threading.Thread(target=self.__fill__, args=(filepath, compression, block_size),
+                                           daemon=True)
+        self.__thread__.start()
+
+    def __fill__(self, filepath, compression, block_size):
+        try:
+            with open_compressed(filepath, compression, "rb") as in_file:
+                for block in iter(lambda: in_file.read(block_size), b""):
+                    self.__queue__.put(block)
+                    if self.__stop__.is_set():
+                        break
+        except Exception as e:
+            self.__error__ = e
+        self.__queue__.put(None)
+
+    def __decompressed__(self):
+        while True:
+            block = self.__queue__.get()
+            if block is None:
+                self.__done__ = True
+                if self.__error__ is not None:
+                    raise IOError("unable to decompress data file. (%s)" % self.__error__)
+                return
+            yield block
+
+    def close(self):
+        if not self.closed:
+            # unblock the background thread if the reader stops early
+            self.__stop__.set()
+            while not self.__done__:
+                self.__done__ = self.__queue__.get() is None
+            self.__thread__.join()
+        super().close()
+
+
+def split_file(filepath, num_chunks):
+    """Split a data file into byte ranges of about the same size, each starting at the beginning of a line
+
+    :param filepath: path to an uncompressed data file
+    :param num_chunks: number of byte ranges wanted
+    :return: list of tuples (start, end) of non empty byte ranges
+    """
+    size = os.path.getsize(filepath)
+    offsets = [0]
+    with open(filepath, "rb") as f:
+        for i in range(1, num_chunks):
+            f.seek(max(size * i // num_chunks, offsets[-1]))
+            if f.tell() > 0:
+                f.seek(f.tell() - 1)
+                f.readline()  # moves to the start of the next line, unless already there
+            offsets.append(f.tell())
+    offsets.append(size)
+    return [(start, end) for start, end in zip(offsets, offsets[1:]) if end > start]
+
+
+class RangeReader(BlockReader):
+    """Binary file-like object reading only a byte range of a file, e.g. one chunk of a table for COPY
+
+    """
+    def __init__(self, filepath, start, end, block_size=PIPE_BLOCK_SIZE):
+        self.__file__ = open(filepath, "rb")
+        self.__file__.seek(start)
+        super().__init__(self.__range__(end - start, block_size))
+
+    def __range__(self, remaining, block_size):
+        while remaining > 0:
+            block = self.__file__.read(min(block_size, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
+
+    def close(self):
+        self.__file__.close()
+        super().close()
+
+
+def open_data_file(filepath):
+    """Open a data file written by the prepare phase as text, decompressing it on the fly if needed
+
+    :param filepath: path to the uncompressed data file
+    :return: text file object
+    """
+    path, compression = find_data_file(filepath)
+    if compression is None:
+        return open(path)
+    return io.TextIOWrapper(io.BufferedReader(DecompressingReader(path, compression)))
+
+
+def same_filesystem(fname, directory):
+    """Check if a file can be moved into a directory by renaming it
+
+    :param fname: path to an existing file
+    :param directory: path to an existing directory
+    :return: True if both are on the same device
+    """
+    return os.stat(fname).st_dev == os.stat(directory).st_dev
+
+
+def transform_file(in_fnames, out_fname, in_place=None, block_size=BLOCK_SIZE, compression=None):
+    """Strip trailing delimiters from input files and write them one after another into the output file
+
+    In place mode rewrites the first input file and renames it to the output file, so the peak
+    disk usage grows by at most one input file instead of the whole dataset. Otherwise the input
+    is streamed into a new output file. Input files are removed afterwards in both cases.
+
+    :param in_fnames: input files, in the order they are to be written
+    :param out_fname: output file, without the extension of the compression
+    :param in_place: True to rewrite in place, False to stream, None to rewrite in place
+    only if the output file is on the same file system as the input
+    :param block_size: number of bytes read at once
+    :param compression: None, "gzip" or "zstd"; compressed files are always streamed
+    :return: number of bytes read
+    """
+    # remove leftovers of earlier runs with another compression, they would be found by find_data_file()
+    for ext in [""] + list(COMPRESSIONS.values()):
+        if os.path.exists(out_fname + ext):
+            os.remove(out_fname + ext)
+    if compression is not None:
+        in_place = False
+        out_fname += COMPRESSIONS[compression]
+    elif in_place is None:
+        in_place = same_filesystem(in_fnames[0], os.path.dirname(os.path.abspath(out_fname)))
+    size = 0
+    if in_place:
+        size += strip_in_place(in_fnames[0], block_size)
+        os.replace(in_fnames[0], out_fname)
+        mode, rest = "ab", in_fnames[1:]
+    else:
+        mode, rest = "wb", in_fnames
+    with open_compressed(out_fname, compression, mode) as out_file:
+        for in_fname in rest:
+            with open(in_fname, "rb") as in_file:
+                size += strip_stream(in_file, out_file, block_size)
+            os.remove(in_fname)
+    return size
+
+
+def transform_job(job):
+    """Run transform_file() for one output file in a worker process
+
+    :param job: tuple of (input files, output file, in place flag, compression)
+    :return: tuple of (output file, bytes read, seconds, error message or None)
+    """
+    in_fnames, out_fname, in_place, compression = job
+    start = time.perf_counter()
+    try:
+        size = transform_file(in_fnames, out_fname, in_place, compression=compression)
+    except IOError as e:
+        return out_fname, 0, time.perf_counter() - start, str(e)
+    return out_fname, size, time.perf_counter() - start, None
+
+
+def transform_files(jobs, num_jobs=1, verbose=True):
+    """Transform several files at once, one file per worker process
+
+    :param jobs: list of tuples (input files, output file, in place flag, compression), see transform_file()
+    :param num_jobs: number of worker processes
+    :param verbose: True to print the throughput for every file
+    :return: 0 if successful, 1 otherwise
+    """
+    if num_jobs > 1 and len(jobs) > 1:
+        with Pool(min(num_jobs, len(jobs))) as pool:
+            results = list(pool.imap_unordered(transform_job, jobs))
+    else:
+        results = [transform_job(job) for job in jobs]
+    failed = 0
+    for out_fname, size, seconds, error in results:
+        if error is not None:
+            print("something bad happened while transforming data file %s. (%s)" % (out_fname, error))
+            failed += 1
+        elif verbose:
+            mb = size / (1024 * 1024)
+            print("transformed %s: %.1f MB in %.2f s (%.1f MB/s)" %
+                  (os.path.basename(out_fname), mb, seconds, mb / seconds if seconds else 0))
+    return 1 if failed else 0
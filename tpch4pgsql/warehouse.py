@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import atexit
+import sqlite3
+import threading
+import datetime as dt
+
+# Local results store: every metric saved by result.Result.saveMetrics(), keyed by run, phase (folder),
+# stream and metric name, with times as float seconds, see connect()
+
+DATABASE = "results.db"
+STREAM_RE = re.compile(r"^(?:query|refresh)_stream_(\d+)_")
+TIMEDELTA_RE = re.compile(r"^(?:(-?\d+) days?, )?(\d+):(\d{2}):(\d{2}(?:\.\d+)?)$")
+SCHEMA = ["CREATE TABLE IF NOT EXISTS metrics (run TEXT NOT NULL, phase TEXT NOT NULL, title TEXT NOT NULL, "
+          "stream INTEGER, metric TEXT NOT NULL, value REAL, text TEXT, PRIMARY KEY (run, phase, title, metric))",
+          "CREATE INDEX IF NOT EXISTS metrics_run_metric ON metrics (run, metric)"]
+TIMEOUT = 60  # seconds to wait for another process writing to the store
+STORES = dict()  # open stores of this process by path, see open_store()
+STORES_LOCK = threading.RLock()  # held while a store is used, as threads share its connection
+
+
+def to_value(value):
+    """Convert a metric into the columns of the store
+
+    :param value: timedelta, number or string, e.g. str(timedelta) of a JSON file
+    :return: tuple (float value or None, text or None); times in seconds
+    """
+    if isinstance(value, dt.timedelta):
+        return value.total_seconds(), None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value), None
+    text = str(value)
+    match = TIMEDELTA_RE.match(text)
+    if match:
+        days, hours, minutes, seconds = match.groups()
+        return int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 + float(seconds), None
+    try:
+        return float(text), None
+    except ValueError:
+        return None, text
+
+
+def stream_of(metric):
+    """
+    :return: stream number in the name of the metric, e.g. 2 for query_stream_2_query_5, None if there is none
+    """
+    match = STREAM_RE.match(metric)
+    return int(match.group(1)) if match else None
+
+
+def connect(results_dir, check_same_thread=True):
+    """Open the results store of a results folder, creating it if needed. A new store imports the
+    JSON files of the runs saved before, see import_json().
+
+    :param results_dir: path to the results folder
+    :param check_same_thread: False if the connection is shared by threads, see open_store()
+    :return: sqlite3 connection
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, DATABASE)
+    new = not os.path.exists(path)
+    conn = sqlite3.connect(path, timeout=TIMEOUT, check_same_thread=check_same_thread)
+    for statement in SCHEMA:
+        conn.execute(statement)
+    if new:
+        import_json(results_dir, conn)
+    conn.commit()
+    return conn
+
+
+def insert_metrics(conn, run_timestamp, phase, title, metrics):
+    """Insert or replace the metrics of one result
+
+    :param conn: open sqlite3 connection, see connect()
+    :param metrics: dictionary with metric name as key
+    """
+    rows = [(run_timestamp, phase, title, stream_of(name), name) + to_value(value) for name, value in metrics.items()]
+    conn.executemany("INSERT OR REPLACE INTO metrics (run, phase, title, stream, metric, value, text) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+def open_store(results_dir):
+    """Open the results store of a results folder once per process, so that saving the many results of
+    a run does not open it again every time. It stays open until close_stores(), at the latest at exit.
+    A process started by fork does not reuse the connection of its parent, as the stores are kept by
+    process id. To be called with STORES_LOCK held.
+
+    :param results_dir: path to the results folder
+    :return: sqlite3 connection
+    """
+    path = os.path.abspath(os.path.join(results_dir, DATABASE))
+    key = (os.getpid(), path)
+    if key in STORES and not os.path.exists(path):  # removed meanwhile, e.g. with the results folder
+        STORES.pop(key).close()
+    if key not in STORES:
+        STORES[key] = connect(results_dir, check_same_thread=False)
+    return STORES[key]
+
+
+@atexit.register
+def close_stores():
+    """Close the stores opened by this process, see open_store()"""
+    with STORES_LOCK:
+        for key in [key for key in STORES if key[0] == os.getpid()]:
+            STORES.pop(key).close()
+
+
+def save_metrics(results_dir, run_timestamp, phase, title, metrics):
+    """Save the metrics of one result in the store of the results folder
+
+    :param results_dir: path to the results folder
+    :param run_timestamp: name of the run folder, format run_YYYYMMDD_HHMMSS
+    :param phase: folder of the result within the run, e.g. power
+    :param title: title of the result, e.g. Power
+    :param metrics: dictionary with metric name as key
+    """
+    with STORES_LOCK:
+        conn = open_store(results_dir)
+        try:
+            insert_metrics(conn, run_timestamp, phase, title, metrics)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+def import_json(results_dir, conn=None):
+    """Import the JSON files of all runs in bulk, e.g. of runs saved before the store existed.
+    Metrics already in the store are replaced.
+
+    :param results_dir: path to the results folder, with the layout run_*/<phase>/<title>.json
+    :param conn: open connection to the store, None to open it
+    :return: number of files imported
+    """
+    own = conn is None
+    if own:
+        conn = connect(results_dir)
+    count = 0
+    try:
+        for run_timestamp in sorted(os.listdir(results_dir)):
+            run_dir = os.path.join(results_dir, run_timestamp)
+            if not run_timestamp.startswith("run_") or not os.path.isdir(run_dir):
+                continue
+            for phase in sorted(os.listdir(run_dir)):
+                phase_dir = os.path.join(run_dir, phase)
+                if not os.path.isdir(phase_dir):
+                    continue
+                for filename in sorted(os.listdir(phase_dir)):
+                    if filename.endswith(".json"):
+                        with open(os.path.join(phase_dir, filename)) as json_file:
+                            metrics = json.load(json_file)
+                        if isinstance(metrics, dict):  # other files, e.g. captured plans, are no results
+                            insert_metrics(conn, run_timestamp, phase, filename[:-len(".json")], metrics)
+                            count += 1
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+    return count
+
+
+def load_metrics(results_dir, run_timestamp, phases):
+    """Load the numeric metrics of one run
+
+    :param results_dir: path to the results folder
+    :param run_timestamp: name of the run folder
+    :param phases: list of phases (folders) to load, e.g. ["power", "throughput"]
+    :return: dictionary with metric name as key and list of values, times in seconds, as value
+    """
+    with STORES_LOCK:
+        rows = open_store(results_dir).execute("SELECT metric, value FROM metrics WHERE run = ? AND phase IN (%s) "
+                                               "AND value IS NOT NULL" % ", ".join("?" * len(phases)),
+                                               [run_timestamp] + list(phases)).fetchall()
+    metrics = dict()
+    for name, value in rows:
+        metrics.setdefault(name, []).append(value)
+    return metrics
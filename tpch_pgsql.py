@@ -6,7 +6,9 @@ import time
 import argparse
 import getpass
 
-from tpch4pgsql import postgresqldb as pgdb, load, query, prepare as prep, result as r
+from tpch4pgsql import postgresqldb as pgdb, load, query, prepare as prep, result as r, transform as tr, \
+    pgcopy as pc, executor as ex, plan as pl, sweep as sw, openloop as ol, soak as sk, \
+    warehouse as wh, asyncdb, stats
 
 # Constants
 
@@ -21,6 +23,10 @@ DEFAULT_QUERY_ROOT = os.path.join(".", "query_root")
 DEFAULT_DBGEN_DIR = os.path.join(".", "tpch-dbgen")
 DEFAULT_SCALE = 1.0
 DEFAULT_NUM_STREAMS = 0
+DEFAULT_NUM_JOBS = 1
+DEFAULT_COPY_FORMAT = "text"
+DEFAULT_RF1_MODE = "rows"
+DEFAULT_RF2_MODE = "in-list"
 
 # other constants
 LOAD_DIR = "load"
@@ -29,7 +35,12 @@ DELETE_DIR = "delete"
 TEMPLATE_QUERY_DIR = "perf_query_template"
 GENERATED_QUERY_DIR = "perf_query_gen"
 PREP_QUERY_DIR = "prep_query"
+# schema profiles, each a directory with create_tbl.sql and create_idx.sql
+SCHEMA_PROFILES = {"default": PREP_QUERY_DIR, "partitioned": "prep_query_partitioned"}
+DEFAULT_SCHEMA = "default"
 RESULTS_DIR = "results"
+REPEAT_RUN = "%s_%s"  # folders of the runs of --repeat and --warmup, the summary is saved in the run folder
+WARMUP_RUN = "%s_warmup_%s"
 TABLES = ['LINEITEM', 'PARTSUPP', 'ORDERS', 'CUSTOMER', 'SUPPLIER', 'NATION', 'REGION', 'PART']
 # End Constants
 
@@ -76,9 +87,29 @@ def scale_to_num_streams(scale):
     return num_streams
 
 
+def positive_int(value):
+    """Argument type of argparse for counts of at least 1
+
+    :param value: argument as string
+    :return: argument as int
+    """
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("%s is not a positive number" % value)
+    return number
+
+
 def main(phase, host, port, user, password, database,
          dbgen_dir, data_dir, query_root,
-         scale, num_streams, verbose, read_only):
+         scale, num_streams, verbose, read_only, num_jobs=DEFAULT_NUM_JOBS, direct_load=False,
+         compression=None, copy_format=DEFAULT_COPY_FORMAT, index_settings=None, fast_load=None,
+         template=None, schema_profile=DEFAULT_SCHEMA, num_partitions=load.DEFAULT_NUM_PARTITIONS,
+         pooling=False, pool_size=None, session_settings=None, rf1_mode=DEFAULT_RF1_MODE,
+         rf2_mode=DEFAULT_RF2_MODE, batch_size=pgdb.DEFAULT_BATCH_SIZE, executor=ex.DEFAULT_EXECUTOR,
+         fetch=False, itersize=pgdb.DEFAULT_ITERSIZE, query_seed=None, statement_timing=False, explain=None,
+         import_results=False, repeat=1, warmup=0, sweep=None, open_loop=None, arrival=ol.DEFAULT_ARRIVAL,
+         duration=ol.DEFAULT_DURATION, max_in_flight=ol.DEFAULT_MAX_IN_FLIGHT, soak=False,
+         window=sk.DEFAULT_WINDOW):
     # TODO: unify doctsring, some is in reStructuredText, some is Google style
     # TODO: finish sphinx integration
     """Runs main code for three different phases.
@@ -97,9 +128,53 @@ def main(phase, host, port, user, password, database,
     :param num_streams: number of streams
     :param verbose: True is more verbose output is required
     :param read_only: True if no update/delete statements are to be executed during throughput test (query phase)
+    :param num_jobs: number of parallel workers
+    :param direct_load: True if dbgen output is streamed straight into the tables during the load phase,
+    instead of being written to data files by the prepare phase
+    :param compression: None, "gzip" or "zstd" if data files are to be written compressed (prepare phase)
+    :param copy_format: text or binary, format of the COPY used to load the tables (load phase)
+    :param index_settings: session settings for creating indexes, e.g. maintenance_work_mem (load phase)
+    :param fast_load: None, "freeze" for COPY FREEZE into tables created in the same transaction
+    or "unlogged" for loading into unlogged tables, which are switched to logged afterwards (load phase)
+    :param template: name of a template database saved by the load phase, from which the query phase
+    recreates the database before running
+    :param schema_profile: default or partitioned, where ORDERS and LINEITEM are partitioned by date (load phase)
+    :param num_partitions: number of date ranges of the partitioned tables (load phase)
+    :param pooling: True if connections are reused across steps and phases instead of opened for each
+    :param pool_size: maximum number of pooled connections per database, None for no limit
+    :param session_settings: session settings applied to every connection when it is opened
+    :param rf1_mode: rows for one INSERT per row or bulk for COPY into staging tables (refresh function #1)
+    :param rf2_mode: in-list for DELETE ... IN batches, staged for DELETE ... USING a staging table
+    or compare for timing both (refresh function #2)
+    :param batch_size: number of rows sent in one round trip by client side loops, e.g. refresh function #1
+    :param executor: process, thread or asyncio, how the query streams of the throughput test run concurrently;
+    asyncio runs the queries of the power test and all query streams on the async driver asyncpg
+    :param fetch: True if the queries fetch all result rows through server-side cursors (query phase)
+    :param itersize: number of rows fetched per round trip if fetch is True
+    :param query_seed: seed of the query substitution parameters of the power test, stream s uses query_seed + s,
+    None for a time stamp (prepare phase)
+    :param statement_timing: True to time every statement of queries with several statements, e.g. Q15 (query phase)
+    :param explain: None, "power" or "all" to capture the plans of the queries of the power test or of all streams
+    after the performance tests (query phase)
+    :param import_results: True to import the JSON files of all runs in the results folder into the results store
+    :param repeat: number of measured runs of the power and throughput tests, summarized if more than one (query phase)
+    :param warmup: number of runs before the measured runs, which are excluded from the summary (query phase)
+    :param sweep: None or list of stream counts to run only the throughput test with, one after the other,
+    to find where throughput stops scaling (query phase)
+    :param open_loop: None or arrivals per second of an open-loop test of the queries, run instead of the power
+    and throughput tests (query phase)
+    :param arrival: poisson or fixed, distribution of the gaps between the arrivals of the open-loop test
+    :param duration: seconds during which queries arrive in the open-loop test, or the soak test runs
+    :param max_in_flight: maximum number of queries running at once in the open-loop test
+    :param soak: True to run the query streams and refresh pairs over and over for the duration instead of the
+    power and throughput tests, with metrics per window (query phase)
+    :param window: seconds per window of the soak test
     :return: no return value, uses exit(1) if something goes wrong
     """
     run_timestamp = "run_%s" % time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+    pgdb.configure(pooling, session_settings, pool_size, batch_size)
+    if import_results:
+        print("imported %s result files into %s" % (wh.import_json(RESULTS_DIR), wh.DATABASE))
     if phase == "prepare":
         # try to build dbgen from source and quit if failed
         if prep.build_dbgen(dbgen_dir):
@@ -107,56 +182,171 @@ def main(phase, host, port, user, password, database,
             exit(1)
         print("built dbgen from source")
         # try to generate data files
-        if prep.generate_data(dbgen_dir, data_dir,
-                              LOAD_DIR, UPDATE_DIR, DELETE_DIR,
-                              scale, num_streams):
+        if direct_load:
+            # load data is generated during the load phase, only the refresh sets are needed on disk
+            if prep.generate_refresh_data(dbgen_dir, data_dir, UPDATE_DIR, DELETE_DIR,
+                                          scale, num_streams, num_jobs, compression):
+                print("could not generate data files.")
+                exit(1)
+        elif prep.generate_data(dbgen_dir, data_dir,
+                                LOAD_DIR, UPDATE_DIR, DELETE_DIR,
+                                scale, num_streams, num_jobs, compression):
             print("could not generate data files.")
             exit(1)
         print("created data files in %s" % data_dir)
-        if prep.generate_queries(dbgen_dir, query_root, TEMPLATE_QUERY_DIR, GENERATED_QUERY_DIR):
+        if prep.generate_queries(dbgen_dir, query_root, TEMPLATE_QUERY_DIR, GENERATED_QUERY_DIR,
+                                 num_streams, query_seed):
             print("could not generate query files")
             exit(1)
         print("created query files in %s" % query_root)
     elif phase == "load":
+        if direct_load and fast_load == "freeze":
+            print("direct load cannot be combined with COPY FREEZE")
+            exit(1)
+        if schema_profile == "partitioned" and fast_load is not None:
+            print("fast load is not supported for partitioned tables")
+            exit(1)
+        prep_query_dir = SCHEMA_PROFILES[schema_profile]
         result = r.Result("Load")
+        column_types = None
+        if copy_format == "binary":
+            column_types = pc.read_column_types(os.path.join(query_root, prep_query_dir, "create_tbl.sql"))
         if load.clean_database(query_root, host, port, database, user, password, TABLES):
             print("could not clean the database.")
             exit(1)
         print("cleaned database %s" % database)
+        if fast_load != "freeze":
+            # with COPY FREEZE the tables are created by the transactions loading them
+            result.startTimer()
+            if load.create_schema(query_root, host, port, database, user, password, prep_query_dir,
+                                  fast_load == "unlogged", num_partitions):
+                print("could not create schema.")
+                exit(1)
+            result.setMetric("create_schema: ", result.stopTimer())
+            print("done creating schemas")
         result.startTimer()
-        if load.create_schema(query_root, host, port, database, user, password, PREP_QUERY_DIR):
-            print("could not create schema.")
-            exit(1)
-        result.setMetric("create_schema: ", result.stopTimer())
-        print("done creating schemas")
-        result.startTimer()
-        if load.load_tables(data_dir, host, port, database, user, password, TABLES, LOAD_DIR):
+        if fast_load == "freeze":
+            if load.load_tables_freeze(query_root, data_dir, host, port, database, user, password, TABLES, LOAD_DIR,
+                                       prep_query_dir, result, num_jobs, column_types):
+                print("could not load data to tables")
+                exit(1)
+        elif direct_load:
+            if load.load_tables_direct(dbgen_dir, host, port, database, user, password, TABLES, scale, num_jobs,
+                                       column_types):
+                print("could not load data to tables")
+                exit(1)
+        elif load.load_tables(data_dir, host, port, database, user, password, TABLES, LOAD_DIR, result, num_jobs,
+                              column_types):
             print("could not load data to tables")
             exit(1)
         result.setMetric("load_data", result.stopTimer())
         print("done loading data to tables")
+        if fast_load == "unlogged":
+            result.startTimer()
+            if load.set_logged(host, port, database, user, password, TABLES, num_jobs):
+                print("could not switch tables to logged")
+                exit(1)
+            result.setMetric("set_logged", result.stopTimer())
+            print("done switching tables to logged")
         result.startTimer()
-        if load.index_tables(query_root, host, port, database, user, password, PREP_QUERY_DIR):
+        if load.index_tables(query_root, host, port, database, user, password, prep_query_dir, result, num_jobs,
+                             index_settings):
             print("could not create indexes for tables")
             exit(1)
         result.setMetric("index_tables", result.stopTimer())
         print("done creating indexes and foreign keys")
+        if fast_load is not None:
+            result.startTimer()
+            if load.vacuum_analyze(host, port, database, user, password, TABLES, num_jobs, result):
+                print("could not vacuum and analyze tables")
+                exit(1)
+            result.setMetric("vacuum_analyze", result.stopTimer())
+            print("done vacuuming and analyzing tables")
+        if template is not None:
+            result.startTimer()
+            if load.save_template(host, port, database, user, password, template):
+                print("could not save the database as template")
+                exit(1)
+            result.setMetric("save_template", result.stopTimer())
+            print("saved database %s as template %s" % (database, template))
+        if pooling:
+            for name, value in pgdb.pool_metrics().items():
+                result.setMetric(name, value)
         result.printMetrics()
         result.saveMetrics(RESULTS_DIR, run_timestamp, "load")
+    elif phase == "query" and sweep is not None:
+        if len(sweep) > 1 and not read_only and template is None:
+            print("a sweep requires --read-only or --template, the refresh functions change the database")
+            exit(1)
+        if sw.run_sweep(query_root, data_dir, UPDATE_DIR, DELETE_DIR, GENERATED_QUERY_DIR, RESULTS_DIR,
+                        host, port, database, user, password, run_timestamp, sweep, scale, verbose, read_only,
+                        rf1_mode, rf2_mode, executor, itersize if fetch else None, statement_timing, template):
+            print("running the scaling sweep failed")
+            exit(1)
+    elif phase == "query" and open_loop is not None:
+        if ol.run_open_loop(query_root, GENERATED_QUERY_DIR, RESULTS_DIR, host, port, database, user, password,
+                            run_timestamp, num_streams, verbose, open_loop, duration, arrival, max_in_flight,
+                            itersize if fetch else None, query_seed):
+            print("running the open-loop test failed")
+            exit(1)
+    elif phase == "query" and soak:
+        if sk.run_soak(query_root, data_dir, UPDATE_DIR, GENERATED_QUERY_DIR, RESULTS_DIR, host, port, database,
+                       user, password, run_timestamp, num_streams, verbose, read_only, duration, window, rf1_mode,
+                       itersize if fetch else None):
+            print("running the soak test failed")
+            exit(1)
     elif phase == "query":
-        if query.run_power_test(query_root, data_dir, UPDATE_DIR, DELETE_DIR, GENERATED_QUERY_DIR, RESULTS_DIR,
-                                host, port, database, user, password,
-                                run_timestamp, num_streams, verbose, read_only):
-            print("running power tests failed")
+        if repeat + warmup > 1 and not read_only and template is None:
+            print("repeated runs require --read-only or --template, the refresh functions change the database")
             exit(1)
-        # Throughput tests
-        if query.run_throughput_test(query_root, data_dir, UPDATE_DIR, DELETE_DIR, GENERATED_QUERY_DIR, RESULTS_DIR,
-                                     host, port, database, user, password,
-                                     run_timestamp, num_streams, verbose, read_only):
-            print("running throughput tests failed")
+        if query.check_query_sets(query_root, GENERATED_QUERY_DIR, num_streams):
             exit(1)
+        if repeat + warmup == 1:
+            runs = [run_timestamp]
+        else:
+            runs = [WARMUP_RUN % (run_timestamp, i) for i in range(1, warmup + 1)] + \
+                   [REPEAT_RUN % (run_timestamp, i) for i in range(1, repeat + 1)]
+        for run in runs:
+            if len(runs) > 1:
+                print("starting run %s" % run)
+            if template is not None:
+                result = r.Result("Reset")
+                result.startTimer()
+                if load.reset_database(host, port, database, user, password, template):
+                    print("could not reset the database from template %s" % template)
+                    exit(1)
+                result.setMetric("reset_database", result.stopTimer())
+                result.printMetrics()
+                result.saveMetrics(RESULTS_DIR, run, "reset")
+            if query.run_power_test(query_root, data_dir, UPDATE_DIR, DELETE_DIR, GENERATED_QUERY_DIR, RESULTS_DIR,
+                                    host, port, database, user, password,
+                                    run, num_streams, verbose, read_only, rf1_mode, rf2_mode, executor,
+                                    itersize if fetch else None, statement_timing):
+                print("running power tests failed")
+                exit(1)
+            # Throughput tests
+            if query.run_throughput_test(query_root, data_dir, UPDATE_DIR, DELETE_DIR, GENERATED_QUERY_DIR,
+                                         RESULTS_DIR, host, port, database, user, password,
+                                         run, num_streams, verbose, read_only, rf1_mode, rf2_mode,
+                                         executor, itersize if fetch else None, statement_timing):
+                print("running throughput tests failed")
+                exit(1)
+            query.calc_metrics(RESULTS_DIR, run, scale, num_streams)
         print("done performance tests")
-        query.calc_metrics(RESULTS_DIR, run_timestamp, scale, num_streams)
+        if explain is not None:
+            streams = [0] if explain == "power" else range(num_streams + 1)
+            if pl.run_explain(query_root, GENERATED_QUERY_DIR, RESULTS_DIR, host, port, database, user, password,
+                              runs[-1], streams, verbose):
+                print("capturing query plans failed")
+                exit(1)
+        if pooling:
+            result = r.Result("Connections")
+            for name, value in pgdb.pool_metrics().items():
+                result.setMetric(name, value)
+            result.saveMetrics(RESULTS_DIR, runs[-1], "connections")
+        if repeat > 1:
+            query.summarize_runs(RESULTS_DIR, run_timestamp, runs[warmup:])
+    pgdb.close_pools()
 
 
 if __name__ == "__main__":
@@ -190,6 +380,106 @@ if __name__ == "__main__":
     parser.add_argument("-r", "--read-only", action="store_true",
                         help="Do not execute refresh functions during the query phase, " +
                              "which allows for running it repeatedly")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_NUM_JOBS,
+                        help="Number of parallel workers, e.g. for data generation and loading; default is %s" % DEFAULT_NUM_JOBS +
+                             ", 0 means one per CPU core")
+    parser.add_argument("--direct-load", action="store_true",
+                        help="Stream the output of dbgen through named pipes straight into the tables " +
+                             "during the load phase; prepare then generates only the refresh data")
+    parser.add_argument("--compress", choices=["none"] + sorted(tr.COMPRESSIONS), default="none",
+                        help="Compression of the data files written by the prepare phase; default is none. " +
+                             "The other phases detect compressed files automatically")
+    parser.add_argument("--copy-format", choices=["text", "binary"], default=DEFAULT_COPY_FORMAT,
+                        help="Format of the COPY used to load the tables; default is %s. " % DEFAULT_COPY_FORMAT +
+                             "Binary data is encoded on the client according to the types in create_tbl.sql")
+    parser.add_argument("--maintenance-work-mem",
+                        help="Session setting maintenance_work_mem for creating indexes, e.g. 1GB; " +
+                             "default is the server setting")
+    parser.add_argument("--max-parallel-maintenance-workers", type=int,
+                        help="Session setting max_parallel_maintenance_workers for creating indexes " +
+                             "(PostgreSQL 11+); default is the server setting")
+    parser.add_argument("--fast-load", choices=["freeze", "unlogged"],
+                        help="Load without the usual write overhead: freeze creates each table in the transaction " +
+                             "loading it with COPY FREEZE, unlogged loads into UNLOGGED tables and switches them " +
+                             "to LOGGED afterwards (PostgreSQL 9.5+); both run VACUUM (FREEZE, ANALYZE) at the end")
+    parser.add_argument("--template",
+                        help="Name of a template database: the load phase saves the loaded database as this " +
+                             "template, the query phase recreates the database from it before running, " +
+                             "undoing the refresh functions of earlier runs")
+    parser.add_argument("--schema", choices=sorted(SCHEMA_PROFILES), default=DEFAULT_SCHEMA,
+                        help="Schema profile of the load phase; default is %s. " % DEFAULT_SCHEMA +
+                             "partitioned partitions ORDERS by O_ORDERDATE and LINEITEM by L_SHIPDATE (PostgreSQL 11+)")
+    parser.add_argument("--partitions", type=int, default=load.DEFAULT_NUM_PARTITIONS,
+                        help="Number of date ranges of the partitioned tables; default is %s" %
+                             load.DEFAULT_NUM_PARTITIONS + ", i.e. one per year")
+    parser.add_argument("--pool", action="store_true",
+                        help="Reuse pooled connections across steps instead of opening a new connection for each")
+    parser.add_argument("--pool-size", type=int,
+                        help="Maximum number of pooled connections per database; default is no limit")
+    parser.add_argument("--session-setting", action="append", default=[], metavar="NAME=VALUE",
+                        help="Session setting applied to every connection when it is opened, e.g. work_mem=64MB; " +
+                             "can be given several times")
+    parser.add_argument("--rf1", choices=["rows", "bulk"], default=DEFAULT_RF1_MODE,
+                        help="Mode of refresh function #1; default is %s, one INSERT per row. " % DEFAULT_RF1_MODE +
+                             "bulk copies the new rows into temporary staging tables and inserts them set based")
+    parser.add_argument("--rf2", choices=["in-list", "staged", "compare"], default=DEFAULT_RF2_MODE,
+                        help="Mode of refresh function #2; default is %s, DELETE ... IN with an " % DEFAULT_RF2_MODE +
+                             "adaptive batch size. staged copies the keys into a temporary table joined by " +
+                             "DELETE ... USING. compare times both, rolling back the staged variant")
+    parser.add_argument("--batch-size", type=positive_int, default=pgdb.DEFAULT_BATCH_SIZE,
+                        help="Number of rows sent in one round trip by the row by row refresh function #1; " +
+                             "default is %s, 1 sends one INSERT per row" % pgdb.DEFAULT_BATCH_SIZE)
+    parser.add_argument("--executor", choices=ex.EXECUTORS, default=ex.DEFAULT_EXECUTOR,
+                        help="How the query streams of the throughput test run concurrently; default is " +
+                             "%s, one process per stream. thread runs one thread per stream, " % ex.DEFAULT_EXECUTOR +
+                             "asyncio one task per stream in an event loop, using the asyncpg driver, also " +
+                             "for the queries of the power test")
+    parser.add_argument("--fetch", action="store_true",
+                        help="Fetch all result rows of the queries through server-side cursors, recording rows, " +
+                             "bytes, time to first row and fetch time per query")
+    parser.add_argument("--itersize", type=int, default=pgdb.DEFAULT_ITERSIZE,
+                        help="Number of rows fetched per round trip with --fetch; default is %s" %
+                             pgdb.DEFAULT_ITERSIZE)
+    parser.add_argument("--query-seed", type=int,
+                        help="Seed of the query substitution parameters generated by the prepare phase; stream " +
+                             "s uses the seed plus s. Default is the current time stamp, as mmddhhmmss")
+    parser.add_argument("--statement-timing", action="store_true",
+                        help="Time every statement of queries with several statements, e.g. the view created " +
+                             "and dropped around Q15")
+    parser.add_argument("--explain", choices=["power", "all"],
+                        help="After the performance tests, capture the plans of the queries of the power test " +
+                             "or of all streams with EXPLAIN (ANALYZE, BUFFERS) and report plans that changed " +
+                             "since the last run that captured them")
+    parser.add_argument("--import-results", action="store_true",
+                        help="Import the JSON files of all runs in the results folder into the results store " +
+                             "%s first, e.g. after copying runs from another machine" % wh.DATABASE)
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Number of measured runs of the power and throughput tests during the query phase; " +
+                             "default is 1. More runs are summarized with median, p95, standard deviation and " +
+                             "bootstrap confidence intervals; requires --read-only or --template")
+    parser.add_argument("--warmup", type=int, default=0,
+                        help="Number of runs before the measured runs, excluded from the summary; default is 0")
+    parser.add_argument("--sweep", metavar="STREAMS",
+                        help="Run only the throughput test for each of the stream counts, e.g. 1-8,12,16, " +
+                             "and save the scaling curve with its knee; requires --read-only or --template")
+    parser.add_argument("--open-loop", type=float, metavar="RATE",
+                        help="Instead of the power and throughput tests, send the queries of all streams at " +
+                             "RATE queries per second, however fast they finish, and record their latencies")
+    parser.add_argument("--arrival", choices=ol.ARRIVALS, default=ol.DEFAULT_ARRIVAL,
+                        help="Distribution of the gaps between arrivals of --open-loop; default is %s"
+                             % ol.DEFAULT_ARRIVAL)
+    parser.add_argument("--duration", type=int, default=ol.DEFAULT_DURATION,
+                        help="Seconds during which queries arrive with --open-loop, or the soak test runs " +
+                             "with --soak; default is %s" % ol.DEFAULT_DURATION)
+    parser.add_argument("--max-in-flight", type=int, default=ol.DEFAULT_MAX_IN_FLIGHT,
+                        help="Maximum number of queries running at once with --open-loop, further arrivals " +
+                             "wait; default is %s" % ol.DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument("--soak", action="store_true",
+                        help="Instead of the power and throughput tests, run the query streams and refresh pairs " +
+                             "over and over for --duration seconds, summarizing throughput and latency per " +
+                             "window, with steady state and drift")
+    parser.add_argument("--window", type=int, default=sk.DEFAULT_WINDOW,
+                        help="Seconds per window of --soak; default is %s" % sk.DEFAULT_WINDOW)
     args = parser.parse_args()
 
     # Extract all arguments into variables
@@ -206,10 +496,83 @@ if __name__ == "__main__":
     password = args.password
     verbose = args.verbose
     read_only = args.read_only
+    num_jobs = args.jobs
+    direct_load = args.direct_load
+    compression = None if args.compress == "none" else args.compress
+    if compression == "zstd":
+        try:
+            tr.import_zstandard()
+        except IOError as e:
+            parser.error(str(e))
+    copy_format = args.copy_format
+    index_settings = dict()
+    if args.maintenance_work_mem is not None:
+        index_settings["maintenance_work_mem"] = args.maintenance_work_mem
+    if args.max_parallel_maintenance_workers is not None:
+        index_settings["max_parallel_maintenance_workers"] = args.max_parallel_maintenance_workers
+    fast_load = args.fast_load
+    template = args.template
+    if template is not None and template == database:
+        parser.error("--template must differ from the database name %s, which is dropped when copying" % database)
+    schema_profile = args.schema
+    num_partitions = args.partitions
+    pooling = args.pool
+    rf1_mode = args.rf1
+    rf2_mode = args.rf2
+    batch_size = args.batch_size
+    executor = args.executor
+    if executor == "asyncio":
+        try:
+            asyncdb.import_driver()
+        except IOError as e:
+            parser.error(str(e))
+    fetch = args.fetch
+    itersize = args.itersize
+    query_seed = args.query_seed
+    statement_timing = args.statement_timing
+    explain = args.explain
+    import_results = args.import_results
+    repeat = args.repeat
+    warmup = args.warmup
+    if repeat < 1 or warmup < 0:
+        parser.error("--repeat must be at least 1 and --warmup at least 0")
+    if repeat > 1 and stats.numpy is None:
+        print("NumPy is not installed, the statistics of the runs are calculated in pure Python, "
+              "which is slower (pip3 install numpy)")
+    open_loop = args.open_loop
+    arrival = args.arrival
+    duration = args.duration
+    max_in_flight = args.max_in_flight
+    if open_loop is not None and (open_loop <= 0 or duration < 1 or max_in_flight < 1):
+        parser.error("--open-loop, --duration and --max-in-flight must be positive")
+    soak = args.soak
+    window = args.window
+    if soak and not 1 <= window <= duration:
+        parser.error("--window must be at least 1 and at most --duration")
+    sweep = None
+    if args.sweep is not None:
+        try:
+            sweep = sw.parse_stream_counts(args.sweep)
+        except ValueError:
+            parser.error("--sweep expects stream counts like 1-8,12,16, not %s" % args.sweep)
+    pool_size = args.pool_size
+    session_settings = dict()
+    for setting in args.session_setting:
+        name, sep, value = setting.partition("=")
+        if not sep:
+            parser.error("session setting %s is not of the form NAME=VALUE" % setting)
+        session_settings[name.strip()] = value.strip()
 
     # if no num_streams was provided, then calculate default based on scale factor
     if num_streams == 0:
         num_streams = scale_to_num_streams(scale)
+    # if no num_jobs was provided, then use one worker per CPU core
+    if num_jobs == 0:
+        num_jobs = os.cpu_count()
 
     # main
-    main(phase, host, port, user, password, database, dbgen_dir, data_dir, query_root, scale, num_streams, verbose, read_only)
+    main(phase, host, port, user, password, database, dbgen_dir, data_dir, query_root, scale, num_streams, verbose, read_only,
+         num_jobs, direct_load, compression, copy_format, index_settings, fast_load,
+         template, schema_profile, num_partitions, pooling, pool_size, session_settings,
+         rf1_mode, rf2_mode, batch_size, executor, fetch, itersize, query_seed, statement_timing, explain,
+         import_results, repeat, warmup, sweep, open_loop, arrival, duration, max_in_flight, soak, window)